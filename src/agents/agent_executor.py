@@ -0,0 +1,128 @@
+import logging
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain.agents import AgentExecutor
+from langchain.agents.agent import RunnableMultiActionAgent
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of characters of each tool result quoted in the answer of a stopped agent
+_MAX_OBSERVATION_CHARS = 2000
+
+
+class _StoppableAgent(RunnableMultiActionAgent):
+    """
+    A tools agent answering with the tool results gathered so far when it is stopped early.
+    """
+
+    def return_stopped_response(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        **kwargs: Any,
+    ) -> AgentFinish:
+        if early_stopping_method != "partial":
+            return super().return_stopped_response(early_stopping_method, intermediate_steps, **kwargs)
+        logger.warning(f"Agent stopped early after {len(intermediate_steps)} tool call(s)")
+        results = [
+            f"- {action.tool} {action.tool_input}: {str(observation)[:_MAX_OBSERVATION_CHARS]}"
+            for action, observation in intermediate_steps
+        ]
+        output = "The analysis was stopped before completion (iteration or time limit)."
+        if results:
+            output += " Tool results gathered so far:\n" + "\n".join(results)
+        return AgentFinish({"output": output, "stopped": True}, "")
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    An agent executor running the tool calls of a model turn concurrently.
+
+    AgentExecutor already gathers the tool calls of a turn in async runs, but runs them one after another in sync
+    runs. Here, sync runs dispatch them to a thread pool, so that a turn with several searches costs the latency
+    of the slowest one rather than their sum.
+
+    AgentExecutor has no public extension point for this, so this relies on its private methods, as of the
+    langchain version pinned in pyproject.toml: `_iter_next_step` yields the return value of
+    `_perform_agent_action` for each action of a turn, after yielding all the actions, and its callers take
+    the AgentStep outputs as the observations of the turn.
+    """
+
+    max_tool_concurrency: int = 8
+    """The maximum number of tool calls of a turn running at once in sync runs."""
+
+    def _perform_agent_action(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        agent_action: AgentAction,
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> partial:
+        # Deferred, so that _iter_next_step runs the actions of a turn together
+        return partial(
+            super()._perform_agent_action, name_to_tool_map, color_mapping, agent_action, run_manager
+        )
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        actions = []
+        for output in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(output, partial):
+                actions.append(output)
+            else:
+                yield output
+        if len(actions) == 1:
+            yield actions[0]()
+        elif actions:
+            logger.debug(f"Running {len(actions)} tool calls concurrently")
+            with ContextThreadPoolExecutor(max_workers=min(len(actions), self.max_tool_concurrency)) as executor:
+                # Steps are returned in the order of the tool calls
+                yield from executor.map(lambda action: action(), actions)
+
+
+def create_agent_executor(
+    agent: Runnable,
+    tools: Sequence[BaseTool],
+    max_iterations: int | None = 8,
+    max_execution_time: float | None = 120.0,
+) -> ConcurrentAgentExecutor:
+    """
+    Creates the executor of a tools agent, with bounded iterations and wall time.
+
+    When a bound is reached, the agent answers with the tool results gathered so far, and the output of the run
+    has "stopped" set to True. Async runs are interrupted at the time limit, while sync runs check it between turns.
+
+    Args:
+        agent (Runnable): The agent, e.g. created by `create_openai_tools_agent`.
+        tools (Sequence[BaseTool]): The tools of the agent.
+        max_iterations (int | None, optional): The maximum number of model turns, or None for no limit.
+            Defaults to 8.
+        max_execution_time (float | None, optional): The maximum number of seconds of a run, or None for no limit.
+            Defaults to 120.
+
+    Returns:
+        ConcurrentAgentExecutor: The agent executor.
+    """
+    return ConcurrentAgentExecutor(
+        # The executor would wrap the agent the same way, with the default stopped response
+        agent=_StoppableAgent(runnable=agent, stream_runnable=True),
+        tools=tools,
+        return_intermediate_steps=True,
+        max_iterations=max_iterations,
+        max_execution_time=max_execution_time,
+        early_stopping_method="partial",
+    )
@@ -0,0 +1,338 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Any, AsyncIterator
+
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, Graph, StateGraph
+
+from src.agents.agent_state import AgentState
+from src.agents.context_assembler import ContextAssembler
+from src.agents.earnings_call_agent import EarningsCallAgent
+from src.agents.earnings_call_store import EarningsCallStore
+from src.agents.expenditure_store import ExpenditureStore
+from src.agents.instrumentation import Tracer, TracingCallbackHandler
+from src.agents.insurance_analysis_agent import InsuranceAnalysisAgent
+from src.agents.model_routing import ModelConfig
+from src.agents.node_cache import NodeCache, SqliteCheckpointer
+from src.agents.openai_scheduler import OpenAIScheduler
+from src.agents.risk_assessment_agent import RiskAssessmenttAgent
+from src.agents.singleflight import SingleFlight, coalesce_node
+from src.agents.step_logging import StepLogger
+from src.agents.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# The node whose LLM tokens are streamed to the caller: the final report
+REPORT_NODE = "earnings_call_agent"
+
+# Logs the state updates of the steps, sampled under load
+_step_logger = StepLogger(logger)
+
+
+def create_agent_graph(
+    vector_store: VectorStore,
+    earnings_call_store: EarningsCallStore,
+    expenditure_store: ExpenditureStore | None = None,
+    tracer: Tracer | None = None,
+    llm: BaseChatModel | None = None,
+    context_assembler: ContextAssembler | None = None,
+    checkpointer: SqliteCheckpointer | None = None,
+    node_cache: NodeCache | None = None,
+    llm_caches: dict[str, BaseCache] | None = None,
+    max_agent_iterations: int | None = 8,
+    max_agent_time: float | None = 120.0,
+    model_configs: dict[str, ModelConfig] | None = None,
+    scheduler: OpenAIScheduler | None = None,
+    coalesce: bool = True,
+) -> Graph:
+    """
+    Creates a graph of agents for insurance data analysis.
+
+    Args:
+        vector_store (VectorStore): The vector store used by the agents.
+        earnings_call_store (EarningsCallStore): The store of previous earnings calls used by the agents.
+        expenditure_store (ExpenditureStore | None, optional): The store of yearly average expenditures. Defaults to None.
+        tracer (Tracer | None, optional): A tracer recording the nodes, LLM calls and tool calls of every run.
+            Defaults to None.
+        llm (BaseChatModel | None, optional): The language model of all agents, e.g. a fake for benchmarks.
+            Defaults to each agent's OpenAI chat model.
+        context_assembler (ContextAssembler | None, optional): Fits the upstream reports to token budgets
+            before the earnings call report. Defaults to the earnings call agent's.
+        checkpointer (SqliteCheckpointer | None, optional): Saves the state after each step, so that an interrupted
+            run can be resumed (see `prepare_run`). Runs then need a thread ID in their config. Defaults to None.
+        node_cache (NodeCache | None, optional): Memoises the outputs of the upstream agents by a hash of their inputs,
+            so that they are reused across runs of the same query. Defaults to None.
+        llm_caches (dict[str, BaseCache] | None, optional): The caches of the model responses, by node name.
+            Only the upstream agents, which sample at temperature 0, should have one. Defaults to None.
+        max_agent_iterations (int | None, optional): The maximum number of model turns of each tools agent,
+            or None for no limit. Defaults to 8.
+        max_agent_time (float | None, optional): The maximum number of seconds of each tools agent run,
+            or None for no limit. Defaults to 120.
+        model_configs (dict[str, ModelConfig] | None, optional): The model of each agent, by node name, unless `llm`
+            is given. Defaults to OpenAI's default chat model for every agent.
+        scheduler (OpenAIScheduler | None, optional): The scheduler of the OpenAI requests of the agents' models,
+            unless `llm` is given. Defaults to the process-wide scheduler.
+        coalesce (bool, optional): Whether concurrent runs of the upstream agents for the same query share a single
+            run. Defaults to True.
+
+    Returns:
+        Graph: The compiled graph of agents.
+    """
+    llm_caches = llm_caches or {}
+    model_configs = model_configs or {}
+    limits = {"max_iterations": max_agent_iterations, "max_execution_time": max_agent_time}
+    analysis_agent = InsuranceAnalysisAgent(
+        vector_store,
+        expenditure_store,
+        llm=llm,
+        cache=llm_caches.get("insurance_agent"),
+        model_config=model_configs.get("insurance_agent"),
+        scheduler=scheduler,
+        **limits,
+    )
+    risk_assessment_agent = RiskAssessmenttAgent(
+        llm=llm,
+        cache=llm_caches.get("risk_assessment_agent"),
+        model_config=model_configs.get("risk_assessment_agent"),
+        scheduler=scheduler,
+    )
+    earnings_call_agent = EarningsCallAgent(
+        earnings_call_store,
+        llm=llm,
+        context_assembler=context_assembler,
+        model_config=model_configs.get(REPORT_NODE),
+        scheduler=scheduler,
+        **limits,
+    )
+
+    graph = StateGraph(AgentState)
+
+    # Each node has a sync and an async implementation, used by stream and astream respectively
+    insurance_run, insurance_arun = analysis_agent.run, analysis_agent.arun
+    risk_assessment_run, risk_assessment_arun = risk_assessment_agent.run, risk_assessment_agent.arun
+    if coalesce:
+        # The final report is streamed to the caller of each run, so only the upstream agents are coalesced
+        insurance_run, insurance_arun = coalesce_node(
+            SingleFlight("insurance_agent", tracer), insurance_run, insurance_arun
+        )
+        risk_assessment_run, risk_assessment_arun = coalesce_node(
+            SingleFlight("risk_assessment_agent", tracer), risk_assessment_run, risk_assessment_arun
+        )
+    if node_cache:
+        # The final report is sampled, so only the upstream agents are memoised
+        insurance_node = node_cache.wrap(
+            "insurance_agent",
+            insurance_run,
+            insurance_arun,
+            inputs=("query",),
+            fingerprint=NodeCache.fingerprint(analysis_agent.agent),
+        )
+        risk_assessment_node = node_cache.wrap(
+            "risk_assessment_agent",
+            risk_assessment_run,
+            risk_assessment_arun,
+            inputs=("query",),
+            fingerprint=NodeCache.fingerprint(
+                risk_assessment_agent.prompt_template, risk_assessment_agent.llm
+            ),
+        )
+    else:
+        insurance_node = RunnableLambda(insurance_run, afunc=insurance_arun)
+        risk_assessment_node = RunnableLambda(risk_assessment_run, afunc=risk_assessment_arun)
+    graph.add_node("insurance_agent", insurance_node)
+    graph.add_node("risk_assessment_agent", risk_assessment_node)
+    graph.add_node(
+        "earnings_call_agent",
+        RunnableLambda(earnings_call_agent.run, afunc=earnings_call_agent.arun),
+    )
+
+    graph.add_edge(START, "insurance_agent")
+    graph.add_edge(START, "risk_assessment_agent")
+    graph.add_edge("insurance_agent", "earnings_call_agent")
+    graph.add_edge("risk_assessment_agent", "earnings_call_agent")
+    graph.add_edge("earnings_call_agent", END)
+
+    compiled = graph.compile(checkpointer=checkpointer)
+    if tracer:
+        compiled = compiled.with_config(callbacks=[TracingCallbackHandler(tracer)])
+    return compiled
+
+
+def create_initial_state(query: str) -> AgentState:
+    """
+    Creates the initial state of the graph for a query.
+
+    Args:
+        query (str): The analysis query.
+
+    Returns:
+        AgentState: The initial state.
+    """
+    return AgentState(
+        query=query,
+        market_analysis="",
+        risk_assessment="",
+        earnings_call_report="",
+        history=[],
+    )
+
+
+def prepare_run(graph: Graph, query: str) -> tuple[AgentState | None, RunnableConfig | None]:
+    """
+    Creates the input and config of a run of the graph for a query.
+
+    If the graph has a checkpointer, runs of a query are saved in threads numbered from a hash of the query, and the
+    checkpointer records the latest run of each query. An interrupted latest run (e.g. after a failure of the last
+    agent) is resumed from its last completed step, and otherwise a new run starts a new thread.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        query (str): The analysis query.
+
+    Returns:
+        tuple[AgentState | None, RunnableConfig | None]: The input of the run (None to resume a run) and its config
+            (None without checkpointer).
+    """
+    if getattr(graph, "checkpointer", None) is None:
+        return create_initial_state(query), None
+    query_hash = hashlib.sha256(query.encode()).hexdigest()[:16]
+    run = graph.checkpointer.latest_run(query_hash)
+    if run is not None:
+        config: RunnableConfig = {"configurable": {"thread_id": f"{query_hash}-{run}"}}
+        snapshot = graph.get_state(config)
+        if snapshot.next:
+            logger.info(f"Resuming run {run} of the query at {', '.join(snapshot.next)}")
+            return None, config
+        if not snapshot.values:
+            # The latest run stopped before its first checkpoint
+            return create_initial_state(query), config
+    run = 0 if run is None else run + 1
+    graph.checkpointer.set_latest_run(query_hash, run)
+    return create_initial_state(query), {"configurable": {"thread_id": f"{query_hash}-{run}"}}
+
+
+def run_graph(
+    graph: Graph, initial_state: AgentState | None, config: RunnableConfig | None = None
+) -> dict:
+    """
+    Runs the graph synchronously, logging the state updates of each step.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        initial_state (AgentState | None): The initial state, or None to resume a checkpointed run.
+        config (RunnableConfig | None, optional): The config of the run, e.g. with the thread ID of a checkpointed run
+            (see `prepare_run`). Defaults to None.
+
+    Returns:
+        dict: The output of the last step.
+    """
+    for idx, state in enumerate(graph.stream(initial_state, config)):
+        _step_logger.log(idx, state)
+    return state
+
+
+async def arun_graph(
+    graph: Graph, initial_state: AgentState | None, config: RunnableConfig | None = None
+) -> dict:
+    """
+    Runs the graph asynchronously, logging the state updates of each step.
+
+    Parallel nodes run concurrently on the event loop, instead of on a thread each.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        initial_state (AgentState | None): The initial state, or None to resume a checkpointed run.
+        config (RunnableConfig | None, optional): The config of the run, e.g. with the thread ID of a checkpointed run
+            (see `prepare_run`). Defaults to None.
+
+    Returns:
+        dict: The output of the last step.
+    """
+    idx = 0
+    async for state in graph.astream(initial_state, config):
+        _step_logger.log(idx, state)
+        idx += 1
+    return state
+
+
+async def astream_query(graph: Graph, query: str) -> AsyncIterator[dict[str, Any]]:
+    """
+    Runs a query through the graph, yielding progress events and the tokens of the final report as they are generated.
+
+    If the graph has a checkpointer, an interrupted run of the query is resumed (see `prepare_run`).
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        query (str): The analysis query.
+
+    Yields:
+        dict[str, Any]: The events, with the time elapsed since the start of the query in seconds:
+            - {"event": "node", "node": ...} when a node completes,
+            - {"event": "token", "text": ...} for each token of the final report,
+            - {"event": "result", "state": ...} with the final state, last.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    state = None
+    step = 0
+    initial_state, config = prepare_run(graph, query)
+    async for mode, chunk in graph.astream(
+        initial_state, config, stream_mode=["updates", "messages", "values"]
+    ):
+        elapsed = round(time.perf_counter() - start, 3)
+        if mode == "values":
+            state = chunk
+        elif mode == "updates":
+            _step_logger.log(step, chunk)
+            step += 1
+            for node in chunk:
+                yield {"event": "node", "node": node, "elapsed": elapsed}
+        else:
+            message, metadata = chunk
+            # Tool call chunks of the agent have no text content
+            if (
+                metadata.get("langgraph_node") == REPORT_NODE
+                and isinstance(message, AIMessageChunk)
+                and isinstance(message.content, str)
+                and message.content
+            ):
+                if first_token_at is None:
+                    first_token_at = elapsed
+                    logger.info(f"First report token after {elapsed:.2f}s")
+                yield {"event": "token", "text": message.content, "elapsed": elapsed}
+    yield {
+        "event": "result",
+        "state": state,
+        "elapsed": round(time.perf_counter() - start, 3),
+        "first_token": first_token_at,
+    }
+
+
+def render_graph(graph: Graph, output_path: str):
+    """
+    Renders the graph to a PNG file, unless the file already shows the same topology.
+
+    Rendering the PNG calls a remote service, so the result is cached: a hash of the graph's Mermaid description
+    is stored next to the PNG file, and rendering is skipped while the hash is unchanged.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        output_path (str): The path to the PNG file.
+    """
+    drawable = graph.get_graph()
+    topology_hash = hashlib.sha256(drawable.draw_mermaid().encode()).hexdigest()
+    hash_path = f"{output_path}.sha256"
+    if os.path.exists(output_path) and os.path.exists(hash_path):
+        with open(hash_path, encoding="utf-8") as f:
+            if f.read().strip() == topology_hash:
+                logger.info(f"Graph chart at {output_path} is up to date")
+                return
+    logger.info(f"Rendering graph chart to {output_path}")
+    drawable.draw_mermaid_png(output_file_path=output_path)
+    with open(hash_path, "w", encoding="utf-8") as f:
+        f.write(topology_hash)
@@ -13,14 +13,26 @@ class AgentState(TypedDict):
         - market_analysis: The market analysis report.
         - risk_assessment: The risk assessment report.
         - earnings_call_report: The earnings call report.
-        - history: A list of previous states.
+        - history: The names of the agents that ran, in order.
 
-    Note: The use of Annotated with operator.add is as documented here:
+    Nodes return partial updates with the fields they write. Each text field is written by a single node, and is
+    replaced by its update. The history is append-only: the names returned by the nodes, including the parallel ones,
+    are appended to it, as documented here:
     https://langchain-ai.github.io/langgraph/how-tos/branching/#parallel-node-fan-out-and-fan-in
     """
 
-    query: Annotated[str, operator.add]
-    market_analysis: Annotated[str, operator.add]
-    risk_assessment: Annotated[str, operator.add]
-    earnings_call_report: Annotated[str, operator.add]
+    query: str
+    market_analysis: str
+    risk_assessment: str
+    earnings_call_report: str
     history: Annotated[list[str], operator.add]
+
+
+class IncompleteUpdate(dict):
+    """
+    A state update of a node that could not complete its work, e.g. the partial answer of an agent stopped at its
+    iteration or time limit.
+
+    It is applied to the state like any other update, but the node cache does not reuse it for later runs.
+    """
+
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import TextIO
+
+from langgraph.graph import Graph
+
+from src.agents.agent_graph import create_initial_state
+from src.agents.agent_state import AgentState
+from src.agents.instrumentation import Tracer
+from src.agents.singleflight import SingleFlight, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def read_queries(path: str) -> list[dict]:
+    """
+    Reads the queries of a batch from a file.
+
+    Each non-empty line is either a plain-text query, or a JSON object with a "query" key and optionally an "id" key.
+
+    Args:
+        path (str): The path to the file, or "-" to read from stdin.
+
+    Returns:
+        list[dict]: The queries, as dicts with "id" and "query" keys.
+    """
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        queries = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line) if line.startswith("{") else {"query": line}
+            queries.append({"id": item.get("id", len(queries)), "query": item["query"]})
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    logger.info(f"Read {len(queries)} queries from {path}")
+    return queries
+
+
+async def _astream_state(graph: Graph, query: str) -> tuple[AgentState | None, dict[str, float]]:
+    """
+    Runs the graph for a query.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        query (str): The analysis query.
+
+    Returns:
+        tuple[AgentState | None, dict[str, float]]: The final state, and the time at which each node completed.
+    """
+    start = time.perf_counter()
+    state = None
+    node_timings = {}
+    async for mode, chunk in graph.astream(create_initial_state(query), stream_mode=["updates", "values"]):
+        if mode == "values":
+            state = chunk
+        else:
+            for node in chunk:
+                node_timings[node] = round(time.perf_counter() - start, 3)
+    return state, node_timings
+
+
+async def run_query(graph: Graph, item: dict, flight: SingleFlight | None = None) -> dict:
+    """
+    Runs the graph for a single query of a batch.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        item (dict): The query, with "id" and "query" keys.
+        flight (SingleFlight | None, optional): Shares a single run between the identical queries (up to case and
+            whitespace) running at once, whose node timings are then those of the shared run. Defaults to None.
+
+    Returns:
+        dict: The result, with the query, the final state (or the error) and timings in seconds:
+            the total time and the time at which each node completed.
+    """
+    start = time.perf_counter()
+    result = {"id": item["id"], "query": item["query"], "state": None}
+    node_timings = {}
+    try:
+        if flight is None:
+            result["state"], node_timings = await _astream_state(graph, item["query"])
+        else:
+            result["state"], node_timings = await flight.ado(
+                normalize_query(item["query"]), _astream_state, graph, item["query"]
+            )
+    except Exception as e:
+        logger.exception(f"Query {item['id']} failed")
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["timings"] = {
+        "total": round(time.perf_counter() - start, 3),
+        "nodes": node_timings,
+    }
+    return result
+
+
+async def run_batch(
+    graph: Graph,
+    queries: list[dict],
+    concurrency: int = 8,
+    output_path: str | None = None,
+    tracer: Tracer | None = None,
+    coalesce: bool = True,
+):
+    """
+    Runs many queries through the same graph, with bounded concurrency.
+
+    One JSON line is written per query as soon as it finishes, so results are not in input order.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        queries (list[dict]): The queries, as dicts with "id" and "query" keys.
+        concurrency (int, optional): The maximum number of queries running at once. Defaults to 8.
+        output_path (str | None, optional): The path to the JSON lines output, or None for stdout. Defaults to None.
+        tracer (Tracer | None, optional): A tracer counting the coalesced queries. Defaults to None.
+        coalesce (bool, optional): Whether identical queries running at once share a single run. Defaults to True.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    flight = SingleFlight("query", tracer) if coalesce else None
+    output: TextIO = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+
+    async def run_bounded(item: dict) -> dict:
+        async with semaphore:
+            return await run_query(graph, item, flight)
+
+    start = time.perf_counter()
+    failed = 0
+    try:
+        for done, task in enumerate(
+            asyncio.as_completed([run_bounded(item) for item in queries]), start=1
+        ):
+            result = await task
+            failed += "error" in result
+            output.write(json.dumps(result, default=str) + "\n")
+            output.flush()
+            logger.info(f"Completed {done}/{len(queries)} queries")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logger.info(
+        f"Batch of {len(queries)} queries completed in {time.perf_counter() - start:.1f}s "
+        f"with {failed} failure(s)"
+    )
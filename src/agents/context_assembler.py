@@ -0,0 +1,201 @@
+import logging
+import re
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import TAG_NOSTREAM
+
+from src.agents.prompts import context_summary_system_prompt, context_summary_user_prompt
+from src.agents.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Default token budgets of the sections of the earnings call prompt
+DEFAULT_SECTION_BUDGETS = {"market_analysis": 1500, "risk_assessment": 1000}
+
+# Rough number of words per token of English text, to ask the summarizer for a length it understands
+_WORDS_PER_TOKEN = 0.75
+
+_SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|$)")
+_GAP = "[...]"
+
+
+def trim_to_budget(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """
+    Shortens a text to a token budget by extracting its most informative sentences.
+
+    Headings come first, then sentences with figures, then the earliest sentences. The selected sentences
+    keep their original order and lines, and each gap is marked with "[...]". If no sentence fits,
+    the first words of the top sentence are kept.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): The maximum number of tokens.
+        model (str, optional): The model whose tokenizer counts the tokens. Defaults to "gpt-3.5-turbo".
+
+    Returns:
+        str: The text if it fits the budget, or else the selected sentences.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    # Units are the sentences of each line, with the index of their line
+    units = [
+        (line_index, sentence.strip())
+        for line_index, line in enumerate(text.splitlines())
+        for sentence in _SENTENCE_PATTERN.findall(line)
+        if sentence.strip()
+    ]
+    priorities = sorted(
+        range(len(units)),
+        key=lambda index: (
+            not units[index][1].startswith("#"),
+            not any(char.isdigit() for char in units[index][1]),
+            index,
+        ),
+    )
+    selected = set()
+    used = 0
+    for index in priorities:
+        # Count a gap marker per sentence, as an upper bound of the markers of the result
+        tokens = count_tokens(units[index][1], model) + count_tokens(_GAP, model)
+        if used + tokens > max_tokens:
+            continue
+        selected.add(index)
+        used += tokens
+    if not selected and units:
+        # No sentence fits, so keep the first words of the top one
+        index = priorities[0]
+        words = units[index][1].split()
+        budget = max_tokens - 2 * count_tokens(_GAP, model)
+        while words and count_tokens(" ".join(words), model) > budget:
+            words = words[: len(words) * 3 // 4]
+        units[index] = (units[index][0], " ".join(words + [_GAP]))
+        selected.add(index)
+    lines: dict[int, list[str]] = {}
+    previous = -1
+    for index in sorted(selected):
+        line_index, sentence = units[index]
+        if index != previous + 1:
+            lines.setdefault(line_index, []).append(_GAP)
+        lines.setdefault(line_index, []).append(sentence)
+        previous = index
+    if previous != len(units) - 1:
+        lines.setdefault(units[previous][0] if previous >= 0 else 0, []).append(_GAP)
+    return "\n".join(" ".join(parts) for _, parts in sorted(lines.items()))
+
+
+class ContextAssembler:
+    """
+    Fits the sections of a prompt (e.g. the upstream reports injected into the earnings call prompt) to token budgets.
+
+    The tokens of each section are counted with a local tokenizer. Sections over their budget are condensed
+    by a cheap summarizer model, if any, and in any case trimmed extractively to the budget, so that verbose
+    upstream agents do not inflate the latency and cost of the final LLM call.
+    """
+
+    def __init__(
+        self,
+        budgets: dict[str, int] | None = None,
+        summarizer: BaseChatModel | None = None,
+        model: str = "gpt-3.5-turbo",
+    ):
+        """
+        Initializes a ContextAssembler instance.
+
+        Args:
+            budgets (dict[str, int] | None, optional): The maximum number of tokens per section name.
+                Sections without a budget are left as they are. Defaults to `DEFAULT_SECTION_BUDGETS`.
+            summarizer (BaseChatModel | None, optional): A cheap model condensing the sections over budget.
+                Defaults to None, for extractive trimming only.
+            model (str, optional): The model whose tokenizer counts the tokens. Defaults to "gpt-3.5-turbo".
+        """
+        self.budgets = DEFAULT_SECTION_BUDGETS if budgets is None else budgets
+        self.model = model
+        self.summary_chain = None
+        if summarizer is not None:
+            prompt_template = ChatPromptTemplate.from_messages(
+                [
+                    ("system", context_summary_system_prompt),
+                    ("human", context_summary_user_prompt),
+                ]
+            )
+            # The summaries are internal, so their tokens are kept out of the streamed report
+            self.summary_chain = prompt_template | summarizer.with_config(tags=[TAG_NOSTREAM])
+
+    def _over_budget(self, sections: dict[str, str]) -> dict[str, int]:
+        """
+        Counts the tokens of each section and finds those over budget.
+
+        Args:
+            sections (dict[str, str]): The text per section name.
+
+        Returns:
+            dict[str, int]: The budget per section name of the sections over budget.
+        """
+        over_budget = {}
+        for name, text in sections.items():
+            tokens = count_tokens(text, self.model)
+            budget = self.budgets.get(name)
+            logger.info(f"Context section {name}: {tokens} tokens (budget {budget})")
+            if budget is not None and tokens > budget:
+                over_budget[name] = budget
+        return over_budget
+
+    def _summary_input(self, name: str, text: str, budget: int) -> dict:
+        return {
+            "section": name.replace("_", " "),
+            "max_words": int(budget * _WORDS_PER_TOKEN),
+            "text": text,
+        }
+
+    def assemble(self, sections: dict[str, str], config: RunnableConfig | None = None) -> dict[str, str]:
+        """
+        Fits the sections to their token budgets.
+
+        Args:
+            sections (dict[str, str]): The text per section name.
+            config (RunnableConfig | None, optional): The config of the summarizer calls, e.g. with tracing callbacks.
+                Defaults to None.
+
+        Returns:
+            dict[str, str]: The text per section name, within budget.
+        """
+        assembled = dict(sections)
+        for name, budget in self._over_budget(sections).items():
+            text = sections[name]
+            if self.summary_chain is not None:
+                text = self.summary_chain.invoke(self._summary_input(name, text, budget), config=config).content
+            assembled[name] = trim_to_budget(text, budget, self.model)
+        return assembled
+
+    async def aassemble(
+        self, sections: dict[str, str], config: RunnableConfig | None = None
+    ) -> dict[str, str]:
+        """
+        Asynchronously fits the sections to their token budgets, summarizing the sections over budget concurrently.
+
+        This is the async counterpart of `assemble`.
+
+        Args:
+            sections (dict[str, str]): The text per section name.
+            config (RunnableConfig | None, optional): The config of the summarizer calls, e.g. with tracing callbacks.
+                Defaults to None.
+
+        Returns:
+            dict[str, str]: The text per section name, within budget.
+        """
+        assembled = dict(sections)
+        over_budget = self._over_budget(sections)
+        if not over_budget:
+            return assembled
+        texts = [sections[name] for name in over_budget]
+        if self.summary_chain is not None:
+            summaries = await self.summary_chain.abatch(
+                [self._summary_input(name, sections[name], budget) for name, budget in over_budget.items()],
+                config=config,
+            )
+            texts = [summary.content for summary in summaries]
+        for (name, budget), text in zip(over_budget.items(), texts):
+            assembled[name] = trim_to_budget(text, budget, self.model)
+        return assembled
@@ -1,32 +1,139 @@
 import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import UnstructuredHTMLLoader
 from langchain_core.documents import Document
 
+from src.agents.fast_html_loader import FastHTMLLoader, UnsupportedDocumentError
+from src.agents.ingestion_manifest import IngestionManifest, chunk_id, hash_file
 from src.agents.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
 
+_YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+def _year_range(text: str, file_path: str) -> tuple[int, int] | None:
+    """
+    Finds the range of years a chunk covers, from the years in its text, or else in its file name.
+
+    Args:
+        text (str): The text of the chunk.
+        file_path (str): The path to the source file.
+
+    Returns:
+        tuple[int, int] | None: The first and last years, or None if no year is mentioned.
+    """
+    years = [int(year) for year in _YEAR_PATTERN.findall(text)] or [
+        int(year) for year in _YEAR_PATTERN.findall(os.path.basename(file_path))
+    ]
+    return (min(years), max(years)) if years else None
+
+
+def _load(file_path: str, loader: str) -> list[Document]:
+    """
+    Loads a document from a file.
+
+    With the "fast" loader, simple table-based HTML documents are parsed with FastHTMLLoader,
+    and only other documents fall back to UnstructuredHTMLLoader.
+
+    Args:
+        file_path (str): The path to the file containing the document.
+        loader (str): The loader to use, either "fast" or "unstructured".
+
+    Returns:
+        list[Document]: A list of documents extracted from the file.
+    """
+    if loader == "fast":
+        try:
+            return FastHTMLLoader(file_path).load()
+        except (UnsupportedDocumentError, UnicodeError) as e:
+            logger.debug(f"Falling back to unstructured loader: {e}")
+    # Opt out of unstructured's usage telemetry, to avoid network calls during ingestion
+    os.environ.setdefault("SCARF_NO_ANALYTICS", "true")
+    from langchain_community.document_loaders import UnstructuredHTMLLoader
+
+    return UnstructuredHTMLLoader(file_path).load()
+
+
+def _load_and_split(
+    file_path: str, chunk_size: int, chunk_overlap: int, loader: str = "fast"
+) -> list[Document]:
+    """
+    Loads a document from a file and splits it into chunks.
+
+    Each chunk's metadata records the name of the source file and the range of years the chunk covers,
+    so that searches can be filtered on them.
+    This is a module-level function so that it can be pickled and run in a worker process.
+
+    Args:
+        file_path (str): The path to the file containing the document.
+        chunk_size (int): The maximum size of each chunk.
+        chunk_overlap (int): The overlap between consecutive chunks.
+        loader (str, optional): The loader to use, either "fast" or "unstructured". Defaults to "fast".
+
+    Returns:
+        list[Document]: The list of split documents.
+    """
+    documents = _load(file_path, loader)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    chunks = text_splitter.split_documents(documents)
+    for chunk in chunks:
+        chunk.metadata["file_name"] = os.path.basename(file_path)
+        year_range = _year_range(chunk.page_content, file_path)
+        if year_range:
+            chunk.metadata["year_start"], chunk.metadata["year_end"] = year_range
+    return chunks
+
 
 class DocumentProcessor:
     """
     A class responsible for processing documents and adding them to a vector store.
 
     This class loads documents from files, splits them into smaller chunks, and adds them to a vector store.
-    It also checks if a document has already been processed before attempting to process it again.
+    It keeps a manifest of the content hash and chunk IDs of every processed file, so that only new or changed
+    files are embedded again, and the chunks of changed or removed files are deleted from the vector store.
     """
 
-    def __init__(self, vector_store: VectorStore):
+    LOADERS = ("fast", "unstructured")
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        manifest_path: str = "ingestion_manifest.json",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        loader: str = "fast",
+    ):
         """
         Initializes a DocumentProcessor instance.
 
         Args:
             vector_store (VectorStore): The vector store where the processed documents will be added.
+            manifest_path (str, optional): The path to the ingestion manifest. Defaults to "ingestion_manifest.json".
+            chunk_size (int, optional): The maximum size of each chunk. Defaults to 1000.
+            chunk_overlap (int, optional): The overlap between consecutive chunks. Defaults to 200.
+            loader (str, optional): The document loader, either "fast" (falling back to unstructured for
+                documents it cannot handle) or "unstructured". Defaults to "fast".
+
+        Raises:
+            ValueError: If the loader is unknown.
         """
+        if loader not in self.LOADERS:
+            raise ValueError(f"Unknown document loader: {loader}")
         self.vector_store = vector_store
+        self.loader = loader
+        self.manifest = IngestionManifest(manifest_path)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
         )
 
     def load_document(self, file_path: str) -> list[Document]:
@@ -40,8 +147,7 @@ class DocumentProcessor:
             list[Document]: A list of documents extracted from the file.
         """
         logger.info(f"Loading document at {file_path}")
-        loader = UnstructuredHTMLLoader(file_path)
-        documents = loader.load()
+        documents = _load(file_path, self.loader)
         logger.debug(f"Extracted {len(documents)} document(s) from file {file_path}")
         return documents
 
@@ -67,14 +173,180 @@ class DocumentProcessor:
         """
         Processes a document at the given file path and adds it to the vector store.
 
-        If the document has already been processed, this method does nothing.
+        If the document has already been processed and has not changed since, this method does nothing.
 
         Args:
             file_path (str): The path to the file containing the document to be processed.
         """
-        if self.vector_store.has_record(file_path):
-            logger.debug(f"Record for document at {file_path} already found. Skipping.")
+        self.process_many([file_path], workers=1)
+
+    def process_many(
+        self, file_paths: list[str], workers: int | None = None, batch_size: int = 256
+    ) -> dict[str, float]:
+        """
+        Processes many documents and adds them to the vector store in batches.
+
+        Files whose content hash matches the manifest are skipped, after checking with a single query
+        that their chunks are still in the vector store. The chunks of changed files and of files that
+        no longer exist are deleted. The remaining files are loaded and split on a pool of worker processes,
+        and the resulting chunks are gathered into batches of at most `batch_size` chunks, so that each batch
+        costs a single embedding request and a single write to the vector store.
+
+        Args:
+            file_paths (list[str]): The paths to the files containing the documents to be processed.
+            workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+                With a single worker, files are processed in the current process.
+            batch_size (int, optional): The maximum number of chunks per batch, at least 1. Defaults to 256.
+
+        Returns:
+            dict[str, float]: The number of files processed, of chunks added, and the processing time in seconds.
+        """
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be at least 1: {batch_size}")
+        content_hashes = {file_path: hash_file(file_path) for file_path in file_paths}
+        pending_paths = self._find_pending(file_paths, content_hashes)
+        if len(pending_paths) < len(file_paths):
+            logger.info(
+                f"Skipping {len(file_paths) - len(pending_paths)} unchanged document(s)"
+            )
+        if not pending_paths:
+            return {"files": 0, "chunks": 0, "seconds": 0.0}
+
+        workers = workers or os.cpu_count() or 1
+        logger.info(
+            f"Processing {len(pending_paths)} document(s) with {workers} worker(s) "
+            f"and batch size {batch_size}"
+        )
+        start = time.perf_counter()
+        batch: list[Document] = []
+        # Files whose chunks are (partly) in the current batch, with the offset of their last chunk
+        unrecorded: list[tuple[str, int, list[str]]] = []
+        files_done = 0
+        chunks_queued = 0
+        chunks_done = 0
+        for file_path, split_documents in self._load_and_split_all(pending_paths, workers):
+            files_done += 1
+            if split_documents is not None:
+                content_hash = content_hashes[file_path]
+                ids = [
+                    chunk_id(os.path.abspath(file_path), content_hash, index)
+                    for index in range(len(split_documents))
+                ]
+                for doc, doc_id in zip(split_documents, ids):
+                    doc.id = doc_id
+                batch.extend(split_documents)
+                chunks_queued += len(split_documents)
+                unrecorded.append((file_path, chunks_queued, ids))
+
+            while len(batch) >= batch_size or files_done == len(pending_paths):
+                chunks, batch = batch[:batch_size], batch[batch_size:]
+                if chunks:
+                    self.vector_store.add_documents(chunks)
+                    chunks_done += len(chunks)
+                while unrecorded and unrecorded[0][1] <= chunks_done:
+                    recorded_path, _, ids = unrecorded.pop(0)
+                    self.manifest.record(recorded_path, content_hashes[recorded_path], ids)
+                self.manifest.save()
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"Ingested {files_done}/{len(pending_paths)} files, {chunks_done} chunks "
+                    f"in {elapsed:.1f}s ({files_done / elapsed:.1f} files/s, "
+                    f"{chunks_done / elapsed:.1f} chunks/s)"
+                )
+                if not batch:
+                    break
+        return {"files": files_done, "chunks": chunks_done, "seconds": time.perf_counter() - start}
+
+    def _find_pending(
+        self, file_paths: list[str], content_hashes: dict[str, str]
+    ) -> list[str]:
+        """
+        Finds the files that need to be embedded, and deletes stale chunks from the vector store.
+
+        A file needs to be embedded if it is not in the manifest, if its content hash changed, or if its
+        chunks are missing from the vector store (e.g. after the collection was reset). The latter is checked
+        for all recorded files with a single bulk query on the first chunk ID of each file.
+        Chunks of files that need to be embedded again and of files that no longer exist are deleted.
+
+        Args:
+            file_paths (list[str]): The paths to the candidate files.
+            content_hashes (dict[str, str]): The content hash of each candidate file.
+
+        Returns:
+            list[str]: The paths to the files that need to be embedded.
+        """
+        entries = {file_path: self.manifest.get(file_path) for file_path in file_paths}
+        first_ids = {
+            file_path: entry["chunk_ids"][0]
+            for file_path, entry in entries.items()
+            if entry
+            and entry["sha256"] == content_hashes[file_path]
+            and entry["chunk_ids"]
+        }
+        existing_ids = self.vector_store.existing_ids(list(first_ids.values()))
+
+        pending_paths = []
+        for file_path, entry in entries.items():
+            if entry and entry["sha256"] == content_hashes[file_path]:
+                if file_path not in first_ids or first_ids[file_path] in existing_ids:
+                    continue
+            pending_paths.append(file_path)
+
+        stale_paths = [
+            file_path for file_path in pending_paths if entries[file_path]
+        ] + self.manifest.removed_files()
+        stale_ids = []
+        for file_path in stale_paths:
+            stale_ids.extend(self.manifest.get(file_path)["chunk_ids"])
+            self.manifest.remove(file_path)
+        if stale_paths:
+            logger.info(f"Deleting chunks of {len(stale_paths)} changed or removed file(s)")
+            self.vector_store.delete(stale_ids)
+            self.manifest.save()
+        return pending_paths
+
+    def _load_and_split_all(
+        self, file_paths: list[str], workers: int
+    ) -> Iterator[tuple[str, list[Document] | None]]:
+        """
+        Loads and splits the given files, yielding results as soon as each file is done.
+
+        Files that fail to load are logged and yielded with None instead of their chunks.
+
+        Args:
+            file_paths (list[str]): The paths to the files to load.
+            workers (int): The number of worker processes.
+
+        Yields:
+            tuple[str, list[Document] | None]: The file path and its split documents.
+        """
+        if workers == 1:
+            for file_path in file_paths:
+                try:
+                    split_documents = _load_and_split(
+                        file_path, self.chunk_size, self.chunk_overlap, self.loader
+                    )
+                except Exception:
+                    logger.exception(f"Failed to process document at {file_path}")
+                    split_documents = None
+                yield file_path, split_documents
             return
-        documents = self.load_document(file_path)
-        split_documents = self.split_documents(documents)
-        self.vector_store.add_documents(split_documents)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    _load_and_split,
+                    file_path,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                    self.loader,
+                ): file_path
+                for file_path in file_paths
+            }
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    split_documents = future.result()
+                except Exception:
+                    logger.exception(f"Failed to process document at {file_path}")
+                    split_documents = None
+                yield file_path, split_documents
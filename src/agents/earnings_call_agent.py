@@ -1,16 +1,22 @@
 import logging
 
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.tools import Tool
+from langchain.agents import create_openai_tools_agent
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
 
+from src.agents.agent_executor import create_agent_executor
 from src.agents.agent_state import AgentState
+from src.agents.context_assembler import ContextAssembler
+from src.agents.earnings_call_store import EarningsCallStore
+from src.agents.model_routing import ModelConfig, create_chat_model
+from src.agents.openai_scheduler import OpenAIScheduler
 from src.agents.prompts import (
     earnings_call_agent_system_prompt,
     earnings_call_agent_user_prompt,
 )
-from src.agents.simple_store import SimpleStore
+from src.agents.step_logging import Preview
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +26,41 @@ class EarningsCallAgent:
     A class representing an earnings call agent.
 
     This agent is responsible for generating an earnings call report based on the market analysis and risk assessment.
-    It uses a language model to generate the report and has access to a simple store to fetch previous earnings call data.
+    It uses a language model to generate the report and has access to a store to fetch the most relevant previous earnings calls.
+    The upstream reports are fitted to token budgets before they are injected into the prompt.
     """
 
-    def __init__(self, earning_calls_store: SimpleStore):
+    def __init__(
+        self,
+        earning_calls_store: EarningsCallStore,
+        llm: BaseChatModel | None = None,
+        context_assembler: ContextAssembler | None = None,
+        max_iterations: int | None = 8,
+        max_execution_time: float | None = 120.0,
+        model_config: ModelConfig | None = None,
+        scheduler: OpenAIScheduler | None = None,
+    ):
         """
         Initializes an EarningsCallAgent instance.
 
         Args:
-            earning_calls_store (SimpleStore): The simple store where previous earnings call data is stored.
+            earning_calls_store (EarningsCallStore): The store where previous earnings call data is stored.
+            llm (BaseChatModel | None, optional): The language model, e.g. a fake for benchmarks.
+                Defaults to the model of `model_config`.
+            context_assembler (ContextAssembler | None, optional): Fits the market analysis and risk assessment
+                to token budgets. Defaults to extractive trimming to the default budgets.
+            max_iterations (int | None, optional): The maximum number of model turns, or None for no limit.
+                Defaults to 8.
+            max_execution_time (float | None, optional): The maximum number of seconds of a run, or None
+                for no limit. Defaults to 120.
+            model_config (ModelConfig | None, optional): The provider, model, maximum output tokens, deadline
+                and hedging of the model, if no model is given. Defaults to OpenAI's default chat model.
+            scheduler (OpenAIScheduler | None, optional): The scheduler of the OpenAI requests of the model,
+                if no model is given. Defaults to the process-wide scheduler.
         """
         self.earnings_call_store = earning_calls_store
-        self.llm = ChatOpenAI(temperature=0.8)
+        self.context_assembler = context_assembler or ContextAssembler()
+        self.llm = llm or create_chat_model(model_config or ModelConfig(), temperature=0.8, scheduler=scheduler)
 
         # Initialize tools
         self.tools = self._create_tools()
@@ -45,51 +74,79 @@ class EarningsCallAgent:
             ]
         )
         self.agent = create_openai_tools_agent(self.llm, self.tools, prompt_template)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            return_intermediate_steps=True,
+        self.agent_executor = create_agent_executor(
+            self.agent, self.tools, max_iterations=max_iterations, max_execution_time=max_execution_time
         )
 
-    def _create_tools(self) -> list[Tool]:
+    def _create_tools(self) -> list[BaseTool]:
         """
         Creates a list of tools for the agent.
 
         Currently, the only tool is "fetch_previous_earnings_calls", which fetches relevant earnings call data from previous sessions.
+        Results are paginated, so that the agent can ask for more calls when needed.
 
         Returns:
-            list[Tool]: The list of tools.
+            list[BaseTool]: The list of tools.
         """
         tools = [
-            Tool(
-                name="fetch_previous_earnings_calls",
+            StructuredTool.from_function(
                 func=self.earnings_call_store.get_records,
+                name="fetch_previous_earnings_calls",
                 description="Find relevant earnings call data from previous sessions",
+                parse_docstring=True,
             ),
         ]
         return tools
 
-    def run(self, state: AgentState) -> AgentState:
+    def run(self, state: AgentState) -> dict:
         """
         Runs the earnings call agent with the given input state.
 
-        The agent generates an earnings call report based on the market analysis and risk assessment in the input state.
-        The report is then added to the output state, along with the current agent's name in the history.
+        The agent generates an earnings call report based on the market analysis and risk assessment in the input state,
+        fitted to their token budgets.
+        The report is returned as a state update, along with the current agent's name for the history.
 
         Args:
             state (AgentState): The input state.
 
         Returns:
-            AgentState: The output state with the earnings call report.
+            dict: The state update with the earnings call report.
         """
-        logger.info(f"Running earnings call agent with input state: {state}")
-        output = self.agent_executor.invoke(
+        logger.info("Running earnings call agent for query: %s", Preview(state["query"]))
+        sections = self.context_assembler.assemble(
             {
                 "market_analysis": state["market_analysis"],
                 "risk_assessment": state["risk_assessment"],
             }
         )
-        logger.debug(f"Got output: {output}")
-        state["history"].append("earnings_call_agent")
-        state["earnings_call_report"] = output["output"]
-        return state
+        output = self.agent_executor.invoke(sections)
+        logger.debug("Got output: %s", Preview(output))
+        return {"earnings_call_report": output["output"], "history": ["earnings_call_agent"]}
+
+    async def arun(
+        self, state: AgentState, config: RunnableConfig | None = None
+    ) -> dict:
+        """
+        Asynchronously runs the earnings call agent with the given input state.
+
+        This is the async counterpart of `run`. The LLM output is streamed, so that the tokens of the report
+        reach the callbacks of the given config (e.g. the graph's "messages" stream) as they are generated.
+
+        Args:
+            state (AgentState): The input state.
+            config (RunnableConfig | None, optional): The config of the graph node run. Defaults to None.
+
+        Returns:
+            dict: The state update with the earnings call report.
+        """
+        logger.info("Running earnings call agent for query: %s", Preview(state["query"]))
+        sections = await self.context_assembler.aassemble(
+            {
+                "market_analysis": state["market_analysis"],
+                "risk_assessment": state["risk_assessment"],
+            },
+            config=config,
+        )
+        output = await self.agent_executor.ainvoke(sections, config=config)
+        logger.debug("Got output: %s", Preview(output))
+        return {"earnings_call_report": output["output"], "history": ["earnings_call_agent"]}
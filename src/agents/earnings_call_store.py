@@ -0,0 +1,339 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from src.agents.step_logging import Preview
+from src.agents.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_FIELD_PATTERN = re.compile(r"^\*\s*([^:]+):\s*(.*)$")
+_ITEM_PATTERN = re.compile(r"^\s*\+\s*(.*)$")
+_PERIOD_PATTERN = re.compile(r"Q([1-4])\s+(\d{4})")
+
+
+def parse_earnings_call(text: str) -> dict:
+    """
+    Parses the structured fields of an earnings call report.
+
+    Reports are made of "* Field: value" lines, optionally followed by "+ item" lines, as in `earnings_call_data`.
+
+    Args:
+        text (str): The earnings call report.
+
+    Returns:
+        dict: The date (ISO format, or None if missing or unparsable), company, reporting period, year and quarter
+            of the reporting period (or None), key metrics (a dict of the "name: value" key highlights),
+            highlights (the key highlights and guidance items) and comments (the notable comments).
+    """
+    fields: dict[str, tuple[str, list[str]]] = {}
+    current = None
+    for line in text.splitlines():
+        if match := _FIELD_PATTERN.match(line):
+            current = match.group(1).strip().lower()
+            fields[current] = (match.group(2).strip(), [])
+        elif current and (match := _ITEM_PATTERN.match(line)):
+            fields[current][1].append(match.group(1).strip())
+
+    def value(name: str) -> str | None:
+        return fields[name][0] or None if name in fields else None
+
+    def items(prefix: str) -> list[str]:
+        return [item for name, (_, values) in fields.items() if name.startswith(prefix) for item in values]
+
+    date = value("date")
+    try:
+        date = datetime.strptime(date, "%B %d, %Y").date().isoformat() if date else None
+    except ValueError:
+        logger.warning(f"Unparsable earnings call date: {date}")
+        date = None
+    period = value("reporting period")
+    period_match = _PERIOD_PATTERN.search(period or "")
+    metrics = {}
+    for item in items("key highlights"):
+        name, _, metric = item.partition(":")
+        if metric:
+            metrics[name.strip()] = metric.strip()
+    return {
+        "date": date,
+        "company": value("company"),
+        "reporting_period": period,
+        "year": int(period_match.group(2)) if period_match else None,
+        "quarter": int(period_match.group(1)) if period_match else None,
+        "metrics": metrics,
+        "highlights": "\n".join(items("key highlights") + items("guidance")),
+        "comments": "\n".join(items("notable comments")),
+    }
+
+
+class EarningsCallStore:
+    """
+    A persistent archive of earnings call reports, backed by SQLite.
+
+    The structured fields of each report (date, company and reporting period) are parsed into indexed columns,
+    its key metrics into an indexed table of (call, name, value) rows, and its highlights and comments into a
+    full-text index. Rather than the whole archive,
+    `get_records` returns a page of the calls most relevant to the context, within a token budget, so that
+    the prompt of the earnings call agent does not grow with the archive.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_records: int = 3,
+        token_budget: int = 1000,
+        model: str = "gpt-3.5-turbo",
+        max_document_frequency: float = 0.5,
+    ):
+        """
+        Initializes an EarningsCallStore instance, creating the database and tables if needed.
+
+        Args:
+            path (str): The path to the SQLite database file, or ":memory:" for an in-memory store.
+            max_records (int, optional): The number of calls per page of `get_records`. Defaults to 3.
+            token_budget (int, optional): The maximum number of tokens of a page of `get_records`. Defaults to 1000.
+            model (str, optional): The model whose tokenizer counts the tokens. Defaults to "gpt-3.5-turbo".
+            max_document_frequency (float, optional): The fraction of calls above which a context term is
+                left out of the search, unless it is the rarest term. Defaults to 0.5.
+        """
+        self.path = path
+        self.max_records = max_records
+        self.token_budget = token_budget
+        self.model = model
+        self.max_document_frequency = max_document_frequency
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS earnings_calls (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                date TEXT,
+                company TEXT,
+                reporting_period TEXT,
+                year INTEGER,
+                quarter INTEGER,
+                highlights TEXT NOT NULL,
+                comments TEXT NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS earnings_calls_date ON earnings_calls (date);
+            CREATE INDEX IF NOT EXISTS earnings_calls_company ON earnings_calls (company, date);
+            CREATE INDEX IF NOT EXISTS earnings_calls_period ON earnings_calls (year, quarter);
+            CREATE TABLE IF NOT EXISTS earnings_call_metrics (
+                call_id INTEGER NOT NULL REFERENCES earnings_calls (rowid),
+                name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (call_id, name)
+            );
+            CREATE INDEX IF NOT EXISTS earnings_call_metrics_name ON earnings_call_metrics (name, value);
+            CREATE VIRTUAL TABLE IF NOT EXISTS earnings_calls_fts USING fts5(
+                company, reporting_period, highlights, comments,
+                content='earnings_calls', content_rowid='rowid'
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS earnings_calls_vocab USING fts5vocab(earnings_calls_fts, 'row');
+            -- Keep the full-text index in sync with the earnings calls table
+            CREATE TRIGGER IF NOT EXISTS earnings_calls_insert AFTER INSERT ON earnings_calls BEGIN
+                INSERT INTO earnings_calls_fts (rowid, company, reporting_period, highlights, comments)
+                VALUES (new.rowid, new.company, new.reporting_period, new.highlights, new.comments);
+            END;
+            CREATE TRIGGER IF NOT EXISTS earnings_calls_delete AFTER DELETE ON earnings_calls BEGIN
+                INSERT INTO earnings_calls_fts (earnings_calls_fts, rowid, company, reporting_period, highlights, comments)
+                VALUES ('delete', old.rowid, old.company, old.reporting_period, old.highlights, old.comments);
+                DELETE FROM earnings_call_metrics WHERE call_id = old.rowid;
+            END;
+            """
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM earnings_calls").fetchone()[0]
+
+    def add_records(self, reports: list[str]) -> int:
+        """
+        Adds earnings call reports to the store. Reports already in the store are skipped.
+
+        Args:
+            reports (list[str]): The earnings call reports.
+
+        Returns:
+            int: The number of reports added.
+        """
+        rows = []
+        metrics = []
+        for report in reports:
+            fields = parse_earnings_call(report)
+            report_id = hashlib.sha256(report.encode()).hexdigest()
+            metrics.extend((name, value, report_id) for name, value in fields["metrics"].items())
+            rows.append(
+                (
+                    report_id,
+                    fields["date"],
+                    fields["company"],
+                    fields["reporting_period"],
+                    fields["year"],
+                    fields["quarter"],
+                    fields["highlights"],
+                    fields["comments"],
+                    report,
+                )
+            )
+        with self._lock:
+            before = self._connection.execute("SELECT COUNT(*) FROM earnings_calls").fetchone()[0]
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO earnings_calls (id, date, company, reporting_period, year, quarter, "
+                "highlights, comments, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            # The metrics of reports already in the store are ignored too
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO earnings_call_metrics (call_id, name, value) "
+                "SELECT rowid, ?, ? FROM earnings_calls WHERE id = ?",
+                metrics,
+            )
+            self._connection.commit()
+            added = self._connection.execute("SELECT COUNT(*) FROM earnings_calls").fetchone()[0] - before
+        logger.info(f"Added {added} of {len(reports)} earnings call reports")
+        return added
+
+    def load_directory(self, directory: str) -> int:
+        """
+        Adds the earnings call reports of a directory, one per text file (.txt or .md).
+
+        Args:
+            directory (str): The path to the directory.
+
+        Returns:
+            int: The number of reports added.
+        """
+        reports = []
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith((".txt", ".md")):
+                with open(os.path.join(directory, file_name), encoding="utf-8") as f:
+                    reports.append(f.read())
+        return self.add_records(reports)
+
+    def search(self, context: str, limit: int, offset: int = 0) -> tuple[list[str], int]:
+        """
+        Ranks the earnings calls by relevance to a context.
+
+        The calls matching terms of the context come first, ranked with BM25 over their company, reporting period,
+        highlights and comments, then by recency. Terms found in most calls (e.g. "net income") would make every
+        call a match, so they are left out. The other calls follow, most recent first.
+
+        Args:
+            context (str): The context, e.g. a description of the calls to look for.
+            limit (int): The maximum number of calls to return.
+            offset (int, optional): The number of calls to skip, for pagination. Defaults to 0.
+
+        Returns:
+            tuple[list[str], int]: The reports of the calls, most relevant first, and the total number of calls.
+        """
+        terms = list(dict.fromkeys(_TOKEN_PATTERN.findall(context.lower())))
+        rows = []
+        with self._lock:
+            total = self._connection.execute("SELECT COUNT(*) FROM earnings_calls").fetchone()[0]
+            terms = self._selective_terms(terms) if terms else []
+            # An empty match expression would fail, so match a term that is never indexed instead
+            match = " OR ".join(f'"{term}"' for term in terms) or '""'
+            matches = self._connection.execute(
+                "SELECT COUNT(*) FROM earnings_calls_fts WHERE earnings_calls_fts MATCH ?", [match]
+            ).fetchone()[0]
+            if offset < matches:
+                rows = self._connection.execute(
+                    "SELECT earnings_calls.text FROM earnings_calls_fts "
+                    "JOIN earnings_calls ON earnings_calls.rowid = earnings_calls_fts.rowid "
+                    "WHERE earnings_calls_fts MATCH ? "
+                    "ORDER BY bm25(earnings_calls_fts), earnings_calls.date DESC LIMIT ? OFFSET ?",
+                    [match, limit, offset],
+                ).fetchall()
+            if len(rows) < limit:
+                rows += self._connection.execute(
+                    "SELECT text FROM earnings_calls WHERE rowid NOT IN "
+                    "(SELECT rowid FROM earnings_calls_fts WHERE earnings_calls_fts MATCH ?) "
+                    "ORDER BY date DESC LIMIT ? OFFSET ?",
+                    [match, limit - len(rows), max(offset - matches, 0)],
+                ).fetchall()
+        return [row[0] for row in rows], total
+
+    def _selective_terms(self, terms: list[str]) -> list[str]:
+        """
+        Selects the context terms worth matching, from their document frequencies.
+
+        Args:
+            terms (list[str]): The context terms.
+
+        Returns:
+            list[str]: The terms found in at most `max_document_frequency` of the calls, or else the rarest term.
+                Terms found in no call are left out.
+        """
+        frequencies = dict(
+            self._connection.execute(
+                f"SELECT term, doc FROM earnings_calls_vocab WHERE term IN ({','.join('?' * len(terms))})",
+                terms,
+            ).fetchall()
+        )
+        if not frequencies:
+            return []
+        total = self._connection.execute("SELECT COUNT(*) FROM earnings_calls").fetchone()[0]
+        selective = [
+            term
+            for term in terms
+            if term in frequencies and frequencies[term] <= self.max_document_frequency * total
+        ]
+        return selective or [min(frequencies, key=frequencies.get)]
+
+    def get_records(self, context: str, page: int = 1) -> list[str]:
+        """
+        Finds the reports of previous earnings calls most relevant to the context.
+
+        Args:
+            context: A description of the earnings calls to look for, e.g. a company, period or topic.
+            page: The page of results, starting at 1, to see less relevant calls. Defaults to 1.
+
+        Returns:
+            list[str]: The earnings call reports, shortened to fit the token budget, followed by a note
+                when more calls are available.
+        """
+        logger.info("Retrieving earnings call records for context: %s (page %s)", Preview(context), page)
+        page = max(page, 1)
+        offset = (page - 1) * self.max_records
+        reports, total = self.search(context, self.max_records, offset)
+        # Share the token budget evenly, so that every call of the page is kept, if shortened
+        budget = self.token_budget // max(len(reports), 1)
+        records = [self._truncate(report, budget) for report in reports]
+        remaining = total - offset - len(reports)
+        if remaining > 0:
+            records.append(
+                f"{remaining} more earnings calls, request page {page + 1} to see them."
+            )
+        return records
+
+    def _truncate(self, report: str, budget: int) -> str:
+        """
+        Shortens a report to a token budget, keeping its first lines (the date, company, period and key metrics).
+
+        Args:
+            report (str): The earnings call report.
+            budget (int): The maximum number of tokens.
+
+        Returns:
+            str: The report, with its last lines replaced by "[...]" if it exceeds the budget.
+        """
+        if count_tokens(report, self.model) <= budget:
+            return report
+        lines = []
+        used = count_tokens("[...]", self.model)
+        for line in report.splitlines():
+            used += count_tokens(line + "\n", self.model)
+            if used > budget:
+                break
+            lines.append(line)
+        return "\n".join(lines + ["[...]"])
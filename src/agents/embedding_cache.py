@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from src.agents.sqlite_cache import SqliteCache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    An embeddings model that caches the vectors of an underlying model on disk.
+
+    Vectors are keyed on the model name plus a hash of the text, and stored as float32 arrays
+    in a local SQLite database. Only texts missing from the cache are sent to the underlying model.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_path: str,
+        max_entries: int = 100_000,
+    ):
+        """
+        Initializes a CachedEmbeddings instance.
+
+        Args:
+            embeddings (Embeddings): The underlying embeddings model.
+            model_name (str): The name of the underlying model, used to namespace cache keys.
+            cache_path (str): The path to the SQLite database file.
+            max_entries (int, optional): The maximum number of cached vectors. Defaults to 100000.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = SqliteCache(cache_path, "embeddings", max_entries=max_entries)
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, texts: list[str]) -> tuple[dict[str, bytes], list[str]]:
+        """
+        Looks up the given texts in the cache.
+
+        Args:
+            texts (list[str]): The texts to look up.
+
+        Returns:
+            tuple[dict[str, bytes], list[str]]: The cached vectors by key, and the unique texts missing from the cache.
+        """
+        cached = self.cache.get_many([self._key(text) for text in texts])
+        missing = list(dict.fromkeys(text for text in texts if self._key(text) not in cached))
+        if missing:
+            logger.debug(f"Embedding cache miss for {len(missing)}/{len(texts)} text(s)")
+        return cached, missing
+
+    def _store(
+        self, cached: dict[str, bytes], texts: list[str], vectors: list[list[float]]
+    ):
+        """
+        Stores freshly computed vectors in the cache and in the lookup results.
+
+        Args:
+            cached (dict[str, bytes]): The lookup results to update.
+            texts (list[str]): The texts that were embedded.
+            vectors (list[list[float]]): The vectors of the texts.
+        """
+        computed = {
+            self._key(text): array("f", vector).tobytes()
+            for text, vector in zip(texts, vectors)
+        }
+        self.cache.put_many(computed)
+        cached.update(computed)
+
+    def _vectors(self, cached: dict[str, bytes], texts: list[str]) -> list[list[float]]:
+        return [array("f", cached[self._key(text)]).tolist() for text in texts]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds a list of documents, using cached vectors where available.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: The vectors of the texts.
+        """
+        cached, missing = self._lookup(texts)
+        if missing:
+            self._store(cached, missing, self.embeddings.embed_documents(missing))
+        return self._vectors(cached, texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Embeds a query, using the cached vector if available.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            list[float]: The vector of the query.
+        """
+        cached, missing = self._lookup([text])
+        if missing:
+            self._store(cached, missing, [self.embeddings.embed_query(text)])
+        return self._vectors(cached, [text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Asynchronously embeds a list of documents, using cached vectors where available.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: The vectors of the texts.
+        """
+        cached, missing = self._lookup(texts)
+        if missing:
+            self._store(cached, missing, await self.embeddings.aembed_documents(missing))
+        return self._vectors(cached, texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """
+        Asynchronously embeds a query, using the cached vector if available.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            list[float]: The vector of the query.
+        """
+        cached, missing = self._lookup([text])
+        if missing:
+            self._store(cached, missing, [await self.embeddings.aembed_query(text)])
+        return self._vectors(cached, [text])[0]
@@ -0,0 +1,282 @@
+import logging
+import os
+import re
+from typing import Literal
+
+import numpy as np
+
+from src.agents.html_tables import parse_html, read_html
+
+logger = logging.getLogger(__name__)
+
+_WINDOW_PATTERN = re.compile(r"(\d{4})\s*-\s*(\d{4})")
+_YEAR_PATTERN = re.compile(r"^\d{4}$")
+
+Operation = Literal["values", "mean", "min", "max", "change", "yoy"]
+
+
+def _parse_number(text: str) -> float | None:
+    """
+    Parses a number from a table cell such as "$1,071.74", "-2.4" or "1.5%".
+
+    Args:
+        text (str): The cell text.
+
+    Returns:
+        float | None: The number, or None if the cell does not hold a number.
+    """
+    try:
+        return float(text.replace("$", "").replace(",", "").replace("%", "").strip())
+    except ValueError:
+        return None
+
+
+def parse_expenditure_file(file_path: str) -> tuple[tuple[int, int], list[tuple[int, float, float]]]:
+    """
+    Parses an average auto insurance expenditure table.
+
+    Tables list the year, the average expenditure and the percent change from the previous year.
+    Some publications lay out two such column groups side by side, which are all extracted.
+
+    Args:
+        file_path (str): The path to the HTML file.
+
+    Returns:
+        tuple[tuple[int, int], list[tuple[int, float, float]]]: The (first, last) years of the publication window,
+            and the (year, average expenditure, percent change) rows. The percent change is NaN when missing.
+    """
+    parsed = parse_html(read_html(file_path, errors="replace"))
+    window_match = _WINDOW_PATTERN.search(parsed.text) or _WINDOW_PATTERN.search(
+        os.path.basename(file_path)
+    )
+    window = (int(window_match.group(1)), int(window_match.group(2))) if window_match else (0, 0)
+
+    rows = []
+    for table in parsed.tables:
+        header = [cell.lower() for cell in table[0]]
+        year_columns = [index for index, cell in enumerate(header) if cell == "year"]
+        for row in table[1:]:
+            for column in year_columns:
+                if column + 1 >= len(row) or not _YEAR_PATTERN.match(row[column]):
+                    continue
+                expenditure = _parse_number(row[column + 1])
+                if expenditure is None:
+                    continue
+                change = _parse_number(row[column + 2]) if column + 2 < len(row) else None
+                rows.append(
+                    (int(row[column]), expenditure, np.nan if change is None else change)
+                )
+    return window, rows
+
+
+class ExpenditureStore:
+    """
+    A columnar store of the average auto insurance expenditure per year.
+
+    The source documents are overlapping 10-year windows, and later publications revise the figures of earlier years.
+    The store keeps a single value per year, taken from the most recent publication that covers it,
+    and records that publication as the provenance of the value.
+    It answers range, aggregate and year-over-year queries directly, without retrieval or LLM calls.
+    """
+
+    def __init__(
+        self,
+        years: np.ndarray,
+        expenditures: np.ndarray,
+        percent_changes: np.ndarray,
+        source_ids: np.ndarray,
+        sources: list[str],
+    ):
+        """
+        Initializes an ExpenditureStore instance from its columns, sorted by year.
+
+        Args:
+            years (np.ndarray): The years.
+            expenditures (np.ndarray): The average expenditure of each year.
+            percent_changes (np.ndarray): The published percent change of each year, NaN when missing.
+            source_ids (np.ndarray): The index in `sources` of the publication of each year.
+            sources (list[str]): The names of the source files.
+        """
+        self.years = years
+        self.expenditures = expenditures
+        self.percent_changes = percent_changes
+        self.source_ids = source_ids
+        self.sources = sources
+
+    @classmethod
+    def from_files(cls, file_paths: list[str]) -> "ExpenditureStore":
+        """
+        Builds a store by parsing the given source files.
+
+        Args:
+            file_paths (list[str]): The paths to the source files.
+
+        Returns:
+            ExpenditureStore: The store, with one value per year.
+        """
+        publications = []
+        for file_path in file_paths:
+            try:
+                window, rows = parse_expenditure_file(file_path)
+            except Exception:
+                logger.exception(f"Failed to parse expenditure table at {file_path}")
+                continue
+            publications.append((window, os.path.basename(file_path), rows))
+
+        # Later publications (by end year of their window) override earlier ones
+        publications.sort(key=lambda publication: publication[0][::-1])
+        sources = [source for _, source, _ in publications]
+        by_year: dict[int, tuple[float, float, int]] = {}
+        for source_id, (_, _, rows) in enumerate(publications):
+            for year, expenditure, change in rows:
+                by_year[year] = (expenditure, change, source_id)
+
+        years = np.array(sorted(by_year), dtype=np.int32)
+        logger.info(
+            f"Extracted expenditures for {len(years)} year(s) from {len(publications)} file(s)"
+        )
+        return cls(
+            years=years,
+            expenditures=np.array([by_year[year][0] for year in years], dtype=np.float64),
+            percent_changes=np.array([by_year[year][1] for year in years], dtype=np.float64),
+            source_ids=np.array([by_year[year][2] for year in years], dtype=np.int32),
+            sources=sources,
+        )
+
+    @classmethod
+    def load_or_build(cls, path: str, file_paths: list[str]) -> "ExpenditureStore":
+        """
+        Loads the store from disk, or builds and saves it if the source files changed since it was saved.
+
+        Args:
+            path (str): The path to the persisted store (a NumPy .npz file).
+            file_paths (list[str]): The paths to the source files.
+
+        Returns:
+            ExpenditureStore: The store.
+        """
+        fingerprint = "\n".join(
+            f"{os.path.abspath(file_path)}:{os.path.getsize(file_path)}:{os.path.getmtime(file_path)}"
+            for file_path in sorted(file_paths)
+        )
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if str(data["fingerprint"]) == fingerprint:
+                    logger.info(f"Loading expenditure store from {path}")
+                    return cls(
+                        years=data["years"],
+                        expenditures=data["expenditures"],
+                        percent_changes=data["percent_changes"],
+                        source_ids=data["source_ids"],
+                        sources=data["sources"].tolist(),
+                    )
+        store = cls.from_files(file_paths)
+        store.save(path, fingerprint)
+        return store
+
+    def save(self, path: str, fingerprint: str = ""):
+        """
+        Saves the store to disk as a NumPy .npz file.
+
+        Args:
+            path (str): The path to the persisted store.
+            fingerprint (str, optional): A fingerprint of the source files, to detect stale stores. Defaults to "".
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                years=self.years,
+                expenditures=self.expenditures,
+                percent_changes=self.percent_changes,
+                source_ids=self.source_ids,
+                sources=np.array(self.sources, dtype=str),
+                fingerprint=np.array(fingerprint),
+            )
+
+    def _select(
+        self, start_year: int | None, end_year: int | None, last_n_years: int | None
+    ) -> np.ndarray:
+        """
+        Selects the rows of a year range.
+
+        Args:
+            start_year (int | None): The first year, or None for the earliest year.
+            end_year (int | None): The last year, or None for the latest year.
+            last_n_years (int | None): If set, the number of years up to `end_year`, overriding `start_year`.
+
+        Returns:
+            np.ndarray: The indices of the selected rows.
+        """
+        if len(self.years) == 0:
+            return np.empty(0, dtype=np.int64)
+        end = end_year if end_year is not None else int(self.years[-1])
+        start = start_year if start_year is not None else int(self.years[0])
+        if last_n_years:
+            start = end - last_n_years + 1
+        lo, hi = np.searchsorted(self.years, [start, end + 1])
+        return np.arange(lo, hi)
+
+    def query(
+        self,
+        operation: Operation = "values",
+        start_year: int | None = None,
+        end_year: int | None = None,
+        last_n_years: int | None = None,
+    ) -> str:
+        """
+        Answers a numeric query about the average auto insurance expenditure in the United States.
+
+        Args:
+            operation: "values" lists the yearly figures with their source, "mean", "min" and "max" aggregate them,
+                "change" gives the total and compound annual change over the range, and "yoy" gives the
+                year-over-year percent change of each year.
+            start_year: The first year of the range. Defaults to the earliest available year.
+            end_year: The last year of the range. Defaults to the latest available year.
+            last_n_years: If set, select this many years up to end_year instead of using start_year.
+
+        Returns:
+            str: The answer, with exact figures.
+        """
+        rows = self._select(start_year, end_year, last_n_years)
+        if len(rows) == 0:
+            available = (
+                f"{self.years[0]}-{self.years[-1]}" if len(self.years) else "none"
+            )
+            return f"No data for the requested years (available years: {available})."
+        years = self.years[rows]
+        expenditures = self.expenditures[rows]
+        period = f"{years[0]}-{years[-1]}"
+
+        if operation == "values":
+            lines = []
+            for row in rows:
+                change = self.percent_changes[row]
+                change_text = "n/a" if np.isnan(change) else f"{change:+.1f}%"
+                lines.append(
+                    f"{self.years[row]}: ${self.expenditures[row]:,.2f} ({change_text}) "
+                    f"[source: {self.sources[self.source_ids[row]]}]"
+                )
+            return "\n".join(lines)
+        if operation in ("mean", "min", "max"):
+            if operation == "mean":
+                return f"Mean average expenditure {period}: ${expenditures.mean():,.2f}"
+            index = int(np.argmin(expenditures) if operation == "min" else np.argmax(expenditures))
+            return f"{operation.capitalize()} average expenditure {period}: ${expenditures[index]:,.2f} in {years[index]}"
+        if operation == "change":
+            total = expenditures[-1] - expenditures[0]
+            percent = 100 * total / expenditures[0]
+            span = int(years[-1] - years[0])
+            cagr = 100 * ((expenditures[-1] / expenditures[0]) ** (1 / span) - 1) if span else 0.0
+            return (
+                f"Change {period}: ${expenditures[0]:,.2f} -> ${expenditures[-1]:,.2f} "
+                f"({total:+,.2f}, {percent:+.2f}%, {cagr:+.2f}% per year compounded)"
+            )
+        if operation == "yoy":
+            lines = []
+            for index in range(1, len(rows)):
+                if years[index] - years[index - 1] != 1:
+                    continue
+                change = 100 * (expenditures[index] / expenditures[index - 1] - 1)
+                lines.append(f"{years[index]} vs {years[index - 1]}: {change:+.2f}%")
+            return "\n".join(lines) or f"Not enough consecutive years in {period}."
+        return f"Unknown operation: {operation}"
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.agents.token_counter import count_tokens
+
+_WORDS = (
+    "average auto insurance expenditure rose steadily over the period driven by repair costs "
+    "medical claims and premium growth while risk remained moderate across segments"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic chat model standing in for ChatOpenAI in benchmarks, with no network calls.
+
+    It simulates the latency of a remote model: a fixed time to the first token, then a fixed time per output token.
+    When tools are bound (as by the OpenAI tools agent) and no tool result is in the conversation yet, it calls the
+    first tool with the last human message as its required string arguments. Otherwise it answers with `output_tokens` words.
+    """
+
+    first_token_latency: float = 0.0
+    """Seconds before the first output token."""
+    token_latency: float = 0.0
+    """Seconds per output token."""
+    output_tokens: int = 50
+    """Number of tokens of each answer."""
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _tokens(self, messages: list[BaseMessage], tools: list[dict] | None) -> list[str] | dict:
+        """
+        Decides the output for a conversation.
+
+        Args:
+            messages (list[BaseMessage]): The conversation.
+            tools (list[dict] | None): The bound tools, in the OpenAI format.
+
+        Returns:
+            list[str] | dict: The output tokens, or the OpenAI-format tool call to make.
+        """
+        if tools and not any(isinstance(message, ToolMessage) for message in messages):
+            function = tools[0]["function"]
+            query = next(
+                (message.content for message in reversed(messages) if message.type == "human"), ""
+            )
+            parameters = function.get("parameters", {})
+            arguments = {
+                name: query
+                for name in parameters.get("required", [])
+                if parameters["properties"][name].get("type") == "string"
+            }
+            return {"name": function["name"], "arguments": json.dumps(arguments)}
+        return [
+            _WORDS[index % len(_WORDS)] + ("" if index == self.output_tokens - 1 else " ")
+            for index in range(self.output_tokens)
+        ]
+
+    def _usage(self, messages: list[BaseMessage], output_tokens: int) -> dict[str, int]:
+        input_tokens = sum(count_tokens(str(message.content)) for message in messages)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _message(self, messages: list[BaseMessage], tools: list[dict] | None) -> AIMessage:
+        tokens = self._tokens(messages, tools)
+        if isinstance(tokens, dict):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": tokens["name"], "args": json.loads(tokens["arguments"]), "id": "call_0"}
+                ],
+                usage_metadata=self._usage(messages, 1),
+            )
+        return AIMessage(
+            content="".join(tokens), usage_metadata=self._usage(messages, len(tokens))
+        )
+
+    def _chunks(
+        self, messages: list[BaseMessage], tools: list[dict] | None
+    ) -> Iterator[AIMessageChunk]:
+        tokens = self._tokens(messages, tools)
+        if isinstance(tokens, dict):
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": tokens["name"], "args": tokens["arguments"], "id": "call_0", "index": 0}
+                ],
+                usage_metadata=self._usage(messages, 1),
+            )
+            return
+        for index, token in enumerate(tokens):
+            last = index == len(tokens) - 1
+            yield AIMessageChunk(
+                content=token, usage_metadata=self._usage(messages, len(tokens)) if last else None
+            )
+
+    def _latency(self, message: AIMessage) -> float:
+        return self.first_token_latency + self.token_latency * message.usage_metadata["output_tokens"]
+
+    def _generate(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        message = self._message(messages, kwargs.get("tools"))
+        time.sleep(self._latency(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        message = self._message(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._latency(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager=None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for message in self._chunks(messages, kwargs.get("tools")):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                run_manager.on_llm_new_token(message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager=None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for message in self._chunks(messages, kwargs.get("tools")):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                await run_manager.on_llm_new_token(message.content, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    A deterministic embeddings model standing in for OpenAIEmbeddings in benchmarks, with no network calls.
+
+    Each text is embedded as a unit vector seeded by its hash, so equal texts get equal vectors.
+    Each call waits for a fixed latency plus a latency per text, to simulate a remote model.
+    """
+
+    def __init__(
+        self,
+        size: int = 1536,
+        call_latency: float = 0.0,
+        text_latency: float = 0.0,
+        model: str = "fake-embedding",
+    ):
+        """
+        Initializes a FakeEmbeddings instance.
+
+        Args:
+            size (int, optional): The dimension of the vectors. Defaults to 1536, as OpenAI's models.
+            call_latency (float, optional): The latency of each call in seconds. Defaults to 0.
+            text_latency (float, optional): The additional latency per embedded text in seconds. Defaults to 0.
+            model (str, optional): The model name. Defaults to "fake-embedding".
+        """
+        self.size = size
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+        self.model = model
+
+    def _embed(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size, dtype=np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _latency(self, count: int) -> float:
+        return self.call_latency + self.text_latency * count
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self._latency(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self._latency(1))
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self._latency(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self._latency(1))
+        return self._embed(text)
@@ -0,0 +1,53 @@
+import logging
+from typing import Iterator
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from src.agents.html_tables import parse_html, read_html
+
+logger = logging.getLogger(__name__)
+
+
+class UnsupportedDocumentError(ValueError):
+    """
+    Raised when a document does not have the simple table layout handled by FastHTMLLoader.
+    """
+
+
+class FastHTMLLoader(BaseLoader):
+    """
+    A lightweight loader for HTML documents made of simple tables.
+
+    It decodes the file with its declared charset and extracts the text with the standard library's
+    streaming HTML parser, without charset detection, model loading or network calls. For a document that is
+    a single table, the text joins the stripped text nodes with single spaces, as UnstructuredHTMLLoader does
+    (`python benchmark.py loaders` compares both loaders on a directory of documents).
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Initializes a FastHTMLLoader instance.
+
+        Args:
+            file_path (str): The path to the HTML file.
+        """
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        """
+        Loads the document.
+
+        Yields:
+            Document: A single document with the visible text of the file.
+
+        Raises:
+            UnsupportedDocumentError: If the file is not a table-based HTML document.
+            UnicodeDecodeError: If the file cannot be decoded with its declared charset.
+        """
+        parsed = parse_html(read_html(self.file_path))
+        if not parsed.tables or not parsed.text:
+            raise UnsupportedDocumentError(
+                f"Document at {self.file_path} has no table layout"
+            )
+        yield Document(page_content=parsed.text, metadata={"source": self.file_path})
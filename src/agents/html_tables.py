@@ -0,0 +1,120 @@
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+_CHARSET_PATTERN = re.compile(rb"<meta[^>]+charset=[\"']?([A-Za-z0-9_-]+)", re.IGNORECASE)
+_CELL_TAGS = ("td", "th")
+_IGNORED_TAGS = ("head", "script", "style", "title")
+
+
+@dataclass
+class ParsedHtml:
+    """
+    The visible text and the tables extracted from an HTML document.
+
+    Attributes:
+        text (str): The visible text of the document, as its text nodes stripped of surrounding whitespace and
+            joined by single spaces (like UnstructuredHTMLLoader does for tables).
+        tables (list[list[list[str]]]): The tables of the document, as lists of rows of cell texts.
+            Nested tables are extracted separately, and a cell of an outer table only holds its own text.
+    """
+
+    text: str = ""
+    tables: list[list[list[str]]] = field(default_factory=list)
+
+
+class _TableParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts: list[str] = []
+        self.tables: list[list[list[str]]] = []
+        self._open_tables: list[list[list[str]]] = []
+        self._open_cells: list[list[str] | None] = []
+        self._ignored_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _IGNORED_TAGS:
+            self._ignored_depth += 1
+        elif tag == "table":
+            self._open_tables.append([])
+            self._open_cells.append(None)
+        elif tag == "tr" and self._open_tables:
+            self._open_tables[-1].append([])
+        elif tag in _CELL_TAGS and self._open_tables:
+            if not self._open_tables[-1]:
+                self._open_tables[-1].append([])
+            self._open_cells[-1] = []
+        elif tag in ("br", "p"):
+            self._append_to_cell(" ")
+
+    def handle_endtag(self, tag):
+        if tag in _IGNORED_TAGS:
+            self._ignored_depth = max(0, self._ignored_depth - 1)
+        elif tag == "table" and self._open_tables:
+            self._close_cell()
+            rows = [row for row in self._open_tables.pop() if row]
+            self._open_cells.pop()
+            if rows:
+                self.tables.append(rows)
+        elif tag in _CELL_TAGS:
+            self._close_cell()
+        elif tag == "p":
+            self._append_to_cell(" ")
+
+    def handle_data(self, data):
+        if not self._ignored_depth:
+            if data.strip():
+                self.text_parts.append(data.strip())
+            self._append_to_cell(data)
+
+    def _append_to_cell(self, data: str):
+        if self._open_cells and self._open_cells[-1] is not None:
+            self._open_cells[-1].append(data)
+
+    def _close_cell(self):
+        if self._open_cells and self._open_cells[-1] is not None:
+            self._open_tables[-1][-1].append(" ".join("".join(self._open_cells[-1]).split()))
+            self._open_cells[-1] = None
+
+
+def parse_html(html: str) -> ParsedHtml:
+    """
+    Extracts the visible text and the tables of an HTML document.
+
+    This uses the standard library's streaming HTML parser, which is enough for simple, table-based layouts.
+
+    Args:
+        html (str): The HTML document.
+
+    Returns:
+        ParsedHtml: The text and tables of the document.
+    """
+    parser = _TableParser()
+    parser.feed(html)
+    parser.close()
+    return ParsedHtml(text=" ".join(parser.text_parts), tables=parser.tables)
+
+
+def read_html(file_path: str, errors: str = "strict") -> str:
+    """
+    Reads an HTML file, decoding it with the charset declared in its meta tags (UTF-8 if none is declared).
+
+    Args:
+        file_path (str): The path to the HTML file.
+        errors (str, optional): How to handle bytes that cannot be decoded, as in `bytes.decode`.
+            Defaults to "strict".
+
+    Returns:
+        str: The decoded HTML document.
+
+    Raises:
+        UnicodeDecodeError: If the file cannot be decoded and `errors` is "strict".
+    """
+    with open(file_path, "rb") as f:
+        content = f.read()
+    match = _CHARSET_PATTERN.search(content[:4096])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return content.decode(encoding, errors=errors)
+    except LookupError:
+        return content.decode("utf-8", errors=errors)
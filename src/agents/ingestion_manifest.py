@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Computes the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(file_path: str, content_hash: str, index: int) -> str:
+    """
+    Builds a stable ID for a chunk of a file.
+
+    The ID only changes when the file path, the file content or the chunk position change,
+    so re-ingesting an unchanged file yields the same IDs.
+
+    Args:
+        file_path (str): The path to the source file.
+        content_hash (str): The hash of the source file content.
+        index (int): The position of the chunk within the file.
+
+    Returns:
+        str: The chunk ID.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_path}#{content_hash}#{index}"))
+
+
+class IngestionManifest:
+    """
+    A local record of the documents that have already been embedded into the vector store.
+
+    For each source file, the manifest keeps the hash of its content and the IDs of its chunks.
+    This allows incremental ingestion: unchanged files are skipped after a single query confirming
+    that their chunks are still in the vector store, and the chunks of changed or removed files
+    can be deleted by ID.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        """
+        Initializes an IngestionManifest instance, loading it from disk if it exists.
+
+        Args:
+            path (str): The path to the JSON file where the manifest is persisted.
+        """
+        self.path = path
+        self.files: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.files = data["files"]
+            else:
+                logger.warning(f"Ignoring manifest at {path} with unknown version")
+        logger.info(f"Loaded ingestion manifest with {len(self.files)} file(s)")
+
+    def get(self, file_path: str) -> dict | None:
+        """
+        Gets the manifest entry for a file.
+
+        Args:
+            file_path (str): The path to the source file.
+
+        Returns:
+            dict | None: The entry with the content hash and chunk IDs, or None if the file is not recorded.
+        """
+        return self.files.get(os.path.abspath(file_path))
+
+    def record(self, file_path: str, content_hash: str, chunk_ids: list[str]):
+        """
+        Records that a file has been embedded into the vector store.
+
+        Args:
+            file_path (str): The path to the source file.
+            content_hash (str): The hash of the source file content.
+            chunk_ids (list[str]): The IDs of the chunks stored for the file.
+        """
+        self.files[os.path.abspath(file_path)] = {
+            "sha256": content_hash,
+            "chunk_ids": chunk_ids,
+        }
+
+    def remove(self, file_path: str):
+        """
+        Removes a file from the manifest.
+
+        Args:
+            file_path (str): The path to the source file.
+        """
+        self.files.pop(os.path.abspath(file_path), None)
+
+    def removed_files(self) -> list[str]:
+        """
+        Lists the recorded files that no longer exist on disk.
+
+        Returns:
+            list[str]: The paths of the removed files.
+        """
+        return [file_path for file_path in self.files if not os.path.exists(file_path)]
+
+    def save(self):
+        """
+        Persists the manifest to disk atomically.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
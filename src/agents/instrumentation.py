@@ -0,0 +1,489 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.outputs import LLMResult
+
+from src.agents.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Estimated prices in USD per million (prompt, completion) tokens, matched on the model name prefix
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimates the cost of a model call from its token counts.
+
+    Args:
+        model (str): The model name.
+        prompt_tokens (int): The number of prompt (input) tokens.
+        completion_tokens (int): The number of completion (output) tokens.
+
+    Returns:
+        float: The estimated cost in USD, 0 for unknown models.
+    """
+    for prefix, (prompt_price, completion_price) in MODEL_PRICES.items():
+        if model.startswith(prefix):
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+    return 0.0
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    """
+    Returns the nearest-rank percentile of sorted values.
+
+    Args:
+        sorted_values (list[float]): The values, sorted in ascending order.
+        q (float): The percentile, between 0 and 1.
+
+    Returns:
+        float: The percentile.
+    """
+    index = min(len(sorted_values) - 1, max(0, int(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+@dataclass
+class Span:
+    """
+    A timed operation: a graph node, an LLM call, a tool call, an embedding call or a vector store query.
+    """
+
+    kind: str
+    name: str
+    start: float
+    duration: float
+    node: str | None = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """
+    Records the spans of a run and aggregates them into latency, token and cost statistics.
+
+    Spans can be recorded from any thread. The most recent `max_spans` spans are kept, so that long-running
+    processes use bounded memory.
+    """
+
+    def __init__(self, max_spans: int = 100_000):
+        """
+        Initializes a Tracer instance.
+
+        Args:
+            max_spans (int, optional): The maximum number of spans kept. Defaults to 100000.
+        """
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+        self.counters: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        """
+        Records a finished span.
+
+        Args:
+            span (Span): The span.
+        """
+        with self._lock:
+            self.spans.append(span)
+
+    def increment(self, counter: str, name: str, value: float = 1):
+        """
+        Increments a counter of events that are not timed, e.g. coalesced calls.
+
+        Args:
+            counter (str): The counter, e.g. "coalesced_calls".
+            name (str): The name of the counted operation.
+            value (float, optional): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[(counter, name)] = self.counters.get((counter, name), 0) + value
+
+    @contextlib.contextmanager
+    def span(self, kind: str, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Times the enclosed block as a span. The span is yielded, so the block can set its token counts.
+
+        Args:
+            kind (str): The kind of operation, e.g. "embedding" or "vector_query".
+            name (str): The name of the operation.
+            **attributes: Additional attributes of the span.
+
+        Yields:
+            Span: The span being timed.
+        """
+        span = Span(kind=kind, name=name, start=time.time(), duration=0.0, attributes=attributes)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.record(span)
+
+    def summary(self) -> dict[tuple[str, str], dict[str, float]]:
+        """
+        Aggregates the spans per kind and name.
+
+        Returns:
+            dict[tuple[str, str], dict[str, float]]: The statistics per (kind, name): count, errors, total, mean,
+                p50, p95, p99 and max duration in seconds, token counts and cost.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        groups: dict[tuple[str, str], list[Span]] = {}
+        for span in spans:
+            groups.setdefault((span.kind, span.name), []).append(span)
+        summary = {}
+        for key, group in sorted(groups.items()):
+            durations = sorted(span.duration for span in group)
+            summary[key] = {
+                "count": len(group),
+                "errors": sum(span.error is not None for span in group),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                **{f"p{int(q * 100)}": _percentile(durations, q) for q in _QUANTILES},
+                "max": durations[-1],
+                "prompt_tokens": sum(span.prompt_tokens for span in group),
+                "completion_tokens": sum(span.completion_tokens for span in group),
+                "cost": sum(span.cost for span in group),
+            }
+        return summary
+
+    def summary_table(self) -> str:
+        """
+        Formats the summary as a text table, slowest operations by total time first.
+
+        Returns:
+            str: The table.
+        """
+        rows = sorted(self.summary().items(), key=lambda item: item[1]["total"], reverse=True)
+        header = (
+            f"{'kind':<12} {'name':<32} {'count':>6} {'total s':>9} {'mean s':>8} "
+            f"{'p95 s':>8} {'max s':>8} {'tokens in':>10} {'tokens out':>10} {'cost $':>9}"
+        )
+        lines = [header, "-" * len(header)]
+        for (kind, name), stats in rows:
+            lines.append(
+                f"{kind:<12} {name[:32]:<32} {stats['count']:>6} {stats['total']:>9.3f} {stats['mean']:>8.3f} "
+                f"{stats['p95']:>8.3f} {stats['max']:>8.3f} {stats['prompt_tokens']:>10} "
+                f"{stats['completion_tokens']:>10} {stats['cost']:>9.4f}"
+            )
+        total_cost = sum(stats["cost"] for _, stats in rows)
+        lines.append(f"Estimated total cost: ${total_cost:.4f}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for (counter, name), value in counters:
+            lines.append(f"{counter} {name}: {value:g}")
+        return "\n".join(lines)
+
+    def export_jsonl(self, path: str):
+        """
+        Exports the spans as JSON lines, one span per line.
+
+        Args:
+            path (str): The path to the output file.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(asdict(span), default=str) + "\n")
+        logger.info(f"Exported {len(spans)} spans to {path}")
+
+    def prometheus_text(self) -> str:
+        """
+        Formats the summary in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP insurance_agents_span_seconds Wall time of graph nodes, LLM, tool, embedding and vector store calls.",
+            "# TYPE insurance_agents_span_seconds summary",
+        ]
+        for (kind, name), stats in summary.items():
+            labels = f'kind="{kind}",name="{_escape_label(name)}"'
+            for q in _QUANTILES:
+                lines.append(
+                    f'insurance_agents_span_seconds{{{labels},quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}'
+                )
+            lines.append(f"insurance_agents_span_seconds_sum{{{labels}}} {stats['total']:.6f}")
+            lines.append(f"insurance_agents_span_seconds_count{{{labels}}} {stats['count']}")
+        lines += [
+            "# HELP insurance_agents_span_errors_total Failed operations.",
+            "# TYPE insurance_agents_span_errors_total counter",
+        ]
+        for (kind, name), stats in summary.items():
+            labels = f'kind="{kind}",name="{_escape_label(name)}"'
+            lines.append(f"insurance_agents_span_errors_total{{{labels}}} {stats['errors']}")
+        lines += [
+            "# HELP insurance_agents_tokens_total Prompt and completion tokens.",
+            "# TYPE insurance_agents_tokens_total counter",
+        ]
+        for (kind, name), stats in summary.items():
+            labels = f'kind="{kind}",name="{_escape_label(name)}"'
+            for token_type in ("prompt", "completion"):
+                lines.append(
+                    f'insurance_agents_tokens_total{{{labels},type="{token_type}"}} {stats[f"{token_type}_tokens"]}'
+                )
+        lines += [
+            "# HELP insurance_agents_cost_usd_total Estimated cost in USD.",
+            "# TYPE insurance_agents_cost_usd_total counter",
+        ]
+        for (kind, name), stats in summary.items():
+            labels = f'kind="{kind}",name="{_escape_label(name)}"'
+            lines.append(f"insurance_agents_cost_usd_total{{{labels}}} {stats['cost']:.6f}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for counter in sorted({counter for (counter, _), _ in counters}):
+            lines += [
+                f"# HELP insurance_agents_{counter}_total Count of {counter.replace('_', ' ')}.",
+                f"# TYPE insurance_agents_{counter}_total counter",
+            ]
+            for (other, name), value in counters:
+                if other == counter:
+                    lines.append(f'insurance_agents_{counter}_total{{name="{_escape_label(name)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str):
+        """
+        Exports the summary as a Prometheus text file, e.g. for the node exporter's textfile collector.
+
+        Args:
+            path (str): The path to the output file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        logger.info(f"Exported metrics to {path}")
+
+    def export(self, path: str):
+        """
+        Exports the trace to a file, as Prometheus text if its extension is ".prom", and as JSON lines otherwise.
+
+        Args:
+            path (str): The path to the output file.
+        """
+        if path.endswith(".prom"):
+            self.export_prometheus(path)
+        else:
+            self.export_jsonl(path)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    A LangChain callback handler recording graph nodes, LLM calls and tool calls as spans of a tracer.
+
+    Pass it in the callbacks of the graph config: it then receives the events of every nested run.
+    LLM and tool spans record the graph node they ran in.
+    """
+
+    # Run in the thread of the traced call, so that timestamps are not delayed by an executor
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        """
+        Initializes a TracingCallbackHandler instance.
+
+        Args:
+            tracer (Tracer): The tracer recording the spans.
+        """
+        self.tracer = tracer
+        self._runs: dict[UUID, Span] = {}
+        self._starts: dict[UUID, float] = {}
+
+    def _start(self, run_id: UUID, kind: str, name: str, metadata: dict[str, Any] | None):
+        self._runs[run_id] = Span(
+            kind=kind,
+            name=name,
+            start=time.time(),
+            duration=0.0,
+            node=(metadata or {}).get("langgraph_node"),
+        )
+        self._starts[run_id] = time.perf_counter()
+
+    def _end(self, run_id: UUID, error: BaseException | None = None) -> Span | None:
+        span = self._runs.pop(run_id, None)
+        start = self._starts.pop(run_id, None)
+        if span is None:
+            return None
+        span.duration = time.perf_counter() - start
+        if error is not None:
+            span.error = type(error).__name__
+        self.tracer.record(span)
+        return span
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any],
+        inputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ):
+        # Only the runs of graph nodes (not of the chains nested in them), without the internal __start__ node
+        name = kwargs.get("name")
+        if metadata and name == metadata.get("langgraph_node") and not name.startswith("__"):
+            self._start(run_id, "node", name, metadata)
+
+    def on_chain_end(self, outputs: dict[str, Any], *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ):
+        self._start(run_id, "llm", _model_name(metadata, kwargs), metadata)
+
+    def on_llm_start(
+        self,
+        serialized: dict[str, Any],
+        prompts: list[str],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ):
+        self._start(run_id, "llm", _model_name(metadata, kwargs), metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        span = self._runs.get(run_id)
+        if span is not None:
+            span.prompt_tokens, span.completion_tokens = _token_usage(response)
+            span.cost = estimate_cost(span.name, span.prompt_tokens, span.completion_tokens)
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+
+def _model_name(metadata: dict[str, Any] | None, kwargs: dict[str, Any]) -> str:
+    invocation_params = kwargs.get("invocation_params") or {}
+    return (
+        (metadata or {}).get("ls_model_name")
+        or invocation_params.get("model_name")
+        or invocation_params.get("model")
+        or "llm"
+    )
+
+
+def _token_usage(response: LLMResult) -> tuple[int, int]:
+    """
+    Extracts the token counts of an LLM call.
+
+    Args:
+        response (LLMResult): The LLM result.
+
+    Returns:
+        tuple[int, int]: The prompt and completion token counts, 0 if the model did not report them.
+    """
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                prompt_tokens += usage_metadata.get("input_tokens", 0)
+                completion_tokens += usage_metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class TracedEmbeddings(Embeddings):
+    """
+    An embeddings model that records each call of an underlying model as a span, with its estimated tokens and cost.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, tracer: Tracer):
+        """
+        Initializes a TracedEmbeddings instance.
+
+        Args:
+            embeddings (Embeddings): The underlying embeddings model.
+            model_name (str): The name of the underlying model.
+            tracer (Tracer): The tracer recording the spans.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.tracer = tracer
+
+    @contextlib.contextmanager
+    def _span(self, texts: list[str]) -> Iterator[Span]:
+        with self.tracer.span("embedding", self.model_name, texts=len(texts)) as span:
+            yield span
+        span.prompt_tokens = sum(count_tokens(text, self.model_name) for text in texts)
+        span.cost = estimate_cost(self.model_name, span.prompt_tokens, 0)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._span(texts):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with self._span([text]):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._span(texts):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with self._span([text]):
+            return await self.embeddings.aembed_query(text)
@@ -1,15 +1,23 @@
 import logging
 
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.tools import Tool
+from langchain.agents import create_openai_tools_agent
+from langchain.tools import StructuredTool, Tool
+from langchain_core.caches import BaseCache
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
 
-from src.agents.agent_state import AgentState
+from src.agents.agent_executor import create_agent_executor
+from src.agents.agent_state import AgentState, IncompleteUpdate
+from src.agents.expenditure_store import ExpenditureStore
+from src.agents.llm_cache import with_response_cache
+from src.agents.model_routing import ModelConfig, create_chat_model
+from src.agents.openai_scheduler import OpenAIScheduler
 from src.agents.prompts import (
     insurance_agent_system_prompt,
     insurance_agent_user_prompt,
 )
+from src.agents.step_logging import Preview
 from src.agents.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
@@ -21,17 +29,45 @@ class InsuranceAnalysisAgent:
 
     This agent is responsible for generating a market analysis report based on the input query.
     It uses a language model to generate the report and has access to a vector store to search through insurance documents.
+    If an expenditure store is provided, it can also query the yearly average expenditures directly.
     """
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        expenditure_store: ExpenditureStore | None = None,
+        llm: BaseChatModel | None = None,
+        cache: BaseCache | None = None,
+        max_iterations: int | None = 8,
+        max_execution_time: float | None = 120.0,
+        model_config: ModelConfig | None = None,
+        scheduler: OpenAIScheduler | None = None,
+    ):
         """
         Initializes an InsuranceAnalysisAgent instance.
 
         Args:
             vector_store (VectorStore): The vector store where insurance documents are stored.
+            expenditure_store (ExpenditureStore | None, optional): The store of yearly average expenditures
+                extracted from the documents. Defaults to None.
+            llm (BaseChatModel | None, optional): The language model, e.g. a fake for benchmarks.
+                Defaults to the model of `model_config`.
+            cache (BaseCache | None, optional): A cache of the model responses (see `LLMResponseCache`).
+                Defaults to None.
+            max_iterations (int | None, optional): The maximum number of model turns, or None for no limit.
+                Defaults to 8.
+            max_execution_time (float | None, optional): The maximum number of seconds of a run, or None
+                for no limit. Defaults to 120.
+            model_config (ModelConfig | None, optional): The provider, model, maximum output tokens, deadline
+                and hedging of the model, if no model is given. Defaults to OpenAI's default chat model.
+            scheduler (OpenAIScheduler | None, optional): The scheduler of the OpenAI requests of the model,
+                if no model is given. Defaults to the process-wide scheduler.
         """
         self.vector_store = vector_store
-        self.llm = ChatOpenAI(temperature=0)
+        self.expenditure_store = expenditure_store
+        self.llm = with_response_cache(
+            llm or create_chat_model(model_config or ModelConfig(), temperature=0, scheduler=scheduler), cache
+        )
 
         # Initialize tools
         self.tools = self._create_tools()
@@ -45,46 +81,132 @@ class InsuranceAnalysisAgent:
             ]
         )
         self.agent = create_openai_tools_agent(self.llm, self.tools, prompt_template)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            return_intermediate_steps=True,
+        self.agent_executor = create_agent_executor(
+            self.agent, self.tools, max_iterations=max_iterations, max_execution_time=max_execution_time
         )
 
     def _create_tools(self) -> list[Tool]:
         """
         Creates a list of tools for the agent.
 
-        Currently, the only tool is "search_documents", which searches through insurance documents in the vector store.
+        The "search_documents" tool searches through insurance documents in the vector store, optionally filtered
+        by year range and source file.
+        If an expenditure store is available, the "query_expenditures" tool answers numeric queries over
+        the yearly average expenditures.
 
         Returns:
             list[Tool]: The list of tools.
         """
         tools = [
-            Tool(
+            StructuredTool.from_function(
+                func=self._search_documents,
+                coroutine=self._asearch_documents,
                 name="search_documents",
-                func=self.vector_store.similarity_search,
-                description="Search through insurance documents",
+                parse_docstring=True,
+                description=(
+                    "Search through insurance documents. Exact terms such as years are matched as keywords, "
+                    "and the year range and source filters narrow the search down in a single call."
+                ),
             ),
         ]
+        if self.expenditure_store is not None:
+            tools.append(
+                StructuredTool.from_function(
+                    func=self.expenditure_store.query,
+                    name="query_expenditures",
+                    parse_docstring=True,
+                    description=(
+                        "Get exact figures of the yearly average auto insurance expenditure in the United States: "
+                        "yearly values, mean/min/max, total change or year-over-year change over a range of years. "
+                        "Prefer this tool over searching documents for numeric questions and trends."
+                    ),
+                )
+            )
         return tools
 
-    def run(self, state: AgentState) -> AgentState:
+    def _search_documents(
+        self,
+        query: str,
+        start_year: int | None = None,
+        end_year: int | None = None,
+        source: str | None = None,
+    ) -> list[Document]:
+        """
+        Searches through insurance documents.
+
+        Args:
+            query: What to search for.
+            start_year: Only return documents covering this year or later.
+            end_year: Only return documents covering this year or earlier.
+            source: Only return documents whose file name contains this text.
+
+        Returns:
+            list[Document]: The matching documents.
+        """
+        return self.vector_store.similarity_search(
+            query, start_year=start_year, end_year=end_year, source=source
+        )
+
+    async def _asearch_documents(
+        self,
+        query: str,
+        start_year: int | None = None,
+        end_year: int | None = None,
+        source: str | None = None,
+    ) -> list[Document]:
+        """
+        Asynchronously searches through insurance documents. This is the async counterpart of `_search_documents`.
+        """
+        return await self.vector_store.asimilarity_search(
+            query, start_year=start_year, end_year=end_year, source=source
+        )
+
+    def run(self, state: AgentState) -> dict:
         """
         Runs the insurance analysis agent with the given input state.
 
         The agent generates a market analysis report based on the input query in the state.
-        The report is then added to the output state, along with the current agent's name in the history.
+        The report is returned as a state update, along with the current agent's name for the history.
 
         Args:
             state (AgentState): The input state.
 
         Returns:
-            AgentState: The output state with the market analysis report.
+            dict: The state update with the market analysis report.
         """
-        logger.info(f"Running insurance agent with input state: {state}")
+        logger.info("Running insurance agent for query: %s", Preview(state["query"]))
         output = self.agent_executor.invoke({"query": state["query"]})
-        logger.debug(f"Got output: {output}")
-        state["history"].append("insurance_agent")
-        state["market_analysis"] = output["output"]
-        return state
+        logger.debug("Got output: %s", Preview(output))
+        return self._update(output)
+
+    async def arun(self, state: AgentState) -> dict:
+        """
+        Asynchronously runs the insurance analysis agent with the given input state.
+
+        This is the async counterpart of `run`, so that the agent can run concurrently with other agents
+        on a single event loop.
+
+        Args:
+            state (AgentState): The input state.
+
+        Returns:
+            dict: The state update with the market analysis report.
+        """
+        logger.info("Running insurance agent for query: %s", Preview(state["query"]))
+        output = await self.agent_executor.ainvoke({"query": state["query"]})
+        logger.debug("Got output: %s", Preview(output))
+        return self._update(output)
+
+    @staticmethod
+    def _update(output: dict) -> dict:
+        """
+        Builds the state update of a run of the agent executor.
+
+        Args:
+            output (dict): The output of the agent executor.
+
+        Returns:
+            dict: The state update with the market analysis report, incomplete if the agent was stopped early.
+        """
+        update = {"market_analysis": output["output"], "history": ["insurance_agent"]}
+        return IncompleteUpdate(update) if output.get("stopped") else update
@@ -0,0 +1,210 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class KeywordIndex:
+    """
+    A local full-text index of document chunks, ranked with BM25, backed by SQLite FTS5.
+
+    It complements the vector store with exact term matching, e.g. of years, which embeddings match poorly.
+    The chunk metadata used for filtering (file name and year range) is kept in indexed columns, so that
+    filters are applied in the query rather than to its results.
+    Query terms found in most chunks carry almost no weight in BM25 but would make every chunk a match,
+    so they are left out of the query.
+    """
+
+    def __init__(self, path: str, max_document_frequency: float = 0.5):
+        """
+        Initializes a KeywordIndex instance, creating the database and tables if needed.
+
+        Args:
+            path (str): The path to the SQLite database file.
+            max_document_frequency (float, optional): The fraction of chunks above which a query term is
+                left out of the query, unless it is the rarest term. Defaults to 0.5.
+        """
+        self.path = path
+        self.max_document_frequency = max_document_frequency
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                file_name TEXT,
+                year_start INTEGER,
+                year_end INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS chunks_years ON chunks (year_start, year_end);
+            CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='rowid'
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, 'row');
+            -- Keep the full-text index in sync with the chunks table
+            CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+            """
+        )
+        self._connection.commit()
+
+    def add_documents(self, documents: list[Document]):
+        """
+        Adds documents to the index. Documents with an existing ID are replaced.
+
+        Args:
+            documents (list[Document]): The documents to add, with their `id` set.
+        """
+        with self._lock:
+            self._delete([doc.id for doc in documents])
+            self._connection.executemany(
+                "INSERT INTO chunks (id, text, metadata, file_name, year_start, year_end) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        doc.id,
+                        doc.page_content,
+                        json.dumps(doc.metadata),
+                        doc.metadata.get("file_name"),
+                        doc.metadata.get("year_start"),
+                        doc.metadata.get("year_end"),
+                    )
+                    for doc in documents
+                ],
+            )
+            self._connection.commit()
+
+    def delete(self, ids: list[str]):
+        """
+        Deletes the documents with the given IDs.
+
+        Args:
+            ids (list[str]): The IDs of the documents to delete.
+        """
+        with self._lock:
+            self._delete(ids)
+            self._connection.commit()
+
+    def _delete(self, ids: list[str]):
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            self._connection.execute(
+                f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            )
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        """
+        Checks which of the given IDs are in the index.
+
+        Args:
+            ids (list[str]): The IDs of the documents to check.
+
+        Returns:
+            set[str]: The subset of IDs that are in the index.
+        """
+        found = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start : start + 500]
+                rows = self._connection.execute(
+                    f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        start_year: int | None = None,
+        end_year: int | None = None,
+        source: str | None = None,
+    ) -> list[Document]:
+        """
+        Finds the documents that best match the terms of the query, ranked with BM25.
+
+        Any term of the query can match. Documents are only returned if they match the filters.
+
+        Args:
+            query (str): The query to search for.
+            k (int, optional): The number of results to return. Defaults to 4.
+            start_year (int | None, optional): Only match documents covering this year or later. Defaults to None.
+            end_year (int | None, optional): Only match documents covering this year or earlier. Defaults to None.
+            source (str | None, optional): Only match documents whose file name contains this text. Defaults to None.
+
+        Returns:
+            list[Document]: The matching documents, best match first.
+        """
+        terms = list(dict.fromkeys(_TOKEN_PATTERN.findall(query.lower())))
+        if not terms:
+            return []
+        with self._lock:
+            terms = self._selective_terms(terms)
+        if not terms:
+            return []
+        conditions = ["chunks_fts MATCH ?"]
+        parameters: list = [" OR ".join(f'"{term}"' for term in terms)]
+        if start_year is not None:
+            conditions.append("chunks.year_end >= ?")
+            parameters.append(start_year)
+        if end_year is not None:
+            conditions.append("chunks.year_start <= ?")
+            parameters.append(end_year)
+        if source:
+            conditions.append("chunks.file_name LIKE ?")
+            parameters.append(f"%{source}%")
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chunks.id, chunks.text, chunks.metadata FROM chunks_fts "
+                "JOIN chunks ON chunks.rowid = chunks_fts.rowid "
+                f"WHERE {' AND '.join(conditions)} ORDER BY bm25(chunks_fts) LIMIT ?",
+                [*parameters, k],
+            ).fetchall()
+        return [
+            Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+            for doc_id, text, metadata in rows
+        ]
+
+    def _selective_terms(self, terms: list[str]) -> list[str]:
+        """
+        Selects the query terms worth matching, from their document frequencies.
+
+        Args:
+            terms (list[str]): The query terms.
+
+        Returns:
+            list[str]: The terms found in at most `max_document_frequency` of the chunks, or else the rarest term.
+                Terms found in no chunk are left out.
+        """
+        frequencies = dict(
+            self._connection.execute(
+                f"SELECT term, doc FROM chunks_vocab WHERE term IN ({','.join('?' * len(terms))})",
+                terms,
+            ).fetchall()
+        )
+        if not frequencies:
+            return []
+        total = self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        selective = [
+            term
+            for term in terms
+            if term in frequencies and frequencies[term] <= self.max_document_frequency * total
+        ]
+        return selective or [min(frequencies, key=frequencies.get)]
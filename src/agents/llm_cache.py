@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+from src.agents.sqlite_cache import SqliteCache
+
+logger = logging.getLogger(__name__)
+
+# Message fields that are not sent to the model, and differ between otherwise identical conversations
+_UNSENT_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+class LLMResponseCache(BaseCache):
+    """
+    A persistent cache of chat model responses, backed by a local SQLite database.
+
+    Responses are keyed on a hash of the model and its parameters (including bound tools) and of the messages
+    sent, so that every call of a tool-calling agent, including the turns after tool results, is cached.
+    Entries expire after a time to live, and the least recently used entries are evicted when the cache is full.
+    Only models sampling at temperature 0 should use it, since a cached response is returned for every
+    identical call.
+
+    Set it as the cache of a chat model with `with_response_cache`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        ttl: float | None = 24 * 3600,
+        max_entries: int = 10_000,
+    ):
+        """
+        Initializes an LLMResponseCache instance, creating the database and table if needed.
+
+        Args:
+            path (str): The path to the SQLite database file.
+            namespace (str): The name of the cache, e.g. the agent using it. Each namespace has its own table,
+                size bound and counters.
+            ttl (float | None, optional): The number of seconds a response is reused for, or None for no expiry.
+                Defaults to a day.
+            max_entries (int, optional): The maximum number of cached responses. Defaults to 10000.
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.cache = SqliteCache(path, f"llm_responses_{namespace}", max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        """
+        Hashes a model call.
+
+        Args:
+            prompt (str): The serialized messages of the call.
+            llm_string (str): The serialized model and call parameters.
+
+        Returns:
+            str: The key of the call.
+        """
+        messages = json.loads(prompt)
+        for message in messages:
+            for field in _UNSENT_MESSAGE_FIELDS:
+                message.get("kwargs", {}).pop(field, None)
+        payload = json.dumps(messages, sort_keys=True) + "\0" + llm_string
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        cached = self.cache.get(self._key(prompt, llm_string))
+        entry = json.loads(cached) if cached is not None else None
+        if entry is None or (self.ttl is not None and time.time() - entry["created"] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug(f"LLM response cache hit ({self.namespace})")
+        return [
+            ChatGeneration(message=message, generation_info=generation["generation_info"])
+            for message, generation in zip(
+                messages_from_dict([generation["message"] for generation in entry["generations"]]),
+                entry["generations"],
+            )
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        generations = [
+            {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+            for generation in return_val
+        ]
+        entry = {"created": time.time(), "generations": generations}
+        self.cache.put(self._key(prompt, llm_string), json.dumps(entry).encode())
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the hit and miss counters of the cache. Expired responses count as misses.
+
+        Returns:
+            dict[str, float]: The number of hits and misses, and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def with_response_cache(llm: BaseChatModel, cache: BaseCache | None) -> BaseChatModel:
+    """
+    Copies a chat model to cache its responses.
+
+    Streamed calls bypass the cache of a chat model, so the copy has streaming disabled: its answers reach
+    the caller of a streamed graph run as single chunks.
+
+    Args:
+        llm (BaseChatModel): The chat model.
+        cache (BaseCache | None): The cache of its responses, or None to leave the model uncached.
+
+    Returns:
+        BaseChatModel: The cached copy of the model, or the model itself without a cache.
+    """
+    if cache is None:
+        return llm
+    return llm.model_copy(update={"cache": cache, "disable_streaming": True})
+
+
+def create_llm_caches(
+    path: str, agents: Sequence[str], ttl: float | None = 24 * 3600, max_entries: int = 10_000
+) -> dict[str, LLMResponseCache]:
+    """
+    Creates a response cache per agent, in a single database.
+
+    Args:
+        path (str): The path to the SQLite database file.
+        agents (Sequence[str]): The names of the agents whose responses are cached.
+        ttl (float | None, optional): The number of seconds a response is reused for, or None for no expiry.
+            Defaults to a day.
+        max_entries (int, optional): The maximum number of cached responses per agent. Defaults to 10000.
+
+    Returns:
+        dict[str, LLMResponseCache]: The cache of each agent.
+    """
+    return {agent: LLMResponseCache(path, agent, ttl, max_entries) for agent in agents}
@@ -0,0 +1,699 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Operators of the metadata filters, applied to a column of values. Missing values are NaN in numeric columns
+# and None in the others, and never match.
+_NUMERIC_COMPARISONS = {
+    "$lt": np.less,
+    "$lte": np.less_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+}
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value is not None and value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$ilike": lambda value, operand: isinstance(value, str)
+    and operand.strip("%").lower() in value.lower(),
+}
+
+# Number of candidates per result scored at full precision after a reduced-precision scan, by default:
+# the coarser the codes, the more candidates
+_RERANK_FACTORS = {"float16": 2, "int8": 4, "binary": 32}
+
+# Bytes of decoded float32 vectors per batch of a reduced-precision scan, so that a batch stays in the CPU caches:
+# decoding a larger batch costs more than the scan of float32 vectors
+_DECODED_BATCH_BYTES = 512 * 1024
+
+# Number of set bits of each byte, to count the differing bits of binary codes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def _hamming(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """
+    Counts the bits differing between binary codes and a query code.
+
+    Args:
+        codes (np.ndarray): The (rows, bytes) array of packed codes.
+        query_code (np.ndarray): The packed code of the query.
+
+    Returns:
+        np.ndarray: The Hamming distance of each code to the query.
+    """
+    if codes.shape[1] % 8:
+        return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+    # Codes of a multiple of 64 bits are counted 64 bits at a time (SWAR popcount)
+    words = np.bitwise_xor(np.ascontiguousarray(codes).view(np.uint64), query_code.view(np.uint64))
+    words -= (words >> np.uint64(1)) & np.uint64(0x5555555555555555)
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    words = (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+    return words.sum(axis=1, dtype=np.int32)
+
+
+class LocalVectorIndex:
+    """
+    A local, in-process vector index persisted to disk.
+
+    Vectors are L2-normalised and stored as a memory-mapped float32 array, so that cosine similarity
+    reduces to a dot product. Search is exact top-k by default. For large collections, an optional
+    IVF (inverted file) index clusters the vectors with k-means and only scores the vectors in the
+    `ivf_probes` clusters closest to the query.
+
+    With a reduced precision, the vectors are also stored as compact codes: float16 (2x smaller), int8 with
+    a scale per vector (4x smaller) or sign bits compared by Hamming distance (32x smaller). Searches scan
+    the codes only, then re-rank the best `rerank_factor` candidates per result with the float32 vectors, so that
+    only the few rows re-ranked are read from the float32 array, which is kept on disk next to the codes.
+    Codes are derived deterministically from the float32 vectors, and rebuilt from them when missing or stale.
+    The metadata file counts the writes to the index, and records the write each code file and the IVF index were
+    last updated at, since writes at one precision do not update the codes of the others.
+
+    It exposes the subset of the PGVector interface used by VectorStore, so it can be used as a drop-in
+    replacement that needs no database.
+    """
+
+    PRECISIONS = ("float32", "float16", "int8", "binary")
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str,
+        ivf_lists: int | None = None,
+        ivf_probes: int = 8,
+        ivf_min_rows: int = 10_000,
+        precision: str = "float32",
+        rerank_factor: int | None = None,
+    ):
+        """
+        Initializes a LocalVectorIndex instance, loading it from disk if it exists.
+
+        Args:
+            embeddings (Embeddings): The embeddings model used for documents and queries.
+            path (str): The directory where the index is persisted.
+            ivf_lists (int | None, optional): The number of IVF clusters, or None for exact search only. Defaults to None.
+            ivf_probes (int, optional): The number of IVF clusters scored per query. Defaults to 8.
+            ivf_min_rows (int, optional): The collection size from which IVF search is used. Defaults to 10000.
+            precision (str, optional): The precision of the scanned vectors, "float32", "float16", "int8" or
+                "binary". Defaults to "float32", for exact scores without re-ranking.
+            rerank_factor (int | None, optional): The number of candidates per result re-ranked at full
+                precision, or None for the default of the precision (2 for float16, 4 for int8, 32 for binary).
+
+        Raises:
+            ValueError: If the precision is unknown.
+        """
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.embeddings = embeddings
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.ivf_min_rows = ivf_min_rows
+        self.precision = precision
+        self.rerank_factor = rerank_factor or _RERANK_FACTORS.get(precision, 1)
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._docs_path = os.path.join(path, "docs.jsonl")
+        self._ivf_path = os.path.join(path, "ivf.npz")
+        self._meta_path = os.path.join(path, "meta.json")
+        suffix = {"float32": "f32", "float16": "f16", "int8": "i8", "binary": "bits"}[precision]
+        self._codes_path = os.path.join(path, f"vectors.{suffix}")
+        self._scales_path = os.path.join(path, "scales.f32")
+
+        self._dim = 0
+        # The number of writes to the index, and the write each derived file was last updated at
+        self._generation = 0
+        self._built: dict[str, int] = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self._dim = meta["dim"]
+            self._generation = meta.get("generation", 0)
+            self._built = meta.get("built", {})
+        self._docs: list[dict] = []
+        if os.path.exists(self._docs_path):
+            with open(self._docs_path, encoding="utf-8") as f:
+                self._docs = [json.loads(line) for line in f]
+        self._rows = {doc["id"]: row for row, doc in enumerate(self._docs)}
+        self._centroids: np.ndarray | None = None
+        self._assignments: np.ndarray | None = None
+        # Metadata values by key and row, built on first use by filters
+        self._columns: dict[tuple[str, bool], np.ndarray] = {}
+        self._vectors = self._map_vectors()
+        # Drop rows only partially written by an interrupted append
+        if len(self._docs) != len(self._vectors):
+            count = min(len(self._docs), len(self._vectors))
+            logger.warning(f"Truncating local vector index at {path} to {count} rows")
+            self._start_write()
+            self._rewrite(np.arange(count))
+            self._finish_write()
+        self._codes, self._scales = self._map_codes()
+        if self.precision != "float32" and (
+            len(self._codes) != len(self._docs) or self._built.get(self.precision) != self._generation
+        ):
+            self._rebuild_codes()
+            self._finish_write()
+        self._centroids, self._assignments = self._load_ivf()
+        logger.info(f"Loaded local vector index with {len(self._docs)} vectors from {path}")
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _save_meta(self):
+        with open(f"{self._meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "generation": self._generation, "built": self._built}, f)
+        os.replace(f"{self._meta_path}.tmp", self._meta_path)
+
+    def _start_write(self):
+        """
+        Counts a write to the index, marking the code files and the IVF index stale until it completes.
+        """
+        self._generation += 1
+        self._save_meta()
+
+    def _finish_write(self):
+        """
+        Records that the codes of the current precision and the loaded IVF index are up to date.
+        """
+        if self.precision != "float32":
+            self._built[self.precision] = self._generation
+        if self._centroids is not None:
+            self._built["ivf"] = self._generation
+        self._save_meta()
+
+    def _map_vectors(self) -> np.ndarray:
+        """
+        Memory-maps the vectors file.
+
+        Returns:
+            np.ndarray: The (rows, dimensions) array of normalised vectors.
+        """
+        if not self._dim or not os.path.exists(self._vectors_path):
+            return np.empty((0, self._dim), dtype=np.float32)
+        rows = os.path.getsize(self._vectors_path) // (4 * self._dim)
+        if rows == 0:
+            return np.empty((0, self._dim), dtype=np.float32)
+        return np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim)
+        )
+
+    def _encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Encodes normalised vectors at the reduced precision.
+
+        Args:
+            vectors (np.ndarray): The (rows, dimensions) array of normalised float32 vectors.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray | None]: The codes, and the scale of each vector for int8 codes.
+        """
+        if self.precision == "float16":
+            return vectors.astype(np.float16), None
+        if self.precision == "int8":
+            # Symmetric quantisation of each vector to [-127, 127]
+            scales = np.abs(vectors).max(axis=1, initial=0) / 127
+            scales[scales == 0] = 1
+            return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), None
+
+    def _map_codes(self) -> tuple[np.ndarray | None, np.ndarray | None]:
+        """
+        Memory-maps the codes file of the reduced precision.
+
+        Returns:
+            tuple[np.ndarray | None, np.ndarray | None]: The (rows, width) array of codes and the scale of each
+                vector for int8 codes, or the float32 vectors at full precision.
+        """
+        if self.precision == "float32":
+            return self._vectors, None
+        dtype = {"float16": np.float16, "int8": np.int8, "binary": np.uint8}[self.precision]
+        width = (self._dim + 7) // 8 if self.precision == "binary" else self._dim
+        if not width or not os.path.exists(self._codes_path):
+            return np.empty((0, width), dtype=dtype), None
+        rows = os.path.getsize(self._codes_path) // (np.dtype(dtype).itemsize * width)
+        if rows == 0:
+            return np.empty((0, width), dtype=dtype), None
+        codes = np.memmap(self._codes_path, dtype=dtype, mode="r", shape=(rows, width))
+        scales = None
+        if self.precision == "int8":
+            scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        return codes, scales
+
+    def _write_codes(self, vectors: np.ndarray, mode: str):
+        """
+        Encodes vectors and writes their codes.
+
+        Args:
+            vectors (np.ndarray): The normalised float32 vectors.
+            mode (str): The file mode, "ab" to append the codes or "wb" to replace them.
+        """
+        codes, scales = self._encode(vectors)
+        with open(self._codes_path, mode) as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self._scales_path, mode) as f:
+                f.write(scales.tobytes())
+
+    def _rebuild_codes(self, batch_size: int = 65_536):
+        """
+        Encodes all the float32 vectors again, e.g. after their rows changed or when switching precision.
+
+        Args:
+            batch_size (int, optional): The number of vectors encoded at once. Defaults to 65536.
+        """
+        if self.precision == "float32":
+            self._codes = self._vectors
+            return
+        logger.info(f"Encoding {len(self._vectors)} vectors at {self.precision} precision")
+        # Release the memory maps before replacing the files they map
+        self._codes, self._scales = None, None
+        self._write_codes(np.empty((0, self._dim), dtype=np.float32), "wb")
+        for start in range(0, len(self._vectors), batch_size):
+            self._write_codes(np.asarray(self._vectors[start : start + batch_size]), "ab")
+        self._codes, self._scales = self._map_codes()
+
+    def _load_ivf(self) -> tuple[np.ndarray | None, np.ndarray | None]:
+        if self.ivf_lists and os.path.exists(self._ivf_path) and self._built.get("ivf") == self._generation:
+            data = np.load(self._ivf_path)
+            if len(data["assignments"]) == len(self._docs):
+                return data["centroids"], data["assignments"]
+        return None, None
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_documents(self, documents: list[Document], ids: list[str]) -> list[str]:
+        """
+        Embeds and adds documents to the index. Documents with an existing ID are replaced.
+
+        Args:
+            documents (list[Document]): The documents to add.
+            ids (list[str]): The IDs of the documents.
+
+        Returns:
+            list[str]: The IDs of the added documents.
+        """
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        return self.add_embeddings(documents, vectors, ids)
+
+    async def aadd_documents(self, documents: list[Document], ids: list[str]) -> list[str]:
+        """
+        Asynchronously embeds and adds documents to the index.
+
+        This is the async counterpart of `add_documents`. The embeddings are awaited, and the index files
+        are written in a worker thread.
+
+        Args:
+            documents (list[Document]): The documents to add.
+            ids (list[str]): The IDs of the documents.
+
+        Returns:
+            list[str]: The IDs of the added documents.
+        """
+        vectors = await self.embeddings.aembed_documents([doc.page_content for doc in documents])
+        return await asyncio.to_thread(self.add_embeddings, documents, vectors, ids)
+
+    def add_embeddings(
+        self, documents: list[Document], vectors: list[list[float]], ids: list[str]
+    ) -> list[str]:
+        """
+        Adds documents with precomputed vectors to the index. Documents with an existing ID are replaced.
+
+        Args:
+            documents (list[Document]): The documents to add.
+            vectors (list[list[float]]): The vectors of the documents.
+            ids (list[str]): The IDs of the documents.
+
+        Returns:
+            list[str]: The IDs of the added documents.
+        """
+        array = self._normalise(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._dim = self._dim or array.shape[1]
+            self._start_write()
+            self._delete(ids)
+            with open(self._vectors_path, "ab") as f:
+                f.write(array.tobytes())
+            if self.precision != "float32":
+                self._write_codes(array, "ab")
+            with open(self._docs_path, "a", encoding="utf-8") as f:
+                for doc, doc_id in zip(documents, ids):
+                    record = {
+                        "id": doc_id,
+                        "page_content": doc.page_content,
+                        "metadata": doc.metadata,
+                    }
+                    self._rows[doc_id] = len(self._docs)
+                    self._docs.append(record)
+                    f.write(json.dumps(record) + "\n")
+            self._vectors = self._map_vectors()
+            self._codes, self._scales = self._map_codes()
+            self._columns = {}
+            if self._centroids is not None:
+                self._assignments = np.concatenate(
+                    [self._assignments, self._assign(array)]
+                )
+                self._save_ivf()
+            self._finish_write()
+        return ids
+
+    def get_by_ids(self, ids: list[str]) -> list[Document]:
+        """
+        Gets the documents with the given IDs.
+
+        Args:
+            ids (list[str]): The IDs of the documents.
+
+        Returns:
+            list[Document]: The documents found in the index.
+        """
+        return [self._document(self._rows[doc_id]) for doc_id in ids if doc_id in self._rows]
+
+    def delete(self, ids: list[str]):
+        """
+        Deletes the documents with the given IDs from the index.
+
+        Args:
+            ids (list[str]): The IDs of the documents.
+        """
+        with self._lock:
+            self._start_write()
+            self._delete(ids)
+            self._finish_write()
+
+    def _delete(self, ids: list[str]):
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        if rows:
+            keep = np.ones(len(self._docs), dtype=bool)
+            keep[rows] = False
+            self._rewrite(np.flatnonzero(keep))
+
+    def _rewrite(self, keep: np.ndarray):
+        """
+        Compacts the index on disk, keeping only the given rows.
+
+        Args:
+            keep (np.ndarray): The rows to keep, in order.
+        """
+        vectors = np.array(self._vectors[keep])
+        self._docs = [self._docs[row] for row in keep]
+        self._rows = {doc["id"]: row for row, doc in enumerate(self._docs)}
+        if self._assignments is not None:
+            self._assignments = self._assignments[keep]
+        # Release the memory maps before replacing the files they map
+        self._vectors = np.empty((0, self._dim), dtype=np.float32)
+        self._codes, self._scales = None, None
+        with open(f"{self._vectors_path}.tmp", "wb") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        with open(f"{self._docs_path}.tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(doc) + "\n" for doc in self._docs)
+        os.replace(f"{self._vectors_path}.tmp", self._vectors_path)
+        os.replace(f"{self._docs_path}.tmp", self._docs_path)
+        self._vectors = self._map_vectors()
+        self._rebuild_codes()
+        self._columns = {}
+        if self._centroids is not None:
+            self._save_ivf()
+
+    def _document(self, row: int) -> Document:
+        record = self._docs[row]
+        return Document(
+            id=record["id"],
+            page_content=record["page_content"],
+            metadata=record["metadata"],
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: dict | None = None
+    ) -> list[Document]:
+        """
+        Finds the documents most similar to the query, by cosine similarity.
+
+        Args:
+            query (str): The query to search for.
+            k (int, optional): The number of results to return. Defaults to 4.
+            filter (dict | None, optional): A metadata filter (see `_filter_mask`). Defaults to None.
+
+        Returns:
+            list[Document]: The matching documents, most similar first.
+        """
+        return self.similarity_search_by_vector(
+            self.embeddings.embed_query(query), k=k, filter=filter
+        )
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, filter: dict | None = None
+    ) -> list[Document]:
+        """
+        Asynchronously finds the documents most similar to the query, by cosine similarity.
+
+        Only the query embedding is awaited, since scoring is local and fast.
+
+        Args:
+            query (str): The query to search for.
+            k (int, optional): The number of results to return. Defaults to 4.
+            filter (dict | None, optional): A metadata filter (see `_filter_mask`). Defaults to None.
+
+        Returns:
+            list[Document]: The matching documents, most similar first.
+        """
+        embedding = await self.embeddings.aembed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None
+    ) -> list[Document]:
+        """
+        Finds the documents most similar to the given vector, by cosine similarity.
+
+        Args:
+            embedding (list[float]): The query vector.
+            k (int, optional): The number of results to return. Defaults to 4.
+            filter (dict | None, optional): A metadata filter (see `_filter_mask`). Defaults to None.
+
+        Returns:
+            list[Document]: The matching documents, most similar first.
+        """
+        return [self._document(row) for row, _ in self._search(embedding, k, filter)]
+
+    def _search(
+        self, embedding: list[float], k: int, filter: dict | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        Finds the rows most similar to the given vector.
+
+        With a filter, only the matching rows are scored, exhaustively. At a reduced precision, the rows are
+        scored on their codes, and the best candidates are re-ranked with their float32 vectors.
+
+        Args:
+            embedding (list[float]): The query vector.
+            k (int): The number of results to return.
+            filter (dict | None, optional): A metadata filter (see `_filter_mask`). Defaults to None.
+
+        Returns:
+            list[tuple[int, float]]: The rows and their cosine similarity, most similar first.
+        """
+        if len(self._docs) == 0 or k <= 0:
+            return []
+        query = self._normalise(np.asarray([embedding], dtype=np.float32))[0]
+        if filter:
+            candidates = np.flatnonzero(self._filter_mask(filter))
+            if len(candidates) == 0:
+                return []
+        else:
+            candidates = self._candidates(query)
+        if self.precision == "float32":
+            vectors = self._vectors if candidates is None else self._vectors[candidates]
+            return self._top(vectors @ query, candidates, k)
+        shortlist = self._top(self._code_scores(query, candidates), candidates, k * self.rerank_factor)
+        # Rows read in file order
+        rows = np.sort(np.array([row for row, _ in shortlist], dtype=np.int64))
+        return self._top(self._vectors[rows] @ query, rows, k)
+
+    @staticmethod
+    def _top(scores: np.ndarray, rows: np.ndarray | None, k: int) -> list[tuple[int, float]]:
+        """
+        Selects the best scores.
+
+        Args:
+            scores (np.ndarray): The scores.
+            rows (np.ndarray | None): The row of each score, or None if the scores are of all rows.
+            k (int): The number of results.
+
+        Returns:
+            list[tuple[int, float]]: The rows and their scores, best first.
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        rows = top if rows is None else rows[top]
+        return [(int(row), float(score)) for row, score in zip(rows, scores[top])]
+
+    def _code_scores(
+        self, query: np.ndarray, rows: np.ndarray | None, batch_size: int | None = None
+    ) -> np.ndarray:
+        """
+        Scores rows on their reduced-precision codes, a batch at a time, so that only the codes are read in full.
+
+        Args:
+            query (np.ndarray): The normalised query vector.
+            rows (np.ndarray | None): The rows to score, or None for all rows.
+            batch_size (int | None, optional): The number of rows decoded at once, or None for as many as fit
+                in the CPU caches once decoded. Defaults to None.
+
+        Returns:
+            np.ndarray: The approximate scores of the rows: cosine similarities, or the opposite of the Hamming
+                distances for binary codes.
+        """
+        count = len(self._codes) if rows is None else len(rows)
+        # Binary codes are compared without decoding them
+        row_bytes = self._codes.shape[1] if self.precision == "binary" else 4 * self._dim
+        batch_size = batch_size or max(1, _DECODED_BATCH_BYTES // row_bytes)
+        if self.precision == "binary":
+            query_code = np.packbits(query > 0)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, batch_size):
+            batch = slice(start, min(start + batch_size, count))
+            selection = batch if rows is None else rows[batch]
+            codes = self._codes[selection]
+            if self.precision == "binary":
+                scores[batch] = -_hamming(codes, query_code)
+            else:
+                scores[batch] = codes.astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales if rows is None else self._scales[rows]
+        return scores
+
+    def _column(self, key: str, numeric: bool) -> np.ndarray:
+        """
+        Gets the metadata values of a key for all rows, caching them until the index changes.
+
+        Args:
+            key (str): The metadata key.
+            numeric (bool): Whether to return the values as floats, with NaN for missing and non-numeric values.
+
+        Returns:
+            np.ndarray: The values, by row.
+        """
+        column = self._columns.get((key, numeric))
+        if column is None:
+            values = [doc["metadata"].get(key) for doc in self._docs]
+            if numeric:
+                column = np.array(
+                    [
+                        value if isinstance(value, (int, float)) else np.nan
+                        for value in values
+                    ],
+                    dtype=np.float64,
+                )
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+            self._columns[(key, numeric)] = column
+        return column
+
+    def _filter_mask(self, filter: dict) -> np.ndarray:
+        """
+        Evaluates a metadata filter over all rows.
+
+        Filters use the subset of the PGVector filter syntax used by VectorStore: {"key": {"$op": operand}} with
+        comparison, "$in" and "$ilike" (as a substring match) operators, a plain value for equality,
+        and "$and" of several filters. Comparisons are vectorised over cached metadata columns.
+
+        Args:
+            filter (dict): The filter.
+
+        Returns:
+            np.ndarray: The boolean mask of the matching rows.
+        """
+        mask = np.ones(len(self._docs), dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator in _NUMERIC_COMPARISONS:
+                    with np.errstate(invalid="ignore"):
+                        mask &= _NUMERIC_COMPARISONS[operator](self._column(key, True), operand)
+                else:
+                    compare = _COMPARISONS[operator]
+                    mask &= np.fromiter(
+                        (compare(value, operand) for value in self._column(key, False)),
+                        dtype=bool,
+                        count=len(self._docs),
+                    )
+        return mask
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray | None:
+        """
+        Selects the rows to score for a query using the IVF index, building it if needed.
+
+        Args:
+            query (np.ndarray): The normalised query vector.
+
+        Returns:
+            np.ndarray | None: The candidate rows, or None to score all rows.
+        """
+        if not self.ivf_lists or len(self._docs) < self.ivf_min_rows:
+            return None
+        with self._lock:
+            if self._centroids is None:
+                self._build_ivf()
+        nearest = np.argsort(-(self._centroids @ query))[: self.ivf_probes]
+        return np.flatnonzero(np.isin(self._assignments, nearest))
+
+    def _build_ivf(self, iterations: int = 10, sample_size: int = 50_000):
+        """
+        Clusters the vectors with spherical k-means and assigns every row to its nearest centroid.
+
+        Args:
+            iterations (int, optional): The number of k-means iterations. Defaults to 10.
+            sample_size (int, optional): The number of vectors used to train the centroids. Defaults to 50000.
+        """
+        logger.info(f"Building IVF index with {self.ivf_lists} lists over {len(self._docs)} vectors")
+        rng = np.random.default_rng(0)
+        sample = self._vectors[
+            np.sort(rng.choice(len(self._docs), min(sample_size, len(self._docs)), replace=False))
+        ]
+        lists = min(self.ivf_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(lists):
+                members = sample[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = self._normalise(centroids)
+        self._centroids = centroids
+        self._assignments = self._assign(self._vectors)
+        self._save_ivf()
+        self._built["ivf"] = self._generation
+        self._save_meta()
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65_536) -> np.ndarray:
+        return np.concatenate(
+            [
+                np.argmax(vectors[start : start + batch_size] @ self._centroids.T, axis=1)
+                for start in range(0, len(vectors), batch_size)
+            ]
+            or [np.empty(0, dtype=np.int64)]
+        )
+
+    def _save_ivf(self):
+        np.savez(self._ivf_path, centroids=self._centroids, assignments=self._assignments)
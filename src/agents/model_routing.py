@@ -0,0 +1,469 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.language_models.base import LangSmithParams
+from langchain_core.messages import AIMessageChunk, BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_openai import ChatOpenAI
+from pydantic import PrivateAttr
+
+from src.agents.openai_scheduler import CancelScope, OpenAIScheduler, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("openai", "anthropic")
+
+# Anthropic requires a model and a maximum number of output tokens
+_ANTHROPIC_DEFAULT_MODEL = "claude-3-5-haiku-latest"
+_ANTHROPIC_DEFAULT_MAX_TOKENS = 1024
+
+
+@dataclass
+class ModelConfig:
+    """
+    The model of an agent, optionally hedged by a second model.
+
+    Unset fields fall back to the provider's defaults, and the temperature to the agent's.
+    """
+
+    provider: str = "openai"
+    model: str | None = None
+    temperature: float | None = None
+    max_tokens: int | None = None
+    timeout: float | None = None
+    """The deadline of each call in seconds, including the time queued by the scheduler, the rate limit pauses and
+    the retries. Each HTTP attempt is also bounded by it."""
+    hedge: "ModelConfig | None" = None
+    """The model of the hedged requests, e.g. another provider, or None to disable hedging."""
+    hedge_quantile: float = 0.95
+    """The latency quantile of the model after which a hedged request is sent."""
+
+    @classmethod
+    def from_dict(cls, values: dict[str, Any]) -> "ModelConfig":
+        """
+        Creates a ModelConfig from a dict, e.g. parsed from JSON.
+
+        Args:
+            values (dict[str, Any]): The fields of the config, with the hedge config as a dict.
+
+        Returns:
+            ModelConfig: The config.
+        """
+        hedge = values.get("hedge")
+        return cls(**{**values, "hedge": cls.from_dict(hedge) if hedge is not None else None})
+
+
+def load_model_configs(path: str) -> dict[str, ModelConfig]:
+    """
+    Loads the model configs of the agents from a JSON file mapping agent names to configs.
+
+    Args:
+        path (str): The path to the JSON file.
+
+    Returns:
+        dict[str, ModelConfig]: The model config of each agent in the file.
+    """
+    with open(path) as f:
+        return {agent: ModelConfig.from_dict(values) for agent, values in json.load(f).items()}
+
+
+def _create_model(
+    config: ModelConfig, temperature: float, scheduler: OpenAIScheduler | None
+) -> BaseChatModel:
+    """
+    Creates the chat model of a config, without hedging.
+
+    Args:
+        config (ModelConfig): The model config.
+        temperature (float): The temperature if the config does not set one.
+        scheduler (OpenAIScheduler | None): The scheduler of OpenAI requests, or None for the process-wide one.
+
+    Returns:
+        BaseChatModel: The chat model.
+
+    Raises:
+        ValueError: If the provider is unknown.
+    """
+    temperature = temperature if config.temperature is None else config.temperature
+    if config.provider == "openai":
+        model_kwargs = {"model": config.model} if config.model else {}
+        return ChatOpenAI(
+            temperature=temperature,
+            max_tokens=config.max_tokens,
+            timeout=config.timeout,
+            # Report token usage for streamed outputs too (the agent executor streams LLM calls)
+            stream_usage=True,
+            **model_kwargs,
+            **(scheduler or get_scheduler()).client_kwargs(),
+        )
+    if config.provider == "anthropic":
+        # Only loaded by the runs that use it
+        from langchain_anthropic import ChatAnthropic
+
+        return ChatAnthropic(
+            model=config.model or _ANTHROPIC_DEFAULT_MODEL,
+            temperature=temperature,
+            max_tokens=config.max_tokens or _ANTHROPIC_DEFAULT_MAX_TOKENS,
+            default_request_timeout=config.timeout,
+        )
+    raise ValueError(f"Unknown model provider: {config.provider}")
+
+
+def create_chat_model(
+    config: ModelConfig, temperature: float, scheduler: OpenAIScheduler | None = None
+) -> BaseChatModel:
+    """
+    Creates the chat model of an agent from its config.
+
+    Args:
+        config (ModelConfig): The model config.
+        temperature (float): The temperature of the agent, if the config does not set one.
+        scheduler (OpenAIScheduler | None, optional): The scheduler of OpenAI requests.
+            Defaults to the process-wide scheduler.
+
+    Returns:
+        BaseChatModel: The chat model, hedged if the config has a hedge model.
+    """
+    model = _create_model(config, temperature, scheduler)
+    if config.hedge is not None:
+        hedge_temperature = temperature if config.temperature is None else config.temperature
+        hedge = _create_model(config.hedge, hedge_temperature, scheduler)
+        if config.hedge.timeout is not None:
+            hedge = DeadlineChatModel(model=hedge, timeout=config.hedge.timeout)
+        model = HedgedChatModel(primary=model, hedge=hedge, quantile=config.hedge_quantile)
+    if config.timeout is not None:
+        model = DeadlineChatModel(model=model, timeout=config.timeout)
+    return model
+
+
+# The wrapped models run without the callbacks of the call, which are notified once, by the wrapping model
+_DETACHED: RunnableConfig = {"callbacks": []}
+
+
+def _bind_call(model: BaseChatModel, kwargs: dict[str, Any]) -> Runnable[LanguageModelInput, BaseMessage]:
+    """
+    Binds the call arguments of a wrapping model to the wrapped model, converting the bound tools to its format.
+
+    Args:
+        model (BaseChatModel): The wrapped model.
+        kwargs (dict[str, Any]): The call arguments, e.g. the OpenAI-format tools bound by the agent.
+
+    Returns:
+        Runnable[LanguageModelInput, BaseMessage]: The model with the arguments bound.
+    """
+    kwargs = dict(kwargs)
+    tools = kwargs.pop("tools", None)
+    if tools:
+        try:
+            model = model.bind_tools(tools)
+        except NotImplementedError:
+            # Models without tool conversion (e.g. the fakes of the benchmarks) take OpenAI-format tools
+            kwargs["tools"] = tools
+    return model.bind(**kwargs) if kwargs else model
+
+
+def _to_chunk(message: BaseMessage) -> ChatGenerationChunk:
+    """
+    Wraps a message in a generation chunk, e.g. the whole answer of a model that does not stream.
+
+    Args:
+        message (BaseMessage): The message or message chunk.
+
+    Returns:
+        ChatGenerationChunk: The generation chunk.
+    """
+    if not isinstance(message, BaseMessageChunk):
+        message = AIMessageChunk(**message.model_dump(exclude={"type"}))
+    return ChatGenerationChunk(message=message)
+
+
+class DeadlineChatModel(BaseChatModel):
+    """
+    A chat model bounding the whole duration of each call of another model.
+
+    Unlike the timeout of the HTTP client, which bounds each attempt, the deadline also covers the time the call
+    is queued by the scheduler, the rate limit pauses and the retries. Async calls are cancelled at the deadline.
+    Sync calls stop waiting at the deadline, while the call completes in the background, and sync streams check
+    the deadline between chunks.
+    """
+
+    model: BaseChatModel
+    """The bounded model."""
+    timeout: float
+    """The deadline of each call, in seconds."""
+
+    @classmethod
+    def is_lc_serializable(cls) -> bool:
+        # Serialized with its model, so that caches and fingerprints depend on it
+        return True
+
+    @classmethod
+    def get_lc_namespace(cls) -> list[str]:
+        return ["src", "agents", "model_routing"]
+
+    @property
+    def _llm_type(self) -> str:
+        return "deadline-chat"
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any) -> LangSmithParams:
+        # Traced and priced as the bounded model
+        return self.model._get_ls_params(stop=stop, **kwargs)
+
+    def _expired(self) -> TimeoutError:
+        return TimeoutError(f"Chat model call exceeded its deadline of {self.timeout}s")
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        executor = ContextThreadPoolExecutor(max_workers=1)
+        try:
+            request = executor.submit(_bind_call(self.model, kwargs).invoke, messages, _DETACHED, stop=stop)
+            message = request.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise self._expired() from None
+        finally:
+            executor.shutdown(wait=False)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        try:
+            async with asyncio.timeout(self.timeout):
+                message = await _bind_call(self.model, kwargs).ainvoke(messages, _DETACHED, stop=stop)
+        except TimeoutError:
+            raise self._expired() from None
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        deadline = time.monotonic() + self.timeout
+        for chunk in _bind_call(self.model, kwargs).stream(messages, _DETACHED, stop=stop):
+            if time.monotonic() > deadline:
+                raise self._expired()
+            yield _to_chunk(chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        chunks = _bind_call(self.model, kwargs).astream(messages, _DETACHED, stop=stop)
+        try:
+            while True:
+                try:
+                    # Each chunk is awaited outside of the consumer's code, for the rest of the deadline
+                    chunk = await asyncio.wait_for(anext(chunks), max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    raise self._expired() from None
+                yield _to_chunk(chunk)
+        finally:
+            await chunks.aclose()
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    A chat model sending a second, hedged request when the first one is slower than usual.
+
+    The hedged request is sent once the first one has run for a quantile of the recent latencies of the model
+    (a fixed delay until enough latencies are known), to the hedge model, e.g. another provider. The first
+    response wins, and the other request is cancelled. Sync calls cannot interrupt a losing request already waiting
+    for its response: for models sending their requests through an OpenAIScheduler, its response is closed when it
+    arrives, without being read, and a losing request not sent yet is not sent (see `CancelScope`). Otherwise it
+    completes in the background.
+    Answers are not streamed: streamed calls get the winning answer as a single chunk. The traced LLM call is
+    the hedged call as a whole, reporting the token usage of the winning response.
+    """
+
+    primary: BaseChatModel
+    """The model of the first request."""
+    hedge: BaseChatModel
+    """The model of the hedged request."""
+    quantile: float = 0.95
+    """The latency quantile after which the hedged request is sent."""
+    initial_delay: float = 10.0
+    """The delay of the hedged request in seconds until `min_samples` latencies are known."""
+    min_samples: int = 20
+    """The number of latencies needed to use their quantile."""
+    window: int = 200
+    """The number of recent latencies kept."""
+
+    _latencies: deque = PrivateAttr(default_factory=deque)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict[str, int] = PrivateAttr(default_factory=lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0})
+
+    @classmethod
+    def is_lc_serializable(cls) -> bool:
+        # Serialized with its models, so that caches and fingerprints depend on them
+        return True
+
+    @classmethod
+    def get_lc_namespace(cls) -> list[str]:
+        return ["src", "agents", "model_routing"]
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat"
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any) -> LangSmithParams:
+        # Traced and priced as the primary model
+        return self.primary._get_ls_params(stop=stop, **kwargs)
+
+    def hedge_delay(self) -> float:
+        """
+        Returns the time after which a hedged request is sent.
+
+        Returns:
+            float: The latency quantile of the recent calls, in seconds, or the initial delay.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(self.quantile * len(latencies)))]
+
+    def _record(self, latency: float, hedged: bool, hedge_won: bool):
+        with self._lock:
+            self._latencies.append(latency)
+            while len(self._latencies) > self.window:
+                self._latencies.popleft()
+            self._stats["calls"] += 1
+            self._stats["hedged"] += hedged
+            self._stats["hedge_wins"] += hedge_won
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters of the hedged calls.
+
+        Returns:
+            dict[str, float]: The number of calls, of hedged requests and of hedged requests that won,
+                and the current hedge delay in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "hedge_delay": self.hedge_delay()}
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.monotonic()
+        executor = ContextThreadPoolExecutor(max_workers=2)
+        scopes = {}
+
+        def submit(model: BaseChatModel) -> concurrent.futures.Future:
+            scope = CancelScope()
+            request = executor.submit(scope.run, _bind_call(model, kwargs).invoke, messages, _DETACHED, stop=stop)
+            scopes[request] = scope
+            return request
+
+        first = submit(self.primary)
+        requests = {first}
+        hedged = False
+        try:
+            done, _ = concurrent.futures.wait(requests, timeout=self.hedge_delay())
+            if not done:
+                logger.info(f"Hedging a chat model call after {time.monotonic() - start:.2f}s")
+                hedged = True
+                requests.add(submit(self.hedge))
+            while True:
+                done, pending = concurrent.futures.wait(requests, return_when=concurrent.futures.FIRST_COMPLETED)
+                winner = next((request for request in done if request.exception() is None), None)
+                # A failed request is only fatal if the other one failed too
+                if winner is not None or not pending:
+                    break
+                requests = pending
+        finally:
+            # Abandon the losing request, or both if the call itself failed
+            for request in requests:
+                scopes[request].cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+        if winner is None:
+            raise next(iter(done)).exception()
+        self._record(time.monotonic() - start, hedged=hedged, hedge_won=winner is not first)
+        return ChatResult(generations=[ChatGeneration(message=winner.result())])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        start = time.monotonic()
+        first = asyncio.ensure_future(_bind_call(self.primary, kwargs).ainvoke(messages, _DETACHED, stop=stop))
+        requests = {first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(requests, timeout=self.hedge_delay())
+            if not done:
+                logger.info(f"Hedging a chat model call after {time.monotonic() - start:.2f}s")
+                hedged = True
+                requests.add(asyncio.ensure_future(_bind_call(self.hedge, kwargs).ainvoke(messages, _DETACHED, stop=stop)))
+            while True:
+                done, pending = await asyncio.wait(requests, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((request for request in done if request.exception() is None), None)
+                # A failed request is only fatal if the other one failed too
+                if winner is not None or not pending:
+                    break
+                requests = pending
+        finally:
+            # Cancel the losing request, or both if the call itself is cancelled
+            for request in requests:
+                request.cancel()
+        if winner is None:
+            raise next(iter(done)).exception()
+        self._record(time.monotonic() - start, hedged=hedged, hedge_won=winner is not first)
+        return ChatResult(generations=[ChatGeneration(message=winner.result())])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield _to_chunk(self._generate(messages, stop=stop, **kwargs).generations[0].message)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        result = await self._agenerate(messages, stop=stop, **kwargs)
+        yield _to_chunk(result.generations[0].message)
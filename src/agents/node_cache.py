@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from langchain_core.load import dumpd
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.agents.agent_state import AgentState, IncompleteUpdate
+from src.agents.sqlite_cache import SqliteCache
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """
+    A checkpointer saving the state of graph runs to a local SQLite database, for sync and async runs.
+
+    SqliteSaver only implements the sync interface (AsyncSqliteSaver only the async one), while the graph is run
+    both ways. Checkpoints are small and local, so the async interface runs the sync one in a worker thread.
+    The database also keeps the latest run of each query, so that finding the run to resume is a single lookup.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes a SqliteCheckpointer instance, creating the database if needed.
+
+        Args:
+            path (str): The path to the SQLite database file.
+        """
+        # The saver serializes access to the connection with a lock
+        super().__init__(sqlite3.connect(path, check_same_thread=False))
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS latest_runs (query_key TEXT PRIMARY KEY, run INTEGER NOT NULL)"
+            )
+            self.conn.commit()
+
+    def latest_run(self, query_key: str) -> int | None:
+        """
+        Gets the number of the latest run of a query.
+
+        Args:
+            query_key (str): The key of the query, e.g. its hash.
+
+        Returns:
+            int | None: The number of the latest run, or None if the query never ran.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT run FROM latest_runs WHERE query_key = ?", (query_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_latest_run(self, query_key: str, run: int):
+        """
+        Records the number of the latest run of a query.
+
+        Args:
+            query_key (str): The key of the query, e.g. its hash.
+            run (int): The number of the run.
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO latest_runs (query_key, run) VALUES (?, ?)", (query_key, run)
+            )
+            self.conn.commit()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+
+class NodeCache:
+    """
+    Memoises the outputs of graph nodes by a hash of their inputs, in a persistent cache.
+
+    The key of an output is the hash of the node name, the state fields the node reads, and a fingerprint of
+    the node's prompt and model configuration, so that changing a node's prompt only invalidates that node.
+    The state update returned by the node is cached, and returned again by later runs with the same key, unless
+    it is an IncompleteUpdate. Outputs that depend on data other than the state (e.g. the documents in the vector
+    store) are not invalidated when that data changes, so entries expire after a time to live.
+    """
+
+    def __init__(self, path: str, ttl: float | None = 24 * 3600, max_entries: int = 10_000):
+        """
+        Initializes a NodeCache instance.
+
+        Args:
+            path (str): The path to the SQLite database file.
+            ttl (float | None, optional): The number of seconds an output is reused for, or None for no expiry.
+                Defaults to a day.
+            max_entries (int, optional): The maximum number of cached outputs. Defaults to 10000.
+        """
+        self.ttl = ttl
+        self.cache = SqliteCache(path, "node_updates", max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(*components: Any) -> str:
+        """
+        Hashes the configuration of a node, e.g. its prompt template and model.
+
+        Args:
+            *components: The runnables (or any other serializable objects) the node output depends on.
+
+        Returns:
+            str: The fingerprint.
+        """
+        serialized = json.dumps([dumpd(component) for component in components], sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    @staticmethod
+    def _key(name: str, fingerprint: str, inputs: Sequence[str], state: AgentState) -> str:
+        payload = {
+            "node": name,
+            "fingerprint": fingerprint,
+            "inputs": {field: state.get(field) for field in inputs},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def wrap(
+        self,
+        name: str,
+        func: Callable[..., dict],
+        afunc: Callable[..., Any],
+        inputs: Sequence[str],
+        fingerprint: str,
+    ) -> RunnableLambda:
+        """
+        Wraps the sync and async implementations of a node with memoisation.
+
+        Args:
+            name (str): The name of the node.
+            func (Callable[..., dict]): The sync implementation, taking the state and returning a state update.
+            afunc (Callable[..., Any]): The async implementation, taking the state and returning a state update.
+            inputs (Sequence[str]): The state fields the node reads.
+            fingerprint (str): The fingerprint of the node configuration (see `fingerprint`).
+
+        Returns:
+            RunnableLambda: The memoised node.
+        """
+
+        def call(function: Callable, state: AgentState, config: RunnableConfig):
+            return function(state, config=config) if accepts_config(function) else function(state)
+
+        def lookup(state: AgentState) -> tuple[str, dict | None]:
+            key = self._key(name, fingerprint, inputs, state)
+            cached = self.cache.get(key)
+            entry = json.loads(cached) if cached is not None else None
+            if entry is None or (self.ttl is not None and time.time() - entry["created"] > self.ttl):
+                self.misses += 1
+                return key, None
+            self.hits += 1
+            logger.info(f"Reusing the cached output of {name}")
+            return key, entry["update"]
+
+        def store(key: str, update: dict):
+            if isinstance(update, IncompleteUpdate):
+                logger.info(f"Not caching the incomplete output of {name}")
+                return
+            self.cache.put(key, json.dumps({"created": time.time(), "update": update}).encode())
+
+        def run(state: AgentState, config: RunnableConfig) -> dict:
+            key, cached = lookup(state)
+            if cached is not None:
+                return cached
+            update = call(func, state, config)
+            store(key, update)
+            return update
+
+        async def arun(state: AgentState, config: RunnableConfig) -> dict:
+            key, cached = lookup(state)
+            if cached is not None:
+                return cached
+            update = await call(afunc, state, config)
+            store(key, update)
+            return update
+
+        return RunnableLambda(run, afunc=arun, name=name)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the hit and miss counters of the cache. Expired outputs count as misses.
+
+        Returns:
+            dict[str, float]: The number of hits and misses, and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
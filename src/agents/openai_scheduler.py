@@ -0,0 +1,704 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Iterator, TypeVar
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+from openai._constants import DEFAULT_CONNECTION_LIMITS
+
+from src.agents.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """
+    The priority classes of OpenAI requests. Lower values are served first.
+    """
+
+    INTERACTIVE = 0
+    BATCH = 1
+    INGESTION = 2
+
+
+_PRIORITY: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "openai_request_priority", default=Priority.INTERACTIVE
+)
+_CANCEL_SCOPE: contextvars.ContextVar["CancelScope | None"] = contextvars.ContextVar(
+    "openai_request_cancel_scope", default=None
+)
+
+# Seconds between checks of a request yielding to an earlier request of another model, which wakes it up
+# earlier once admitted
+_POLL_INTERVAL = 1.0
+# Weight of the latest latency in the moving average of each endpoint
+_LATENCY_SMOOTHING = 0.2
+# Statuses of transient errors, retried like the OpenAI client does (besides rate limits)
+_TRANSIENT_STATUSES = (408, 409, 500, 502, 503, 504)
+
+
+@contextlib.contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """
+    Sets the priority of the OpenAI requests made in a block, including by the threads and tasks it starts.
+
+    Args:
+        priority (Priority): The priority class of the requests.
+    """
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class CancelScope:
+    """
+    The OpenAI requests made by a call, to abandon once its result is no longer needed.
+
+    Cancelling the scope closes the responses of its requests, which frees their slots without reading the rest
+    of their bodies, and fails its requests not sent yet. A request already waiting for its response headers is
+    not interrupted, and its response is closed when it arrives.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._responses: list[httpx.Response] = []
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Calls a function, making its OpenAI requests in the scope.
+
+        Args:
+            func (Callable[..., T]): The function.
+            *args (Any): The positional arguments of the function.
+            **kwargs (Any): The keyword arguments of the function.
+
+        Returns:
+            T: The result of the function.
+        """
+        token = _CANCEL_SCOPE.set(self)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CANCEL_SCOPE.reset(token)
+
+    def cancel(self):
+        """
+        Abandons the requests of the scope, closing their responses.
+        """
+        with self._lock:
+            self.cancelled = True
+            responses, self._responses = self._responses, []
+        for response in responses:
+            response.close()
+
+    def _track(self, response: httpx.Response) -> bool:
+        # Returns False if the scope is already cancelled, for the caller to close the response
+        with self._lock:
+            if not self.cancelled:
+                self._responses.append(response)
+        return not self.cancelled
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a constant rate, up to its capacity.
+
+    Requests larger than the capacity are let through when the bucket is full, leaving it in debt.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        """
+        Initializes a TokenBucket instance, full.
+
+        Args:
+            per_minute (float): The refill rate per minute.
+            burst_seconds (float): The number of seconds of refill the bucket holds.
+        """
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """
+        Computes the time until an amount can be taken.
+
+        Args:
+            amount (float): The amount to take.
+            now (float): The current monotonic time.
+
+        Returns:
+            float: The number of seconds to wait, 0 if the amount can be taken now.
+        """
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def limit(self, remaining: float):
+        """
+        Lowers the level to the amount the server reports as remaining, if lower.
+
+        Args:
+            remaining (float): The remaining amount reported by the server.
+        """
+        self.level = min(self.level, remaining)
+
+
+class _Ticket:
+    """
+    A request waiting for, or holding, a slot of the scheduler.
+    """
+
+    def __init__(self, priority: Priority, seq: int, model: str, tokens: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.wake = wake
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OpenAIScheduler:
+    """
+    A process-wide scheduler of the requests to the OpenAI API, chat and embeddings alike.
+
+    Requests are admitted in priority order (interactive queries before batch queries before ingestion), then
+    in arrival order, as long as the request and token buckets of their model allow it and fewer requests than the
+    concurrency limit are in flight. Each model has its own queue: a request waiting for the buckets of its model
+    holds back the later requests of that model only, and requests of other models are admitted meanwhile. Tokens are estimated from the request body, counting the completion
+    budget as the API does. The buckets are lowered to the remaining requests and tokens reported in the
+    response headers.
+    The concurrency limit adapts to the feedback of the API: it is halved on a rate limit error (429), after which
+    all requests wait for the time the API asks for, lowered by 10% when the latency of an endpoint exceeds
+    its baseline by the tolerated factor, and raised by one request per round trip window otherwise.
+    The scheduler is the only retry layer: rate-limited requests, transient errors and connection errors are
+    retried by it, and the OpenAI clients it serves do not retry.
+
+    Models are routed through the scheduler by passing it their HTTP clients (see `client_kwargs`).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 3500,
+        tokens_per_minute: float = 200_000,
+        model_limits: dict[str, tuple[float, float]] | None = None,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        burst_seconds: float = 10.0,
+        completion_tokens: int = 256,
+        max_retries: int = 6,
+        latency_tolerance: float = 2.0,
+    ):
+        """
+        Initializes an OpenAIScheduler instance.
+
+        Args:
+            requests_per_minute (float, optional): The default requests per minute of a model. Defaults to 3500.
+            tokens_per_minute (float, optional): The default tokens per minute of a model. Defaults to 200000.
+            model_limits (dict[str, tuple[float, float]] | None, optional): The requests and tokens per minute
+                of specific models. Defaults to None.
+            max_concurrency (int, optional): The maximum number of requests in flight. Defaults to 16.
+            min_concurrency (int, optional): The minimum of the adaptive concurrency limit. Defaults to 1.
+            burst_seconds (float, optional): The number of seconds of limits a burst can use. Defaults to 10.
+            completion_tokens (int, optional): The completion tokens counted for chat requests without
+                a maximum. Defaults to 256.
+            max_retries (int, optional): The maximum number of retries of a request, rate-limited or failed with
+                a transient error. Defaults to 6.
+            latency_tolerance (float, optional): The factor of the baseline latency of an endpoint above which
+                the concurrency limit is lowered. Defaults to 2.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits or {}
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.burst_seconds = burst_seconds
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.latency_tolerance = latency_tolerance
+        self.concurrency_limit = float(max_concurrency)
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._buckets: dict[str, tuple[TokenBucket, TokenBucket]] = {}
+        self._waiting: dict[str, list[_Ticket]] = {}
+        self._active = 0
+        self._paused_until = 0.0
+        self._latency: dict[str, tuple[float, float]] = {}
+        self._last_decrease = 0.0
+        self._stats = {"requests": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0}
+        self._requests_by_priority = {priority: 0 for priority in Priority}
+
+    def client_kwargs(self) -> dict[str, Any]:
+        """
+        Creates HTTP clients sending their requests through the scheduler, for an OpenAI model.
+
+        Returns:
+            dict[str, Any]: The `http_client`, `http_async_client` and `max_retries` arguments of ChatOpenAI or
+                OpenAIEmbeddings. The clients do not retry, since the scheduler does.
+        """
+        return {
+            "max_retries": 0,
+            "http_client": DefaultHttpxClient(
+                transport=ScheduledTransport(self, httpx.HTTPTransport(limits=DEFAULT_CONNECTION_LIMITS))
+            ),
+            "http_async_client": DefaultAsyncHttpxClient(
+                transport=AsyncScheduledTransport(
+                    self, httpx.AsyncHTTPTransport(limits=DEFAULT_CONNECTION_LIMITS)
+                )
+            ),
+        }
+
+    def estimate(self, request: httpx.Request) -> tuple[str, int]:
+        """
+        Estimates the tokens of a request, as counted by the rate limits of the API.
+
+        Args:
+            request (httpx.Request): The request.
+
+        Returns:
+            tuple[str, int]: The model of the request and its estimated tokens.
+        """
+        try:
+            body = json.loads(request.content or b"{}")
+        except ValueError:
+            return "", 0
+        model = body.get("model", "")
+        if "input" in body:
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            # OpenAIEmbeddings sends token ids rather than texts
+            return model, sum(len(item) if isinstance(item, list) else count_tokens(item, model) for item in inputs)
+        texts = []
+        for message in body.get("messages", []):
+            content = message.get("content") or ""
+            texts.append(content if isinstance(content, str) else json.dumps(content))
+            if message.get("tool_calls"):
+                texts.append(json.dumps(message["tool_calls"]))
+        if body.get("tools"):
+            texts.append(json.dumps(body["tools"]))
+        completion = body.get("max_completion_tokens") or body.get("max_tokens") or self.completion_tokens
+        return model, count_tokens("\n".join(texts), model) + completion * body.get("n", 1)
+
+    def _buckets_of(self, model: str) -> tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            requests, tokens = self.model_limits.get(
+                model, (self.requests_per_minute, self.tokens_per_minute)
+            )
+            self._buckets[model] = (
+                TokenBucket(requests, self.burst_seconds),
+                TokenBucket(tokens, self.burst_seconds),
+            )
+        return self._buckets[model]
+
+    def _enqueue(self, ticket: _Ticket):
+        with self._lock:
+            heapq.heappush(self._waiting.setdefault(ticket.model, []), ticket)
+
+    def _dequeue(self, ticket: _Ticket):
+        with self._lock:
+            waiting = self._waiting.get(ticket.model, [])
+            if ticket in waiting:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                if not waiting:
+                    del self._waiting[ticket.model]
+                self._notify()
+
+    def _notify(self):
+        for waiting in self._waiting.values():
+            for ticket in waiting:
+                ticket.wake()
+
+    def _delay(self, ticket: _Ticket, now: float) -> float:
+        # Called with the lock held
+        requests, tokens = self._buckets_of(ticket.model)
+        return max(requests.delay(1, now), tokens.delay(ticket.tokens, now))
+
+    def _admit(self, ticket: _Ticket) -> float | None:
+        """
+        Admits a waiting request if it is next of its model, within the limits, and no earlier request of another
+        model can be admitted instead.
+
+        Args:
+            ticket (_Ticket): The waiting request.
+
+        Returns:
+            float | None: 0 if the request was admitted, None to wait until woken up by a release or admission,
+                or else the number of seconds to wait before checking again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            waiting = self._waiting[ticket.model]
+            if waiting[0] is not ticket or self._active >= int(self.concurrency_limit):
+                return None
+            delay = self._delay(ticket, now)
+            if delay > 0:
+                return delay
+            for model, other in self._waiting.items():
+                if model != ticket.model and other and other[0] < ticket and self._delay(other[0], now) == 0:
+                    other[0].wake()
+                    return _POLL_INTERVAL
+            requests, tokens = self._buckets_of(ticket.model)
+            requests.take(1)
+            tokens.take(ticket.tokens)
+            heapq.heappop(waiting)
+            if not waiting:
+                del self._waiting[ticket.model]
+            self._active += 1
+            self._stats["requests"] += 1
+            self._requests_by_priority[ticket.priority] += 1
+            self._stats["wait_seconds"] += now - ticket.enqueued
+            # The next request may be admissible too
+            self._notify()
+            return 0.0
+
+    def acquire(self, model: str, tokens: int, priority: Priority, seq: int | None = None) -> _Ticket:
+        """
+        Waits for a slot for a request, blocking the thread.
+
+        Args:
+            model (str): The model of the request.
+            tokens (int): The estimated tokens of the request.
+            priority (Priority): The priority class of the request.
+            seq (int | None, optional): The position of the request in its class, to retry it ahead of later
+                requests. Defaults to None, for a new request.
+
+        Returns:
+            _Ticket: The admitted request, to release when it completes.
+        """
+        event = threading.Event()
+        ticket = _Ticket(priority, next(self._seq) if seq is None else seq, model, tokens, event.set)
+        self._enqueue(ticket)
+        try:
+            while (delay := self._admit(ticket)) != 0:
+                event.wait(delay)
+                event.clear()
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        return ticket
+
+    async def aacquire(self, model: str, tokens: int, priority: Priority, seq: int | None = None) -> _Ticket:
+        """
+        Asynchronously waits for a slot for a request. This is the async counterpart of `acquire`.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(event.set)
+
+        ticket = _Ticket(priority, next(self._seq) if seq is None else seq, model, tokens, wake)
+        self._enqueue(ticket)
+        try:
+            while (delay := self._admit(ticket)) != 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(event.wait(), delay)
+                event.clear()
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        """
+        Frees the slot of a completed request.
+
+        Args:
+            ticket (_Ticket): The admitted request.
+        """
+        with self._lock:
+            self._active -= 1
+            self._notify()
+
+    def feedback(
+        self, ticket: _Ticket, response: httpx.Response, latency: float, attempt: int
+    ) -> float | None:
+        """
+        Adapts the limits to the response of a request.
+
+        Args:
+            ticket (_Ticket): The admitted request.
+            response (httpx.Response): The response, whose body may not have been read yet.
+            latency (float): The number of seconds until the response headers.
+            attempt (int): The number of previous attempts of the request.
+
+        Returns:
+            float | None: The number of seconds to wait before retrying the request, or None not to retry it.
+        """
+        headers = response.headers
+        with self._lock:
+            now = time.monotonic()
+            requests, tokens = self._buckets_of(ticket.model)
+            if "x-ratelimit-remaining-requests" in headers:
+                requests.limit(float(headers["x-ratelimit-remaining-requests"]))
+            if "x-ratelimit-remaining-tokens" in headers:
+                tokens.limit(float(headers["x-ratelimit-remaining-tokens"]))
+            if response.status_code == 429:
+                self._stats["rate_limited"] += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                self._paused_until = max(self._paused_until, now + self._retry_after(headers, attempt))
+                logger.warning(
+                    f"OpenAI rate limit hit, pausing requests for {self._paused_until - now:.1f}s "
+                    f"and lowering the concurrency to {int(self.concurrency_limit)}"
+                )
+                # All requests wait for the pause, when they are admitted again
+                return self._retry(attempt, 0.0)
+            if response.status_code in _TRANSIENT_STATUSES:
+                return self._retry(attempt, self._retry_after(headers, attempt))
+            if response.is_success:
+                self._adapt(response.request.url.path, latency, now)
+            return None
+
+    def error(self, attempt: int) -> float | None:
+        """
+        Decides whether to retry a request that failed without a response, e.g. a connection error or timeout.
+
+        Args:
+            attempt (int): The number of previous attempts of the request.
+
+        Returns:
+            float | None: The number of seconds to wait before retrying the request, or None not to retry it.
+        """
+        with self._lock:
+            return self._retry(attempt, min(0.5 * 2**attempt, 30.0))
+
+    def _retry(self, attempt: int, delay: float) -> float | None:
+        # Called with the lock held
+        if attempt >= self.max_retries:
+            return None
+        self._stats["retries"] += 1
+        return delay
+
+    @staticmethod
+    def _retry_after(headers: httpx.Headers, attempt: int) -> float:
+        with contextlib.suppress(KeyError, ValueError):
+            return float(headers["retry-after-ms"]) / 1000
+        with contextlib.suppress(KeyError, ValueError):
+            return float(headers["retry-after"])
+        return min(0.5 * 2**attempt, 30.0)
+
+    def _adapt(self, path: str, latency: float, now: float):
+        """
+        Adapts the concurrency limit to the latency of a successful request.
+
+        Args:
+            path (str): The endpoint of the request.
+            latency (float): The number of seconds until the response headers.
+            now (float): The current monotonic time.
+        """
+        average, baseline = self._latency.get(path, (latency, latency))
+        average = (1 - _LATENCY_SMOOTHING) * average + _LATENCY_SMOOTHING * latency
+        # The baseline follows the lowest average, and slowly recovers from outliers
+        baseline = min(average, baseline * 1.01)
+        self._latency[path] = (average, baseline)
+        if average > self.latency_tolerance * baseline:
+            # At most one decrease per baseline round trip, as the requests in flight report the same congestion
+            if now - self._last_decrease > baseline:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * 0.9)
+                self._last_decrease = now
+        else:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters of the scheduler.
+
+        Returns:
+            dict[str, float]: The number of requests, per priority class too, rate limit errors and retries, the mean
+                time requests waited for a slot in seconds, and the current concurrency limit.
+        """
+        with self._lock:
+            requests = self._stats["requests"]
+            return {
+                "requests": requests,
+                **{
+                    f"{priority.name.lower()}_requests": count
+                    for priority, count in self._requests_by_priority.items()
+                },
+                "rate_limited": self._stats["rate_limited"],
+                "retries": self._stats["retries"],
+                "mean_wait_seconds": self._stats["wait_seconds"] / requests if requests else 0.0,
+                "concurrency_limit": int(self.concurrency_limit),
+            }
+
+
+def _final(response: httpx.Response, stream: Any) -> httpx.Response:
+    """
+    Rebuilds a response around a stream releasing the slot of the request when closed.
+    """
+    return httpx.Response(
+        status_code=response.status_code, headers=response.headers, stream=stream, extensions=response.extensions
+    )
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Callable[[], None] | None = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self):
+        # Also closed by the cancel scope of the request, from another thread
+        release, self._release = self._release, None
+        try:
+            self._stream.close()
+        finally:
+            if release is not None:
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    An HTTP transport sending each request through an OpenAIScheduler, and retrying rate-limited and failed requests.
+
+    The slot of a request is held until its response is closed, so that streamed responses count as in flight.
+    Requests made in a CancelScope are abandoned when it is cancelled.
+    """
+
+    def __init__(self, scheduler: OpenAIScheduler, transport: httpx.BaseTransport):
+        self.scheduler = scheduler
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        model, tokens = self.scheduler.estimate(request)
+        priority = _PRIORITY.get()
+        scope = _CANCEL_SCOPE.get()
+        seq = None
+        for attempt in itertools.count():
+            ticket = self.scheduler.acquire(model, tokens, priority, seq)
+            seq = ticket.seq
+            if scope is not None and scope.cancelled:
+                self.scheduler.release(ticket)
+                raise httpx.RequestError("The request was cancelled before being sent", request=request)
+            start = time.monotonic()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                self.scheduler.release(ticket)
+                delay = self.scheduler.error(attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.scheduler.release(ticket)
+                raise
+            response.request = request
+            delay = self.scheduler.feedback(ticket, response, time.monotonic() - start, attempt)
+            if delay is None:
+                response = _final(response, _ReleasingStream(response.stream, lambda: self.scheduler.release(ticket)))
+                if scope is not None and not scope._track(response):
+                    response.close()
+                return response
+            response.close()
+            self.scheduler.release(ticket)
+            time.sleep(delay)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """
+    The async counterpart of ScheduledTransport.
+    """
+
+    def __init__(self, scheduler: OpenAIScheduler, transport: httpx.AsyncBaseTransport):
+        self.scheduler = scheduler
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        model, tokens = self.scheduler.estimate(request)
+        priority = _PRIORITY.get()
+        seq = None
+        for attempt in itertools.count():
+            ticket = await self.scheduler.aacquire(model, tokens, priority, seq)
+            seq = ticket.seq
+            start = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.scheduler.release(ticket)
+                delay = self.scheduler.error(attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.scheduler.release(ticket)
+                raise
+            response.request = request
+            delay = self.scheduler.feedback(ticket, response, time.monotonic() - start, attempt)
+            if delay is None:
+                return _final(
+                    response, _AsyncReleasingStream(response.stream, lambda: self.scheduler.release(ticket))
+                )
+            await response.aclose()
+            self.scheduler.release(ticket)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_scheduler: OpenAIScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OpenAIScheduler:
+    """
+    Returns the process-wide scheduler of the models created without one, with the default limits.
+
+    Returns:
+        OpenAIScheduler: The scheduler.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler()
+        return _scheduler
@@ -32,3 +32,10 @@ Risk assessment:
 
 Write your earnings call report now, considering the previous exercises in your report and highlighting the market analysis and risk assessment provided.
 """
+
+context_summary_system_prompt = """You condense reports for a financial expert, keeping every figure, date and conclusion.
+"""
+
+context_summary_user_prompt = """Summarize the following {section} in at most {max_words} words:
+{text}
+"""
@@ -1,13 +1,18 @@
 import logging
 
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
 from src.agents.agent_state import AgentState
+from src.agents.llm_cache import with_response_cache
+from src.agents.model_routing import ModelConfig, create_chat_model
+from src.agents.openai_scheduler import OpenAIScheduler
 from src.agents.prompts import (
     risk_assessment_system_prompt,
     risk_assessment_user_prompt,
 )
+from src.agents.step_logging import Preview
 
 logger = logging.getLogger(__name__)
 
@@ -20,13 +25,31 @@ class RiskAssessmenttAgent:
     It uses a language model to generate the report.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        llm: BaseChatModel | None = None,
+        cache: BaseCache | None = None,
+        model_config: ModelConfig | None = None,
+        scheduler: OpenAIScheduler | None = None,
+    ):
         """
         Initializes a RiskAssessmenttAgent instance.
 
         This method sets up the language model and the prompt template used by the agent.
+
+        Args:
+            llm (BaseChatModel | None, optional): The language model, e.g. a fake for benchmarks.
+                Defaults to the model of `model_config`.
+            cache (BaseCache | None, optional): A cache of the model responses (see `LLMResponseCache`).
+                Defaults to None.
+            model_config (ModelConfig | None, optional): The provider, model, maximum output tokens, deadline
+                and hedging of the model, if no model is given. Defaults to OpenAI's default chat model.
+            scheduler (OpenAIScheduler | None, optional): The scheduler of the OpenAI requests of the model,
+                if no model is given. Defaults to the process-wide scheduler.
         """
-        self.llm = ChatOpenAI(temperature=0)
+        self.llm = with_response_cache(
+            llm or create_chat_model(model_config or ModelConfig(), temperature=0, scheduler=scheduler), cache
+        )
         self.prompt_template = ChatPromptTemplate.from_messages(
             [
                 ("system", risk_assessment_system_prompt),
@@ -34,26 +57,40 @@ class RiskAssessmenttAgent:
             ]
         )
 
-    def run(self, state: AgentState) -> AgentState:
+    def run(self, state: AgentState) -> dict:
         """
         Runs the risk assessment agent with the given input state.
 
         The agent generates a risk assessment report based on the input query in the state.
-        The report is then added to the output state, along with the current agent's name in the history.
+        The report is returned as a state update, along with the current agent's name for the history.
 
         Args:
             state (AgentState): The input state.
 
         Returns:
-            AgentState: The output state with the risk assessment report.
-
-        Note: The agent's name in the history is currently hardcoded as "risk_management_agent",
-              which does not match the class name "RiskAssessmenttAgent". This might be a typo.
+            dict: The state update with the risk assessment report.
         """
-        logger.info(f"Running risk assessment agent with input state: {state}")
+        logger.info("Running risk assessment agent for query: %s", Preview(state["query"]))
         prompt = self.prompt_template.invoke({"query": state["query"]})
         output = self.llm.invoke(prompt)
-        logger.debug(f"Got output: {output}")
-        state["history"].append("risk_assessment_agent")
-        state["risk_assessment"] = output.content
-        return state
+        logger.debug("Got output: %s", Preview(output))
+        return {"risk_assessment": output.content, "history": ["risk_assessment_agent"]}
+
+    async def arun(self, state: AgentState) -> dict:
+        """
+        Asynchronously runs the risk assessment agent with the given input state.
+
+        This is the async counterpart of `run`, so that the agent can run concurrently with other agents
+        on a single event loop.
+
+        Args:
+            state (AgentState): The input state.
+
+        Returns:
+            dict: The state update with the risk assessment report.
+        """
+        logger.info("Running risk assessment agent for query: %s", Preview(state["query"]))
+        prompt = await self.prompt_template.ainvoke({"query": state["query"]})
+        output = await self.llm.ainvoke(prompt)
+        logger.debug("Got output: %s", Preview(output))
+        return {"risk_assessment": output.content, "history": ["risk_assessment_agent"]}
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Callable
+from urllib.parse import urlsplit
+
+from langgraph.graph import Graph
+
+from src.agents.agent_graph import astream_query
+from src.agents.instrumentation import Tracer
+from src.agents.singleflight import SingleFlight, normalize_query
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class AgentServer:
+    """
+    A small HTTP server that keeps the agent graph warm and serves queries over a long-running process.
+
+    The expensive setup (vector store connection, document ingestion, LLM clients and graph compilation)
+    runs once in the background when the server starts. The server exposes:
+        - GET /healthz: liveness, available as soon as the server listens.
+        - GET /readyz: readiness, 200 once the setup is done and 503 before.
+        - POST /query: runs a query given as a JSON body {"query": "..."} and streams its progress and the tokens
+          of the final report as JSON lines (chunked transfer encoding), ending with the final state.
+          Identical queries (up to case and whitespace) received while one is running share its run.
+        - GET /metrics: latency, token and cost metrics in the Prometheus text format, if a tracer is given.
+
+    It listens on a TCP port or on a Unix socket, and handles requests on a single asyncio event loop.
+    """
+
+    def __init__(
+        self,
+        setup: Callable[[], Graph],
+        max_concurrency: int = 16,
+        max_body_size: int = 1 << 20,
+        tracer: Tracer | None = None,
+        coalesce: bool = True,
+    ):
+        """
+        Initializes an AgentServer instance.
+
+        Args:
+            setup (Callable[[], Graph]): A blocking function building the compiled graph, run once at startup.
+            max_concurrency (int, optional): The maximum number of queries running at once. Defaults to 16.
+            max_body_size (int, optional): The maximum size of a request body in bytes. Defaults to 1 MiB.
+            tracer (Tracer | None, optional): The tracer of the graph, whose metrics are served. Defaults to None.
+            coalesce (bool, optional): Whether identical queries running at once share a single run. Defaults to True.
+        """
+        self.setup = setup
+        self.max_body_size = max_body_size
+        self.graph: Graph | None = None
+        self.setup_error: str | None = None
+        self.tracer = tracer
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queries = SingleFlight("query", tracer) if coalesce else None
+
+    async def serve(
+        self, host: str = "127.0.0.1", port: int = 8000, unix_socket: str | None = None
+    ):
+        """
+        Starts the server and runs it until cancelled.
+
+        Args:
+            host (str, optional): The host to listen on. Defaults to "127.0.0.1".
+            port (int, optional): The TCP port to listen on. Defaults to 8000.
+            unix_socket (str | None, optional): The path of a Unix socket to listen on instead of TCP. Defaults to None.
+        """
+        if unix_socket:
+            server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+            logger.info(f"Serving on unix socket {unix_socket}")
+        else:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+            logger.info(f"Serving on http://{host}:{port}")
+        setup_task = asyncio.create_task(self._run_setup())
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                setup_task.cancel()
+
+    async def _run_setup(self):
+        start = time.perf_counter()
+        try:
+            # The setup blocks (ingestion, connections), so keep it off the event loop
+            self.graph = await asyncio.to_thread(self.setup)
+        except Exception as e:
+            logger.exception("Server setup failed")
+            self.setup_error = f"{type(e).__name__}: {e}"
+            return
+        logger.info(f"Server ready after {time.perf_counter() - start:.1f}s")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Handles a single HTTP request on a connection, then closes it.
+
+        Args:
+            reader (asyncio.StreamReader): The connection reader.
+            writer (asyncio.StreamWriter): The connection writer.
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method, path = request_line[0], urlsplit(request_line[1]).path
+            length = headers.get("content-length", "0")
+            if not length.isdecimal():
+                await self._send_json(writer, 400, {"error": "invalid Content-Length"})
+                return
+            length = int(length)
+            if length > self.max_body_size:
+                await self._send_json(writer, 413, {"error": "request body too large"})
+                return
+            body = await reader.readexactly(length) if length else b""
+            await self._route(method, path, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug("Client disconnected")
+        except Exception:
+            logger.exception("Failed to handle request")
+        finally:
+            writer.close()
+
+    async def _route(
+        self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter
+    ):
+        """
+        Dispatches a request to its endpoint and sends the response.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The request path.
+            body (bytes): The request body.
+            writer (asyncio.StreamWriter): The connection writer.
+        """
+        if path == "/healthz":
+            await self._send_json(writer, 200, {"status": "ok"})
+        elif path == "/readyz":
+            if self.graph is not None:
+                await self._send_json(writer, 200, {"status": "ready"})
+            else:
+                status = "failed" if self.setup_error else "starting"
+                await self._send_json(
+                    writer, 503, {"status": status, "error": self.setup_error}
+                )
+        elif path == "/metrics" and self.tracer is not None:
+            body = self.tracer.prometheus_text().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        elif path == "/query":
+            if method != "POST":
+                await self._send_json(writer, 405, {"error": "use POST"})
+                return
+            if self.graph is None:
+                await self._send_json(writer, 503, {"error": "server is not ready"})
+                return
+            try:
+                query = json.loads(body)["query"]
+            except (ValueError, KeyError, TypeError):
+                query = None
+            if not isinstance(query, str) or not query.strip():
+                await self._send_json(
+                    writer, 400, {"error": 'expected a JSON body {"query": "..."}'}
+                )
+                return
+            await self._send_stream(writer, self._run_query(query))
+        else:
+            await self._send_json(writer, 404, {"error": f"unknown path {path}"})
+
+    async def _run_query(self, query: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Runs a query through the graph, yielding progress events.
+
+        Args:
+            query (str): The analysis query.
+
+        Yields:
+            dict[str, Any]: A "node" event when each node completes, a "token" event for each token of the final
+                report, then a "result" event with the final state, or an "error" event.
+        """
+        if self._queries is None:
+            events = self._bounded_query(query)
+        else:
+            events = self._queries.astream(normalize_query(query), self._bounded_query, query)
+        try:
+            async for event in events:
+                yield event
+        except Exception as e:
+            logger.exception(f"Query failed: {query}")
+            yield {"event": "error", "error": f"{type(e).__name__}: {e}"}
+
+    async def _bounded_query(self, query: str) -> AsyncIterator[dict[str, Any]]:
+        # Coalesced queries wait for the shared run without taking a slot
+        async with self._semaphore:
+            async for event in astream_query(self.graph, query):
+                yield event
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    @staticmethod
+    async def _send_stream(
+        writer: asyncio.StreamWriter, events: AsyncIterator[dict[str, Any]]
+    ):
+        """
+        Streams events as JSON lines, using chunked transfer encoding.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            events (AsyncIterator[dict[str, Any]]): The events to send.
+        """
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        )
+        async for event in events:
+            data = (json.dumps(event, default=str) + "\n").encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            # Raises if the client went away, which cancels the query
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,275 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.utils import accepts_config
+
+from src.agents.agent_state import AgentState
+from src.agents.instrumentation import Tracer
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for coalescing, so that queries differing only in case and whitespace are shared.
+
+    Args:
+        query (str): The query.
+
+    Returns:
+        str: The normalized query.
+    """
+    return " ".join(query.split()).casefold()
+
+
+@dataclass
+class _SharedTask:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+@dataclass
+class _SharedStream:
+    events: list = field(default_factory=list)
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+    done: bool = False
+    error: BaseException | None = None
+    task: asyncio.Task | None = None
+    waiters: int = 0
+
+    def notify(self):
+        # Wakes up the current waiters, and gives the next ones a fresh event
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call is in flight, the calls with the same key wait for its
+    result instead of running too.
+
+    Only in-flight calls are shared, and results are not kept once a call completes. A failure is raised to every
+    caller of the call. Async calls run in a task shared by their callers, which is only cancelled when all of them
+    are. Sync calls are coalesced across threads, and async calls across the tasks of an event loop.
+    """
+
+    def __init__(self, name: str, tracer: Tracer | None = None):
+        """
+        Initializes a SingleFlight instance.
+
+        Args:
+            name (str): The name of the coalesced operation, used in logs and metrics.
+            tracer (Tracer | None, optional): A tracer counting the calls and the coalesced calls. Defaults to None.
+        """
+        self.name = name
+        self.tracer = tracer
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._futures: dict[Hashable, concurrent.futures.Future] = {}
+        self._tasks: dict[tuple[asyncio.AbstractEventLoop, Hashable], _SharedTask] = {}
+        self._streams: dict[tuple[asyncio.AbstractEventLoop, Hashable], _SharedStream] = {}
+
+    def _count(self, coalesced: bool):
+        with self._lock:
+            self.calls += 1
+            self.coalesced += coalesced
+        if coalesced:
+            logger.debug(f"Coalesced a call of {self.name} with an identical call in flight")
+        if self.tracer:
+            self.tracer.increment("singleflight_calls", self.name)
+            if coalesced:
+                self.tracer.increment("singleflight_coalesced", self.name)
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Calls a function, unless a call with the same key is in flight, whose result is then returned.
+
+        Args:
+            key (Hashable): The key of the call, e.g. its arguments.
+            func (Callable[..., Any]): The function.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            Any: The result of the function, shared by the coalesced calls.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = concurrent.futures.Future()
+        self._count(not leader)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._forget(self._futures, key, future)
+            future.set_exception(e)
+            raise
+        self._forget(self._futures, key, future)
+        future.set_result(result)
+        return result
+
+    async def ado(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Awaits a coroutine function, unless a call with the same key is in flight, whose result is then returned.
+
+        Args:
+            key (Hashable): The key of the call, e.g. its arguments.
+            func (Callable[..., Awaitable[Any]]): The coroutine function.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            Any: The result of the function, shared by the coalesced calls.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            shared = self._tasks.get((loop, key))
+            leader = shared is None
+            if leader:
+                shared = self._tasks[(loop, key)] = _SharedTask(loop.create_task(func(*args, **kwargs)))
+                shared.task.add_done_callback(lambda _: self._forget(self._tasks, (loop, key), shared))
+        self._count(not leader)
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            if not shared.waiters and not shared.task.done():
+                # Every caller was cancelled, so the result is not needed anymore
+                self._forget(self._tasks, (loop, key), shared)
+                shared.task.cancel()
+
+    async def astream(
+        self, key: Hashable, func: Callable[..., AsyncIterator[Any]], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """
+        Iterates over an async generator, unless a call with the same key is in flight, whose items are then yielded.
+
+        The items of a shared call are buffered, so that a caller joining it late gets every item from the first.
+
+        Args:
+            key (Hashable): The key of the call, e.g. its arguments.
+            func (Callable[..., AsyncIterator[Any]]): The async generator function.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Yields:
+            Any: The items of the generator, shared by the coalesced calls.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            shared = self._streams.get((loop, key))
+            leader = shared is None
+            if leader:
+                shared = self._streams[(loop, key)] = _SharedStream()
+                shared.task = loop.create_task(self._pump(shared, func(*args, **kwargs), (loop, key)))
+        self._count(not leader)
+        shared.waiters += 1
+        index = 0
+        try:
+            while True:
+                while index < len(shared.events):
+                    yield shared.events[index]
+                    index += 1
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.updated.wait()
+        finally:
+            shared.waiters -= 1
+            if not shared.waiters and not shared.done:
+                self._forget(self._streams, (loop, key), shared)
+                shared.task.cancel()
+
+    async def _pump(self, shared: _SharedStream, events: AsyncIterator[Any], key: Hashable):
+        """
+        Buffers the items of a shared async generator, and wakes up its callers.
+
+        Args:
+            shared (_SharedStream): The shared call.
+            events (AsyncIterator[Any]): The generator.
+            key (Hashable): The key of the call.
+        """
+        try:
+            async for event in events:
+                shared.events.append(event)
+                shared.notify()
+        except BaseException as e:
+            shared.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self._forget(self._streams, key, shared)
+            shared.done = True
+            shared.notify()
+
+    def _forget(self, calls: dict, key: Hashable, call: Any):
+        # Later calls with the key start a new call, unless one already did
+        with self._lock:
+            if calls.get(key) is call:
+                del calls[key]
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters of the calls.
+
+        Returns:
+            dict[str, float]: The number of calls and of coalesced calls, and the coalescing rate.
+        """
+        with self._lock:
+            calls, coalesced = self.calls, self.coalesced
+        return {"calls": calls, "coalesced": coalesced, "coalescing_rate": coalesced / calls if calls else 0.0}
+
+
+def coalesce_node(
+    flight: SingleFlight,
+    func: Callable[..., dict],
+    afunc: Callable[..., Any],
+    inputs: Sequence[str] = ("query",),
+) -> tuple[Callable[..., dict], Callable[..., Any]]:
+    """
+    Wraps the implementations of a node so that concurrent runs with the same inputs share a single run.
+
+    Each coalesced run returns a copy of the state update of the shared run.
+
+    Args:
+        flight (SingleFlight): The coalescer of the node.
+        func (Callable[..., dict]): The sync implementation, taking the state and returning a state update.
+        afunc (Callable[..., Any]): The async implementation, taking the state and returning a state update.
+        inputs (Sequence[str], optional): The state fields the node reads. Defaults to the query.
+
+    Returns:
+        tuple[Callable[..., dict], Callable[..., Any]]: The coalesced sync and async implementations,
+            taking the state and the config.
+    """
+
+    def call(function: Callable, state: AgentState, config: RunnableConfig):
+        return function(state, config=config) if accepts_config(function) else function(state)
+
+    def key(state: AgentState) -> str:
+        return json.dumps({field: state.get(field) for field in inputs}, sort_keys=True)
+
+    def copy(update: dict) -> dict:
+        # Of the same type, e.g. an IncompleteUpdate
+        return type(update)(
+            {field: list(value) if isinstance(value, list) else value for field, value in update.items()}
+        )
+
+    def run(state: AgentState, config: RunnableConfig) -> dict:
+        return copy(flight.do(key(state), call, func, state, config))
+
+    async def arun(state: AgentState, config: RunnableConfig) -> dict:
+        return copy(await flight.ado(key(state), call, afunc, state, config))
+
+    return run, arun
@@ -0,0 +1,146 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCache:
+    """
+    A persistent key-value cache backed by a local SQLite database.
+
+    Values are stored as raw bytes. The cache is bounded by a maximum number of entries,
+    and the least recently used entries are evicted when the bound is exceeded.
+    Hits and misses are counted for the lifetime of the instance.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int = 100_000):
+        """
+        Initializes a SqliteCache instance, creating the database and table if needed.
+
+        Args:
+            path (str): The path to the SQLite database file.
+            table (str): The name of the table holding the cache entries.
+            max_entries (int, optional): The maximum number of entries to keep. Defaults to 100000.
+        """
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)"
+        )
+        self._connection.commit()
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """
+        Looks up many keys with a single query, and marks the found entries as recently used.
+
+        Args:
+            keys (list[str]): The keys to look up.
+
+        Returns:
+            dict[str, bytes]: The values of the keys found in the cache.
+        """
+        found: dict[str, bytes] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._connection.execute(
+                        f"UPDATE {self.table} SET last_used = ? "
+                        f"WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time(), *(key for key, _ in rows)],
+                    )
+            self._connection.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Looks up a single key.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            bytes | None: The cached value, or None if the key is not in the cache.
+        """
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict[str, bytes]):
+        """
+        Stores many entries, evicting the least recently used entries if the cache is full.
+
+        Args:
+            items (dict[str, bytes]): The values to store, by key.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            (count,) = self._connection.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()
+            if count > self.max_entries:
+                logger.debug(f"Evicting {count - self.max_entries} entries from {self.table}")
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._connection.commit()
+
+    def put(self, key: str, value: bytes):
+        """
+        Stores a single entry.
+
+        Args:
+            key (str): The key of the entry.
+            value (bytes): The value of the entry.
+        """
+        self.put_many({key: value})
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table}")
+            self._connection.commit()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            dict[str, float]: The number of hits and misses, and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
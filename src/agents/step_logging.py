@@ -0,0 +1,118 @@
+import json
+import logging
+import threading
+import time
+from typing import Any
+
+# Maximum number of characters of a text field quoted in the logs
+MAX_FIELD_CHARS = 200
+
+
+class Preview:
+    """
+    A value formatted lazily for logging, with its long texts truncated.
+
+    Pass it as an argument of a logging call (`logger.info("...: %s", Preview(value))`), so that nothing is
+    formatted when the level is disabled, and formatting a large value costs the same as formatting a small one.
+    """
+
+    def __init__(self, value: Any, max_chars: int = MAX_FIELD_CHARS):
+        """
+        Initializes a Preview instance.
+
+        Args:
+            value (Any): The value.
+            max_chars (int, optional): The maximum number of characters quoted per text. Defaults to 200.
+        """
+        self.value = value
+        self.max_chars = max_chars
+
+    def _truncate(self, value: Any) -> Any:
+        if isinstance(value, str):
+            if len(value) <= self.max_chars:
+                return value
+            return f"{value[: self.max_chars]}... ({len(value)} chars)"
+        if isinstance(value, dict):
+            return {key: self._truncate(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            items = [self._truncate(item) for item in value[:10]]
+            return items + [f"... ({len(value)} items)"] if len(value) > 10 else items
+        if value is None or isinstance(value, (int, float, bool)):
+            return value
+        # e.g. messages: their text is truncated like any other
+        return self._truncate(getattr(value, "content", None) or repr(value))
+
+    def __str__(self) -> str:
+        return json.dumps(self._truncate(self.value), ensure_ascii=False, default=str)
+
+
+class StepLogger:
+    """
+    Logs the steps of graph runs as the state updates of their nodes, rather than as the whole state.
+
+    Each step is a single line with the node and the fields it updated, with long texts truncated, so that the cost
+    of a line does not grow with the reports. Under load, at most `max_per_second` lines are written, and the
+    number of steps not logged is reported on the next line written. The fields are also passed as the `extra`
+    attributes of the log record, for structured log handlers.
+    """
+
+    def __init__(self, logger: logging.Logger, max_per_second: float = 20.0, max_chars: int = MAX_FIELD_CHARS):
+        """
+        Initializes a StepLogger instance.
+
+        Args:
+            logger (logging.Logger): The logger of the steps.
+            max_per_second (float, optional): The maximum number of lines written per second, on average.
+                Defaults to 20.
+            max_chars (int, optional): The maximum number of characters quoted per text field. Defaults to 200.
+        """
+        self.logger = logger
+        self.max_per_second = max_per_second
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._allowance = max_per_second
+        self._last = time.monotonic()
+        self._dropped = 0
+
+    def _admit(self) -> tuple[bool, int]:
+        """
+        Samples the steps, with a token bucket holding a second of lines.
+
+        Returns:
+            tuple[bool, int]: Whether the step is logged, and if so the number of steps dropped since the last one.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.max_per_second, self._allowance + (now - self._last) * self.max_per_second)
+            self._last = now
+            if self._allowance < 1:
+                self._dropped += 1
+                return False, 0
+            self._allowance -= 1
+            dropped, self._dropped = self._dropped, 0
+            return True, dropped
+
+    def log(self, step: int, updates: dict[str, Any]):
+        """
+        Logs a step of a graph run.
+
+        Args:
+            step (int): The index of the step in the run.
+            updates (dict[str, Any]): The output of the step, i.e. the state update of each node that ran.
+        """
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        admitted, dropped = self._admit()
+        if not admitted:
+            return
+        suffix = f" ({dropped} steps not logged)" if dropped else ""
+        for node, update in updates.items():
+            fields = sorted(update) if isinstance(update, dict) else []
+            self.logger.info(
+                "STEP %d %s: %s%s",
+                step,
+                node,
+                Preview(update, self.max_chars),
+                suffix,
+                extra={"step": step, "node": node, "fields": fields},
+            )
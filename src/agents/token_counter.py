@@ -0,0 +1,47 @@
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough number of characters per token of English text, used when the tokenizer is not available
+_CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    """
+    Loads the tokenizer of a model.
+
+    Args:
+        model (str): The model name.
+
+    Returns:
+        tiktoken.Encoding | None: The tokenizer, or None if it cannot be loaded (e.g. it must be downloaded while offline).
+    """
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer for {model} unavailable ({e}), estimating token counts")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Counts the tokens of a text for a model, with tiktoken when available, and estimates them otherwise.
+
+    Args:
+        text (str): The text.
+        model (str, optional): The model name. Defaults to "gpt-3.5-turbo".
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,60 +1,244 @@
+import contextlib
 import logging
 import os
 from typing import Any, Dict, List
 
 from dotenv import load_dotenv
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
-from langchain_postgres import PGVector
+
+from src.agents.embedding_cache import CachedEmbeddings
+from src.agents.instrumentation import TracedEmbeddings, Tracer
+from src.agents.keyword_index import KeywordIndex
+from src.agents.openai_scheduler import OpenAIScheduler, get_scheduler
+from src.agents.singleflight import SingleFlight
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# The rank constant of reciprocal rank fusion, which dampens the weight of the top ranks
+_RRF_K = 60
+
 
 class VectorStore:
     """
     A class representing a vector store for storing and searching documents.
 
-    This class uses OpenAI embeddings and PGVector to store and search documents in a PostgreSQL database.
+    This class uses OpenAI embeddings to store and search documents, either with PGVector in a PostgreSQL database
+    or with a local index persisted to disk.
+    In "hybrid" search mode, documents are also indexed in a local BM25 keyword index, and searches fuse
+    the keyword and vector rankings.
     """
 
-    def __init__(self):
+    BACKENDS = ("pgvector", "local")
+    SEARCH_MODES = ("hybrid", "vector")
+
+    def __init__(
+        self,
+        backend: str = "pgvector",
+        local_index_path: str = "vector_index",
+        ivf_lists: int | None = None,
+        embedding_cache_path: str | None = "embedding_cache.sqlite",
+        embedding_cache_size: int = 100_000,
+        tracer: Tracer | None = None,
+        embeddings: Embeddings | None = None,
+        search_mode: str = "hybrid",
+        keyword_index_path: str = "keyword_index.sqlite",
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        vector_index: str | None = "hnsw",
+        ef_search: int = 40,
+        ivf_probes: int = 8,
+        embedding_length: int = 1536,
+        scheduler: OpenAIScheduler | None = None,
+        coalesce: bool = True,
+        vector_precision: str = "float32",
+        rerank_factor: int | None = None,
+    ):
         """
         Initializes a VectorStore instance.
 
-        This method sets up the connection to the PostgreSQL database and initializes the vector store.
+        With the "pgvector" backend, this method sets up the connection to the PostgreSQL database.
         It requires the NEON_CONNECTION_STRING environment variable to be set.
+        With the "local" backend, documents are stored in a local index and no database is needed.
+
+        Args:
+            backend (str, optional): The storage backend, either "pgvector" or "local". Defaults to "pgvector".
+            local_index_path (str, optional): The directory of the local index. Defaults to "vector_index".
+            ivf_lists (int | None, optional): The number of IVF clusters for approximate search in the local index,
+                or None for exact search only. With the "pgvector" backend, the number of clusters of an IVFFlat index,
+                or None to derive it from the collection size. Defaults to None.
+            embedding_cache_path (str | None, optional): The path to the on-disk embedding cache,
+                or None to disable caching. Defaults to "embedding_cache.sqlite".
+            embedding_cache_size (int, optional): The maximum number of cached embeddings. Defaults to 100000.
+            tracer (Tracer | None, optional): A tracer recording embedding calls and vector store queries.
+                Defaults to None.
+            embeddings (Embeddings | None, optional): The embeddings model, e.g. a fake for benchmarks.
+                Defaults to OpenAI's embeddings model.
+            search_mode (str, optional): The search mode, either "hybrid" (keyword and vector) or "vector".
+                Defaults to "hybrid".
+            keyword_index_path (str, optional): The path to the keyword index of the "hybrid" search mode.
+                Defaults to "keyword_index.sqlite".
+            pool_size (int, optional): The number of database connections kept open by each PGVector engine.
+                Defaults to 5.
+            max_overflow (int, optional): The number of additional database connections under load. Defaults to 10.
+            vector_index (str | None, optional): The PGVector ANN index, "hnsw" or "ivfflat", or None for exact search.
+                Defaults to "hnsw".
+            ef_search (int, optional): The candidate list size of HNSW searches. Defaults to 40.
+            ivf_probes (int, optional): The number of IVF clusters scored per query, in the local index or
+                the IVFFlat index. Defaults to 8.
+            embedding_length (int, optional): The dimension of the embeddings, needed to index them in PGVector.
+                Defaults to 1536, as OpenAI's models.
+            scheduler (OpenAIScheduler | None, optional): The scheduler of the requests of the default embeddings
+                model. Defaults to the process-wide scheduler.
+            coalesce (bool, optional): Whether concurrent identical searches share a single search. Defaults to True.
+            vector_precision (str, optional): The precision of the vectors scanned by searches, "float32", "float16",
+                "int8" (local index only) or "binary", with the candidates re-ranked at full precision.
+                Defaults to "float32".
+            rerank_factor (int | None, optional): The number of candidates per result re-ranked at full precision,
+                or None for the default of the precision. Defaults to None.
 
         Raises:
-            ValueError: If the NEON_CONNECTION_STRING environment variable is not set.
+            ValueError: If the backend or search mode is unknown, or if the NEON_CONNECTION_STRING environment
+                variable is not set for the "pgvector" backend.
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown vector store backend: {backend}")
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {search_mode}")
+        self.backend = backend
         self.connection_string = os.getenv("NEON_CONNECTION_STRING")
-        if not self.connection_string:
+        if backend == "pgvector" and not self.connection_string:
             raise ValueError("NEON_CONNECTION_STRING environment variable is required")
 
-        self.embeddings = OpenAIEmbeddings()
+        self.tracer = tracer
+        self.embeddings = embeddings or OpenAIEmbeddings(
+            **(scheduler or get_scheduler()).client_kwargs()
+        )
+        model_name = self.embeddings.model
+        if tracer:
+            # Traced below the cache, so that only actual model calls are recorded
+            self.embeddings = TracedEmbeddings(self.embeddings, model_name, tracer)
+        if embedding_cache_path:
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                model_name=model_name,
+                cache_path=embedding_cache_path,
+                max_entries=embedding_cache_size,
+            )
         self.collection_name = "insurance_docs"
 
-        logger.info("Initializing vector store")
-        self.vector_store = PGVector(
-            embeddings=self.embeddings,
-            collection_name=self.collection_name,
-            connection=self.connection_string,
-            use_jsonb=True,
+        logger.info(f"Initializing {backend} vector store")
+        # Backends are imported lazily, so that each run only loads the one it uses
+        if backend == "local":
+            from src.agents.local_vector_index import LocalVectorIndex
+
+            self.vector_store = LocalVectorIndex(
+                embeddings=self.embeddings,
+                path=os.path.join(local_index_path, self.collection_name),
+                ivf_lists=ivf_lists,
+                ivf_probes=ivf_probes,
+                precision=vector_precision,
+                rerank_factor=rerank_factor,
+            )
+        else:
+            from src.agents.pgvector_index import PGVectorIndex
+
+            self.vector_store = PGVectorIndex(
+                embeddings=self.embeddings,
+                connection_string=self.connection_string,
+                collection_name=self.collection_name,
+                embedding_length=embedding_length,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                index_type=vector_index,
+                ef_search=ef_search,
+                ivf_lists=ivf_lists,
+                ivf_probes=ivf_probes,
+                precision=vector_precision,
+                rerank_factor=rerank_factor,
+            )
+        self.search_mode = search_mode
+        self.keyword_index = (
+            KeywordIndex(keyword_index_path) if search_mode == "hybrid" else None
+        )
+        self._searches = SingleFlight("similarity_search", tracer) if coalesce else None
+
+    def _span(self, operation: str, store: str | None = None, **attributes: Any):
+        """
+        Times a vector store operation, if tracing is enabled.
+
+        Args:
+            operation (str): The name of the operation.
+            store (str | None, optional): The store running the operation. Defaults to the backend.
+            **attributes: Additional attributes of the span.
+
+        Returns:
+            ContextManager: The span context manager.
+        """
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(
+            "vector_query", f"{store or self.backend}.{operation}", **attributes
         )
 
     def add_documents(self, documents: List[Document]):
         """
         Adds a list of documents to the vector store.
 
+        Each document is stored under its own ID, so documents must have a unique `id` set.
+
         Args:
             documents (List[Document]): The list of documents to add.
         """
         logger.info(f"Adding {len(documents)} documents to vector store")
-        self.vector_store.add_documents(
-            documents, ids=[doc.metadata["source"] for doc in documents]
-        )
+        with self._span("add_documents", documents=len(documents)):
+            self.vector_store.add_documents(documents, ids=[doc.id for doc in documents])
+        if self.keyword_index:
+            self.keyword_index.add_documents(documents)
+
+    async def aadd_documents(self, documents: List[Document]):
+        """
+        Asynchronously adds a list of documents to the vector store.
+
+        This is the async counterpart of `add_documents`.
+
+        Args:
+            documents (List[Document]): The list of documents to add.
+        """
+        logger.info(f"Adding {len(documents)} documents to vector store")
+        with self._span("add_documents", documents=len(documents)):
+            await self.vector_store.aadd_documents(documents, ids=[doc.id for doc in documents])
+        if self.keyword_index:
+            self.keyword_index.add_documents(documents)
+
+    def create_vector_index(self):
+        """
+        Creates the ANN index of the "pgvector" backend, if it does not exist.
+
+        Call it once the collection is loaded, since an IVFFlat index clusters the existing vectors.
+        The local backend builds its IVF index on the first search, so there is nothing to do.
+        """
+        if self.backend == "pgvector":
+            with self._span("create_index"):
+                self.vector_store.create_index()
+
+    def delete(self, ids: List[str]):
+        """
+        Deletes the documents with the given IDs from the vector store.
+
+        Args:
+            ids (List[str]): The IDs of the documents to delete.
+        """
+        if not ids:
+            return
+        logger.info(f"Deleting {len(ids)} documents from vector store")
+        with self._span("delete", documents=len(ids)):
+            self.vector_store.delete(ids=ids)
+        if self.keyword_index:
+            self.keyword_index.delete(ids)
 
     def has_record(self, id: str) -> bool:
         """
@@ -66,20 +250,191 @@ class VectorStore:
         Returns:
             bool: True if the document exists, False otherwise.
         """
-        return len(self.vector_store.get_by_ids([id])) > 0
+        with self._span("get_by_ids", documents=1):
+            return len(self.vector_store.get_by_ids([id])) > 0
+
+    def existing_ids(self, ids: List[str]) -> set[str]:
+        """
+        Checks which of the given IDs exist in the vector store, with a single query.
+
+        In "hybrid" search mode, IDs missing from the keyword index are reported as missing too,
+        so that their documents are ingested again.
+
+        Args:
+            ids (List[str]): The IDs of the documents to check.
+
+        Returns:
+            set[str]: The subset of IDs that exist in the vector store.
+        """
+        if not ids:
+            return set()
+        with self._span("get_by_ids", documents=len(ids)):
+            existing = {doc.id for doc in self.vector_store.get_by_ids(ids)}
+        if self.keyword_index:
+            existing &= self.keyword_index.existing_ids(list(existing))
+        return existing
+
+    def embedding_cache_stats(self) -> Dict[str, float] | None:
+        """
+        Returns the hit and miss counters of the embedding cache.
+
+        Returns:
+            Dict[str, float] | None: The cache stats, or None if the embedding cache is disabled.
+        """
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.cache.stats()
+        return None
+
+    @staticmethod
+    def _metadata_filter(
+        start_year: int | None, end_year: int | None, source: str | None
+    ) -> dict | None:
+        """
+        Builds a metadata filter, in the PGVector filter syntax, that is applied by the store during the search.
+
+        Args:
+            start_year (int | None): Only match documents covering this year or later.
+            end_year (int | None): Only match documents covering this year or earlier.
+            source (str | None): Only match documents whose file name contains this text.
+
+        Returns:
+            dict | None: The filter, or None if there are no conditions.
+        """
+        clauses = []
+        if start_year is not None:
+            clauses.append({"year_end": {"$gte": start_year}})
+        if end_year is not None:
+            clauses.append({"year_start": {"$lte": end_year}})
+        if source:
+            clauses.append({"file_name": {"$ilike": f"%{source}%"}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
-    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+    @staticmethod
+    def _fuse(rankings: List[List[Document]], k: int) -> List[Document]:
+        """
+        Fuses rankings of documents with reciprocal rank fusion.
+
+        Args:
+            rankings (List[List[Document]]): The rankings, best match first.
+            k (int): The number of results to return.
+
+        Returns:
+            List[Document]: The best fused matches, best first.
+        """
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                scores[doc.id] = scores.get(doc.id, 0.0) + 1 / (_RRF_K + rank + 1)
+                documents.setdefault(doc.id, doc)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [documents[doc_id] for doc_id in best]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        start_year: int | None = None,
+        end_year: int | None = None,
+        source: str | None = None,
+    ) -> List[Document]:
         """
         Performs a similarity search for the given query.
 
+        In "hybrid" search mode, more candidates are retrieved by vector similarity and by BM25 keyword matching,
+        and their rankings are fused. Filters are applied by the stores during the search, not to its results.
+        Concurrent identical searches, e.g. by the agents of identical queries, share a single search.
+
         Args:
             query (str): The query to search for.
             k (int, optional): The number of results to return. Defaults to 4.
+            start_year (int | None, optional): Only match documents covering this year or later. Defaults to None.
+            end_year (int | None, optional): Only match documents covering this year or earlier. Defaults to None.
+            source (str | None, optional): Only match documents whose file name contains this text. Defaults to None.
 
         Returns:
             List[Document]: The list of matching documents.
         """
-        logger.info(f"Performing similarity search for: {query}")
-        matches = self.vector_store.similarity_search(query, k=k)
+        if self._searches is None:
+            return self._similarity_search(query, k, start_year, end_year, source)
+        key = (query, k, start_year, end_year, source)
+        # Each caller gets its own list of the shared documents
+        return list(self._searches.do(key, self._similarity_search, *key))
+
+    def _similarity_search(
+        self,
+        query: str,
+        k: int,
+        start_year: int | None,
+        end_year: int | None,
+        source: str | None,
+    ) -> List[Document]:
+        logger.info(f"Performing {self.search_mode} search for: {query}")
+        filter = self._metadata_filter(start_year, end_year, source)
+        fetch_k = k if self.keyword_index is None else 4 * k
+        with self._span("similarity_search", k=fetch_k):
+            matches = self.vector_store.similarity_search(query, k=fetch_k, filter=filter)
+        if self.keyword_index:
+            with self._span("search", store="keyword", k=fetch_k):
+                keyword_matches = self.keyword_index.search(
+                    query, fetch_k, start_year, end_year, source
+                )
+            matches = self._fuse([matches, keyword_matches], k)
+        logger.info(f"Retrieved {len(matches)} matches for query {query}")
+        return matches
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        start_year: int | None = None,
+        end_year: int | None = None,
+        source: str | None = None,
+    ) -> List[Document]:
+        """
+        Asynchronously performs a similarity search for the given query.
+
+        This is the async counterpart of `similarity_search`. The local backend awaits the query embedding natively,
+        and the PGVector store queries the database through its async engine.
+        The keyword index is local and fast, so it is queried inline.
+
+        Args:
+            query (str): The query to search for.
+            k (int, optional): The number of results to return. Defaults to 4.
+            start_year (int | None, optional): Only match documents covering this year or later. Defaults to None.
+            end_year (int | None, optional): Only match documents covering this year or earlier. Defaults to None.
+            source (str | None, optional): Only match documents whose file name contains this text. Defaults to None.
+
+        Returns:
+            List[Document]: The list of matching documents.
+        """
+        if self._searches is None:
+            return await self._asimilarity_search(query, k, start_year, end_year, source)
+        key = (query, k, start_year, end_year, source)
+        return list(await self._searches.ado(key, self._asimilarity_search, *key))
+
+    async def _asimilarity_search(
+        self,
+        query: str,
+        k: int,
+        start_year: int | None,
+        end_year: int | None,
+        source: str | None,
+    ) -> List[Document]:
+        logger.info(f"Performing async {self.search_mode} search for: {query}")
+        filter = self._metadata_filter(start_year, end_year, source)
+        fetch_k = k if self.keyword_index is None else 4 * k
+        with self._span("similarity_search", k=fetch_k):
+            matches = await self.vector_store.asimilarity_search(
+                query, k=fetch_k, filter=filter
+            )
+        if self.keyword_index:
+            with self._span("search", store="keyword", k=fetch_k):
+                keyword_matches = self.keyword_index.search(
+                    query, fetch_k, start_year, end_year, source
+                )
+            matches = self._fuse([matches, keyword_matches], k)
         logger.info(f"Retrieved {len(matches)} matches for query {query}")
         return matches
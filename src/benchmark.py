@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_MODULES = [
+    "agents.agent_graph",
+    "agents.vector_store",
+    "agents.document_processor",
+    "agents.expenditure_store",
+    "agents.batch_runner",
+    "agents.server",
+]
+
+
+def _run_python(args: list[str]) -> subprocess.CompletedProcess:
+    """
+    Runs a fresh Python interpreter from the source directory.
+
+    Args:
+        args (list[str]): The interpreter arguments.
+
+    Returns:
+        subprocess.CompletedProcess: The completed process, with captured output.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(SRC_DIR), SRC_DIR, env.get("PYTHONPATH", "")]
+    )
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def measure_import_time(module: str, top: int = 10) -> dict:
+    """
+    Measures the import time of a module and of its direct imports, with `python -X importtime`.
+
+    Args:
+        module (str): The module to import.
+        top (int, optional): The number of slowest direct imports to report. Defaults to 10.
+
+    Returns:
+        dict: The total import time and the slowest direct imports, in seconds.
+    """
+    stderr = _run_python(["-X", "importtime", "-c", f"import {module}"]).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+    total = next(seconds for depth, name, seconds in reversed(entries) if name == module)
+    # Direct imports of the module are the entries one level deeper that precede it
+    direct = [(name, seconds) for depth, name, seconds in entries if depth == 1]
+    direct.sort(key=lambda entry: entry[1], reverse=True)
+    return {
+        "total_s": round(total, 4),
+        "slowest_imports": [[name, round(seconds, 4)] for name, seconds in direct[:top]],
+    }
+
+
+def benchmark_startup(repeat: int = 5) -> dict:
+    """
+    Benchmarks the startup time of the CLI, and the import time of each application module.
+
+    Args:
+        repeat (int, optional): The number of `main.py --help` runs. Defaults to 5.
+
+    Returns:
+        dict: The median `--help` wall time and the import times per module, in seconds.
+    """
+    help_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_python(["main.py", "--help"])
+        help_times.append(time.perf_counter() - start)
+    results = {
+        "help_wall_s": round(statistics.median(help_times), 4),
+        "modules": {module: measure_import_time(module) for module in STARTUP_MODULES},
+    }
+    logger.info(f"main.py --help: {results['help_wall_s']:.3f}s")
+    for module, timing in results["modules"].items():
+        slowest = ", ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in timing["slowest_imports"][:3]
+        )
+        logger.info(f"import {module}: {timing['total_s']:.3f}s ({slowest})")
+    return results
+
+
+def _latency_stats(latencies: list[float]) -> dict[str, float]:
+    """
+    Summarises latencies.
+
+    Args:
+        latencies (list[float]): The latencies in seconds.
+
+    Returns:
+        dict[str, float]: The mean, p50, p95 and max latencies, in milliseconds.
+    """
+    latencies = sorted(latencies)
+    return {
+        "mean_ms": round(1000 * statistics.fmean(latencies), 3),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        "max_ms": round(1000 * latencies[-1], 3),
+    }
+
+
+def benchmark_ingestion(
+    docs_dir: str,
+    copies: int = 10,
+    workers: int | None = None,
+    batch_size: int = 256,
+    embedding_latency: float = 0.0,
+) -> dict:
+    """
+    Benchmarks document ingestion with DocumentProcessor, into a local index with fake embeddings.
+
+    The source documents are copied `copies` times under distinct names, to get a larger corpus.
+    A second run over the unchanged corpus measures the incremental path.
+
+    Args:
+        docs_dir (str): The directory of the source documents.
+        copies (int, optional): The number of copies of the corpus. Defaults to 10.
+        workers (int | None, optional): The number of worker processes. Defaults to the number of CPUs.
+        batch_size (int, optional): The maximum number of chunks per batch. Defaults to 256.
+        embedding_latency (float, optional): The latency of each embedding call in seconds. Defaults to 0.
+
+    Returns:
+        dict: The files/s and chunks/s of the full and incremental runs.
+    """
+    from agents.document_processor import DocumentProcessor
+    from agents.fake_models import FakeEmbeddings
+    from agents.vector_store import VectorStore
+
+    work_dir = tempfile.mkdtemp(prefix="ingestion_benchmark_")
+    try:
+        source_names = [name for name in os.listdir(docs_dir) if name.endswith(".xls")]
+        file_paths = []
+        for copy in range(copies):
+            for name in source_names:
+                file_path = os.path.join(work_dir, "docs", f"{copy:04d}_{name}")
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                shutil.copyfile(os.path.join(docs_dir, name), file_path)
+                file_paths.append(file_path)
+        vector_store = VectorStore(
+            backend="local",
+            local_index_path=os.path.join(work_dir, "index"),
+            embedding_cache_path=None,
+            embeddings=FakeEmbeddings(call_latency=embedding_latency),
+            keyword_index_path=os.path.join(work_dir, "keywords.sqlite"),
+        )
+        processor = DocumentProcessor(
+            vector_store, manifest_path=os.path.join(work_dir, "manifest.json")
+        )
+        results = {"files": len(file_paths), "workers": workers or os.cpu_count()}
+        for run in ("full", "incremental"):
+            start = time.perf_counter()
+            stats = processor.process_many(file_paths, workers=workers, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            results[run] = {
+                "seconds": round(elapsed, 4),
+                "files_processed": stats["files"],
+                "chunks": stats["chunks"],
+                "files_per_s": round(len(file_paths) / elapsed, 2),
+                "chunks_per_s": round(stats["chunks"] / elapsed, 2),
+            }
+            logger.info(f"Ingestion ({run}): {results[run]}")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_loaders(docs_dir: str) -> dict:
+    """
+    Benchmarks the document loaders, and checks that they extract the same text.
+
+    Args:
+        docs_dir (str): The directory of the source documents.
+
+    Returns:
+        dict: The files/s of each loader, and the files whose documents differ between the loaders.
+    """
+    from agents.fast_html_loader import FastHTMLLoader
+    from langchain_community.document_loaders import UnstructuredHTMLLoader
+
+    os.environ.setdefault("SCARF_NO_ANALYTICS", "true")
+    file_paths = sorted(
+        os.path.join(docs_dir, name) for name in os.listdir(docs_dir) if name.endswith(".xls")
+    )
+    results = {"files": len(file_paths)}
+    documents = {}
+    for name, loader_class in (("fast", FastHTMLLoader), ("unstructured", UnstructuredHTMLLoader)):
+        start = time.perf_counter()
+        documents[name] = [loader_class(file_path).load() for file_path in file_paths]
+        elapsed = time.perf_counter() - start
+        results[name] = {"seconds": round(elapsed, 4), "files_per_s": round(len(file_paths) / elapsed, 2)}
+        logger.info(f"Loader ({name}): {results[name]}")
+    results["different_files"] = [
+        os.path.basename(file_path)
+        for file_path, fast, unstructured in zip(file_paths, documents["fast"], documents["unstructured"])
+        if [(doc.page_content, doc.metadata) for doc in fast]
+        != [(doc.page_content, doc.metadata) for doc in unstructured]
+    ]
+    return results
+
+
+def benchmark_search(
+    sizes: list[int],
+    queries: int = 100,
+    k: int = 4,
+    dim: int = 1536,
+    ivf_lists: int | None = None,
+    search_mode: str = "vector",
+    start_year: int | None = None,
+    precision: str = "float32",
+    rerank_factor: int | None = None,
+) -> dict:
+    """
+    Benchmarks VectorStore.similarity_search latency at increasing collection sizes, on the local backend
+    standing in for PGVector, with fake embeddings.
+
+    At a reduced precision, the recall@k of the index is also measured against exact float32 search, with queries
+    near indexed vectors (an indexed vector plus noise), as real queries are near their answers.
+
+    Args:
+        sizes (list[int]): The collection sizes.
+        queries (int, optional): The number of queries per size. Defaults to 100.
+        k (int, optional): The number of results per query. Defaults to 4.
+        dim (int, optional): The dimension of the vectors. Defaults to 1536.
+        ivf_lists (int | None, optional): The number of IVF clusters, or None for exact search. Defaults to None.
+        search_mode (str, optional): The search mode, "vector" or "hybrid". Defaults to "vector".
+        start_year (int | None, optional): If set, filter the searches on documents from this year on.
+            Defaults to None.
+        precision (str, optional): The precision of the scanned vectors. Defaults to "float32".
+        rerank_factor (int | None, optional): The number of candidates per result re-ranked at full precision,
+            or None for the default of the precision. Defaults to None.
+
+    Returns:
+        dict: The latency statistics, the bytes scanned and stored per vector and the recall per collection size.
+    """
+    import numpy as np
+    from langchain_core.documents import Document
+
+    from agents.fake_models import FakeEmbeddings
+    from agents.local_vector_index import LocalVectorIndex
+    from agents.vector_store import VectorStore
+
+    results = {}
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((256, dim), dtype=np.float32)
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix="search_benchmark_")
+        try:
+            vector_store = VectorStore(
+                backend="local",
+                local_index_path=work_dir,
+                ivf_lists=ivf_lists,
+                embedding_cache_path=None,
+                embeddings=FakeEmbeddings(size=dim),
+                search_mode=search_mode,
+                keyword_index_path=os.path.join(work_dir, "keywords.sqlite"),
+                vector_precision=precision,
+                rerank_factor=rerank_factor,
+            )
+            for offset in range(0, size, 10_000):
+                count = min(10_000, size - offset)
+                ids = [f"doc-{offset + index}" for index in range(count)]
+                documents = [
+                    Document(
+                        id=doc_id,
+                        page_content=f"average expenditure {doc_id} in {1990 + index % 35}",
+                        metadata={"year_start": 1990 + index % 35, "year_end": 1990 + index % 35},
+                    )
+                    for index, doc_id in enumerate(ids)
+                ]
+                # Vectors are random, so that the embedding time does not count in the setup, and clustered
+                # around topics like real embeddings, so that the nearest neighbours are not ties
+                vectors = topics[rng.integers(0, len(topics), count)] + rng.standard_normal((count, dim), dtype=np.float32)
+                vector_store.vector_store.add_embeddings(documents, vectors, ids)
+                if vector_store.keyword_index:
+                    vector_store.keyword_index.add_documents(documents)
+            # The first query may build the IVF index, so it is not measured
+            vector_store.similarity_search("warm-up", k=k, start_year=start_year)
+            latencies = []
+            for index in range(queries):
+                start = time.perf_counter()
+                vector_store.similarity_search(
+                    f"expenditure in {1990 + index % 35}", k=k, start_year=start_year
+                )
+                latencies.append(time.perf_counter() - start)
+            index = vector_store.vector_store
+            results[str(size)] = {
+                **_latency_stats(latencies),
+                "qps": round(len(latencies) / sum(latencies), 2),
+                # The float32 vectors are kept next to the codes, for the re-ranking
+                "scanned_bytes_per_vector": round(
+                    sum(
+                        os.path.getsize(path)
+                        for path in {index._codes_path, index._scales_path}
+                        if os.path.exists(path)
+                    )
+                    / size,
+                    1,
+                ),
+                "stored_bytes_per_vector": round(
+                    sum(
+                        os.path.getsize(path)
+                        for path in {index._vectors_path, index._codes_path, index._scales_path}
+                        if os.path.exists(path)
+                    )
+                    / size,
+                    1,
+                ),
+            }
+            if precision != "float32":
+                # The same files, searched exactly
+                exact_index = LocalVectorIndex(
+                    index.embeddings, index.path, ivf_lists=ivf_lists, ivf_probes=index.ivf_probes
+                )
+                hits = 0
+                for row in rng.integers(0, size, queries):
+                    vector = index._vectors[row] + 0.5 * rng.standard_normal(dim, dtype=np.float32) / np.sqrt(dim)
+                    expected = {doc.id for doc in exact_index.similarity_search_by_vector(vector, k=k)}
+                    hits += len(expected & {doc.id for doc in index.similarity_search_by_vector(vector, k=k)})
+                results[str(size)]["recall"] = round(hits / (queries * k), 4)
+            logger.info(f"Search over {size} vectors: {results[str(size)]}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_earnings_calls(sizes: list[int], queries: int = 100) -> dict:
+    """
+    Benchmarks EarningsCallStore.get_records latency and output size at increasing archive sizes.
+    The archive is made of copies of the illustrative earnings calls, each for a different company.
+
+    Args:
+        sizes (list[int]): The archive sizes.
+        queries (int, optional): The number of queries per size. Defaults to 100.
+
+    Returns:
+        dict: The latency statistics and the maximum number of tokens returned per archive size.
+    """
+    from agents.earnings_call_data import earnings_call_01, earnings_call_02, earnings_call_03
+    from agents.earnings_call_store import EarningsCallStore
+    from agents.token_counter import count_tokens
+
+    samples = [earnings_call_01, earnings_call_02, earnings_call_03]
+    results = {}
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix="earnings_calls_benchmark_")
+        try:
+            store = EarningsCallStore(os.path.join(work_dir, "earnings_calls.sqlite"))
+            store.add_records(
+                [
+                    samples[index % len(samples)].replace("AutoGuard", f"Insurer{index}")
+                    for index in range(size)
+                ]
+            )
+            latencies = []
+            tokens = 0
+            for index in range(queries):
+                start = time.perf_counter()
+                records = store.get_records(f"Insurer{index % size} net income guidance")
+                latencies.append(time.perf_counter() - start)
+                tokens = max(tokens, count_tokens("\n".join(records)))
+            results[str(size)] = {**_latency_stats(latencies), "max_tokens": tokens}
+            logger.info(f"Earnings calls over {size} records: {results[str(size)]}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_graph(
+    concurrency_levels: list[int],
+    queries: int = 64,
+    first_token_latency: float = 0.0,
+    token_latency: float = 0.0,
+    output_tokens: int = 50,
+) -> dict:
+    """
+    Benchmarks end-to-end runs of the agent graph at increasing query concurrency, with a fake LLM,
+    fake embeddings and a local index. With zero model latency, the results measure the overhead of the graph itself.
+
+    Args:
+        concurrency_levels (list[int]): The numbers of queries running at once.
+        queries (int, optional): The number of queries per concurrency level. Defaults to 64.
+        first_token_latency (float, optional): The fake LLM time to first token in seconds. Defaults to 0.
+        token_latency (float, optional): The fake LLM time per output token in seconds. Defaults to 0.
+        output_tokens (int, optional): The number of tokens of each fake LLM answer. Defaults to 50.
+
+    Returns:
+        dict: The latency statistics and throughput per concurrency level.
+    """
+    from langchain_core.documents import Document
+
+    from agents.agent_graph import create_agent_graph
+    from agents.batch_runner import run_query
+    from agents.fake_models import FakeChatModel, FakeEmbeddings
+    from agents.earnings_call_data import earnings_call_01, earnings_call_02, earnings_call_03
+    from agents.earnings_call_store import EarningsCallStore
+    from agents.vector_store import VectorStore
+
+    work_dir = tempfile.mkdtemp(prefix="graph_benchmark_")
+    try:
+        vector_store = VectorStore(
+            backend="local",
+            local_index_path=work_dir,
+            embedding_cache_path=None,
+            embeddings=FakeEmbeddings(),
+            keyword_index_path=os.path.join(work_dir, "keywords.sqlite"),
+        )
+        vector_store.add_documents(
+            [Document(page_content=f"document {index}", id=str(index)) for index in range(100)]
+        )
+        llm = FakeChatModel(
+            first_token_latency=first_token_latency,
+            token_latency=token_latency,
+            output_tokens=output_tokens,
+        )
+        earnings_call_store = EarningsCallStore(os.path.join(work_dir, "earnings_calls.sqlite"))
+        earnings_call_store.add_records([earnings_call_01, earnings_call_02, earnings_call_03])
+        graph = create_agent_graph(vector_store, earnings_call_store, llm=llm)
+
+        async def run_level(concurrency: int) -> tuple[list[float], float, int]:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def run_bounded(index: int) -> dict:
+                async with semaphore:
+                    return await run_query(graph, {"id": index, "query": f"query {index}"})
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(run_bounded(index) for index in range(queries)))
+            elapsed = time.perf_counter() - start
+            failed = sum("error" in result for result in results)
+            return [result["timings"]["total"] for result in results], elapsed, failed
+
+        results = {}
+        for concurrency in concurrency_levels:
+            latencies, elapsed, failed = asyncio.run(run_level(concurrency))
+            results[str(concurrency)] = {
+                **_latency_stats(latencies),
+                "throughput_qps": round(queries / elapsed, 2),
+                "failed": failed,
+            }
+            logger.info(f"Graph at concurrency {concurrency}: {results[str(concurrency)]}")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    """
+    The entry point of the benchmark suite. Results are printed to stdout as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description="Insurance Data Analysis Pipeline benchmarks"
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    startup_parser = subparsers.add_parser(
+        "startup", help="CLI startup and module import times"
+    )
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Number of runs")
+
+    ingestion_parser = subparsers.add_parser(
+        "ingestion", help="Document ingestion throughput, with fake embeddings"
+    )
+    ingestion_parser.add_argument(
+        "--docs-dir", type=str, default="../iii.org", help="Path to directory with source documents"
+    )
+    ingestion_parser.add_argument(
+        "--copies", type=int, default=10, help="Number of copies of the source documents"
+    )
+    ingestion_parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes"
+    )
+    ingestion_parser.add_argument(
+        "--batch-size", type=int, default=256, help="Maximum number of chunks per batch"
+    )
+    ingestion_parser.add_argument(
+        "--embedding-latency", type=float, default=0.0, help="Latency of each embedding call, in seconds"
+    )
+
+    loaders_parser = subparsers.add_parser(
+        "loaders", help="Document loader throughput, and the files the loaders extract differently"
+    )
+    loaders_parser.add_argument(
+        "--docs-dir", type=str, default="../iii.org", help="Path to directory with source documents"
+    )
+
+    search_parser = subparsers.add_parser(
+        "search", help="Similarity search latency at increasing collection sizes"
+    )
+    search_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000], help="Collection sizes"
+    )
+    search_parser.add_argument("--queries", type=int, default=100, help="Number of queries per size")
+    search_parser.add_argument("--k", type=int, default=4, help="Number of results per query")
+    search_parser.add_argument("--dim", type=int, default=1536, help="Dimension of the vectors")
+    search_parser.add_argument(
+        "--ivf-lists", type=int, default=None, help="Number of IVF clusters (exact search if unset)"
+    )
+    search_parser.add_argument(
+        "--search-mode", type=str, choices=("vector", "hybrid"), default="vector", help="Search mode"
+    )
+    search_parser.add_argument(
+        "--start-year", type=int, default=None, help="Filter the searches on documents from this year on"
+    )
+    search_parser.add_argument(
+        "--precision",
+        type=str,
+        choices=("float32", "float16", "int8", "binary"),
+        default="float32",
+        help="Precision of the scanned vectors (re-ranked at full precision, with the recall measured)",
+    )
+    search_parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        default=None,
+        help="Number of candidates per result re-ranked at full precision (default of the precision if unset)",
+    )
+
+    earnings_calls_parser = subparsers.add_parser(
+        "earnings-calls", help="Earnings call retrieval latency and output size at increasing archive sizes"
+    )
+    earnings_calls_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1_000, 10_000], help="Archive sizes"
+    )
+    earnings_calls_parser.add_argument(
+        "--queries", type=int, default=100, help="Number of queries per size"
+    )
+
+    graph_parser = subparsers.add_parser(
+        "graph", help="End-to-end graph latency and throughput at increasing concurrency, with a fake LLM"
+    )
+    graph_parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="Concurrency levels"
+    )
+    graph_parser.add_argument(
+        "--queries", type=int, default=64, help="Number of queries per concurrency level"
+    )
+    graph_parser.add_argument(
+        "--first-token-latency", type=float, default=0.0, help="Fake LLM time to first token, in seconds"
+    )
+    graph_parser.add_argument(
+        "--token-latency", type=float, default=0.0, help="Fake LLM time per output token, in seconds"
+    )
+    graph_parser.add_argument(
+        "--output-tokens", type=int, default=50, help="Number of tokens of each fake LLM answer"
+    )
+
+    args = parser.parse_args()
+    # Per-call logs of the agents and stores would dominate the measurements
+    for name in ("agents", "src.agents"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    if args.benchmark == "startup":
+        results = benchmark_startup(repeat=args.repeat)
+    elif args.benchmark == "ingestion":
+        results = benchmark_ingestion(
+            args.docs_dir,
+            copies=args.copies,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            embedding_latency=args.embedding_latency,
+        )
+    elif args.benchmark == "loaders":
+        results = benchmark_loaders(args.docs_dir)
+    elif args.benchmark == "search":
+        results = benchmark_search(
+            args.sizes,
+            queries=args.queries,
+            k=args.k,
+            dim=args.dim,
+            ivf_lists=args.ivf_lists,
+            search_mode=args.search_mode,
+            start_year=args.start_year,
+            precision=args.precision,
+            rerank_factor=args.rerank_factor,
+        )
+    elif args.benchmark == "earnings-calls":
+        results = benchmark_earnings_calls(args.sizes, queries=args.queries)
+    else:
+        results = benchmark_graph(
+            args.concurrency,
+            queries=args.queries,
+            first_token_latency=args.first_token_latency,
+            token_latency=args.token_latency,
+            output_tokens=args.output_tokens,
+        )
+    print(json.dumps({"benchmark": args.benchmark, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,31 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
 import logging
 import os
+from typing import TYPE_CHECKING
 
-from langgraph.graph import END, START, Graph, StateGraph
+# Heavy modules (langchain, langgraph, numpy, ...) are imported by the code paths that need them,
+# so that `--help` and query-only runs start fast
+if TYPE_CHECKING:
+    from langgraph.graph import Graph
 
-from agents.agent_state import AgentState
-from agents.document_processor import DocumentProcessor
-from agents.earnings_call_agent import EarningsCallAgent
-from agents.insurance_analysis_agent import InsuranceAnalysisAgent
-from agents.risk_assessment_agent import RiskAssessmenttAgent
-from agents.simple_store import SimpleStore
-from agents.vector_store import VectorStore
+    from agents.instrumentation import Tracer
+    from agents.llm_cache import LLMResponseCache
+    from agents.vector_store import VectorStore
+    from src.agents.openai_scheduler import OpenAIScheduler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def create_agent_graph(vector_store: VectorStore, simple_store: SimpleStore) -> Graph:
+def parse_args() -> argparse.Namespace:
     """
-    Creates a graph of agents for insurance data analysis.
-
-    Args:
-        vector_store (VectorStore): The vector store used by the agents.
-        simple_store (SimpleStore): The simple store used by the agents.
+    Parses the command line arguments.
 
     Returns:
-        Graph: The compiled graph of agents.
-    """
-    analysis_agent = InsuranceAnalysisAgent(vector_store)
-    risk_assessment_agent = RiskAssessmenttAgent()
-    earnings_call_agent = EarningsCallAgent(simple_store)
-
-    graph = StateGraph(AgentState)
-
-    graph.add_node("insurance_agent", analysis_agent.run)
-    graph.add_node("risk_assessment_agent", risk_assessment_agent.run)
-    graph.add_node("earnings_call_agent", earnings_call_agent.run)
-
-    graph.add_edge(START, "insurance_agent")
-    graph.add_edge(START, "risk_assessment_agent")
-    graph.add_edge("insurance_agent", "earnings_call_agent")
-    graph.add_edge("risk_assessment_agent", "earnings_call_agent")
-    graph.add_edge("earnings_call_agent", END)
-
-    return graph.compile()
-
-
-def main():
-    """
-    The main entry point of the insurance data analysis pipeline.
-
-    This function initializes the dependencies, loads the source documents, creates the agent graph,
-    and runs the graph to produce the analysis results.
+        argparse.Namespace: The parsed arguments.
     """
     parser = argparse.ArgumentParser(description="Insurance Data Analysis Pipeline")
     parser.add_argument(
@@ -68,43 +40,562 @@ def main():
         help="Analysis query to run",
         default="What's the trend in auto insurance costs over the last 3 years?",
     )
+    parser.add_argument(
+        "--manifest-path",
+        type=str,
+        help="Path to the ingestion manifest recording which documents are already embedded",
+        default="ingestion_manifest.json",
+    )
+    parser.add_argument(
+        "--vector-backend",
+        type=str,
+        choices=("pgvector", "local"),
+        help="Vector store backend: PGVector on Neon, or a local on-disk index",
+        default=os.getenv("VECTOR_STORE_BACKEND", "pgvector"),
+    )
+    parser.add_argument(
+        "--local-index-path",
+        type=str,
+        help="Directory of the local vector index",
+        default="vector_index",
+    )
+    parser.add_argument(
+        "--ivf-lists",
+        type=int,
+        help="Number of IVF clusters for approximate search in the local vector index (exact search if unset), "
+        "or of the PGVector IVFFlat index (derived from the collection size if unset)",
+        default=None,
+    )
+    parser.add_argument(
+        "--ivf-probes",
+        type=int,
+        help="Number of IVF clusters scored per query",
+        default=8,
+    )
+    parser.add_argument(
+        "--vector-index",
+        type=str,
+        choices=("hnsw", "ivfflat", "none"),
+        help="Approximate nearest neighbour index of the PGVector embeddings",
+        default="hnsw",
+    )
+    parser.add_argument(
+        "--vector-precision",
+        type=str,
+        choices=("float32", "float16", "int8", "binary"),
+        help="Precision of the vectors scanned by searches, with the candidates re-ranked at full precision "
+        "(int8 with the local vector index only)",
+        default="float32",
+    )
+    parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        help="Number of candidates per result re-ranked at full precision (default of the precision if unset)",
+        default=None,
+    )
+    parser.add_argument(
+        "--ef-search",
+        type=int,
+        help="Candidate list size of PGVector HNSW searches, trading latency for recall",
+        default=40,
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="Number of PGVector database connections kept open",
+        default=5,
+    )
+    parser.add_argument(
+        "--max-overflow",
+        type=int,
+        help="Number of additional PGVector database connections opened under load",
+        default=10,
+    )
+    parser.add_argument(
+        "--search-mode",
+        type=str,
+        choices=("hybrid", "vector"),
+        help="Document search: BM25 keyword and vector rankings fused, or vector similarity only",
+        default="hybrid",
+    )
+    parser.add_argument(
+        "--keyword-index-path",
+        type=str,
+        help="Path to the keyword index of the hybrid search mode",
+        default="keyword_index.sqlite",
+    )
+    parser.add_argument(
+        "--embedding-cache-path",
+        type=str,
+        help="Path to the on-disk embedding cache (empty to disable)",
+        default="embedding_cache.sqlite",
+    )
+    parser.add_argument(
+        "--checkpoint-path",
+        type=str,
+        help="Path to the checkpoints of single-query runs, so that an interrupted run of a query is resumed "
+        "(empty to disable)",
+        default="checkpoints.sqlite",
+    )
+    parser.add_argument(
+        "--node-cache-path",
+        type=str,
+        help="Path to the cache of the upstream agents' outputs, reused by runs of the same query (empty to disable)",
+        default="node_cache.sqlite",
+    )
+    parser.add_argument(
+        "--node-cache-ttl",
+        type=float,
+        help="Number of seconds a cached output of an upstream agent is reused for",
+        default=24 * 3600,
+    )
+    parser.add_argument(
+        "--llm-cache-path",
+        type=str,
+        help="Path to the cache of the upstream agents' model responses (empty to disable)",
+        default="llm_cache.sqlite",
+    )
+    parser.add_argument(
+        "--llm-cache-agents",
+        type=str,
+        nargs="*",
+        choices=("insurance_agent", "risk_assessment_agent"),
+        help="Agents whose model responses are cached",
+        default=["insurance_agent", "risk_assessment_agent"],
+    )
+    parser.add_argument(
+        "--llm-cache-ttl",
+        type=float,
+        help="Number of seconds a cached model response is reused for",
+        default=24 * 3600,
+    )
+    parser.add_argument(
+        "--llm-cache-size",
+        type=int,
+        help="Maximum number of model responses kept in the cache, per agent",
+        default=10_000,
+    )
+    parser.add_argument(
+        "--embedding-cache-size",
+        type=int,
+        help="Maximum number of embeddings kept in the on-disk cache",
+        default=100_000,
+    )
+    parser.add_argument(
+        "--expenditure-store-path",
+        type=str,
+        help="Path to the structured store of yearly expenditures extracted from the documents",
+        default="expenditures.npz",
+    )
+    parser.add_argument(
+        "--earnings-call-store-path",
+        type=str,
+        help="Path to the archive of previous earnings calls",
+        default="earnings_calls.sqlite",
+    )
+    parser.add_argument(
+        "--earnings-calls-dir",
+        type=str,
+        help="Path to a directory of earnings call reports (.txt or .md) to add to the archive",
+        default=None,
+    )
+    parser.add_argument(
+        "--market-analysis-token-budget",
+        type=int,
+        help="Maximum number of tokens of the market analysis in the earnings call prompt",
+        default=1500,
+    )
+    parser.add_argument(
+        "--risk-assessment-token-budget",
+        type=int,
+        help="Maximum number of tokens of the risk assessment in the earnings call prompt",
+        default=1000,
+    )
+    parser.add_argument(
+        "--summary-model",
+        type=str,
+        help="Cheap OpenAI model summarizing the reports over budget (extractive trimming only if unset)",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-agent-iterations",
+        type=int,
+        help="Maximum number of model turns of each tools agent, before it answers with the tool results so far",
+        default=8,
+    )
+    parser.add_argument(
+        "--max-agent-time",
+        type=float,
+        help="Maximum number of seconds of each tools agent run, before it answers with the tool results so far",
+        default=120.0,
+    )
+    parser.add_argument(
+        "--model-config",
+        type=str,
+        help="Path to a JSON file with the provider, model, max_tokens, timeout and hedge model of each agent",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-coalesce",
+        action="store_true",
+        help="Do not share the graph runs, agent runs and searches of identical queries running at once",
+    )
+    parser.add_argument(
+        "--openai-rpm",
+        type=float,
+        help="Requests per minute allowed per OpenAI model by the account",
+        default=3500,
+    )
+    parser.add_argument(
+        "--openai-tpm",
+        type=float,
+        help="Tokens per minute allowed per OpenAI model by the account",
+        default=200_000,
+    )
+    parser.add_argument(
+        "--openai-max-concurrency",
+        type=int,
+        help="Maximum number of OpenAI requests in flight (adapted down on rate limit errors and latency spikes)",
+        default=16,
+    )
+    parser.add_argument(
+        "--loader",
+        type=str,
+        choices=("fast", "unstructured"),
+        help="Document loader: a lightweight HTML table parser falling back to unstructured, or unstructured only",
+        default="fast",
+    )
+    parser.add_argument(
+        "--skip-ingestion",
+        action="store_true",
+        help="Do not check or ingest source documents, and query the vector store as is",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes for document ingestion (defaults to the number of CPUs)",
+        default=None,
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Maximum number of document chunks per embedding and insert batch",
+        default=256,
+    )
+    parser.add_argument(
+        "--batch-file",
+        type=str,
+        help="Run all queries from a file (one query or JSON object per line, '-' for stdin) instead of --query",
+        default=None,
+    )
+    parser.add_argument(
+        "--batch-output",
+        type=str,
+        help="Path to the JSON lines output of batch mode (defaults to stdout)",
+        default=None,
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Maximum number of queries running concurrently in batch and server modes",
+        default=8,
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a long-running HTTP server that keeps the agent graph warm",
+    )
+    parser.add_argument(
+        "--host", type=str, help="Host to listen on in server mode", default="127.0.0.1"
+    )
+    parser.add_argument(
+        "--port", type=int, help="Port to listen on in server mode", default=8000
+    )
+    parser.add_argument(
+        "--unix-socket",
+        type=str,
+        help="Unix socket to listen on in server mode, instead of host and port",
+        default=None,
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Run the graph with blocking calls instead of on an asyncio event loop",
+    )
+    parser.add_argument(
+        "--render-graph",
+        type=str,
+        nargs="?",
+        const="graph_chart.png",
+        help="Render the agent graph to a PNG file (graph_chart.png by default), if its topology changed",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-output",
+        type=str,
+        help="Export the latency, token and cost trace of the run (Prometheus text if the path ends in .prom, "
+        "JSON lines otherwise)",
+        default=None,
+    )
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
 
-    args = parser.parse_args()
+    return parser.parse_args()
 
-    if args.debug:
-        logging.getLogger().setLevel(logging.DEBUG)
+
+def setup(
+    args: argparse.Namespace,
+    tracer: "Tracer | None" = None,
+    scheduler: "OpenAIScheduler | None" = None,
+) -> tuple["Graph", "VectorStore", dict[str, "LLMResponseCache"]]:
+    """
+    Initializes the dependencies, loads the source documents and creates the agent graph.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+        tracer (Tracer | None, optional): A tracer recording the latency, tokens and cost of the run. Defaults to None.
+        scheduler (OpenAIScheduler | None, optional): The scheduler every OpenAI request goes through.
+            Defaults to the process-wide scheduler with the default limits.
+
+    Returns:
+        tuple[Graph, VectorStore, dict[str, LLMResponseCache]]: The compiled graph of agents, the vector store
+            it uses and the caches of the agents' model responses.
+    """
+    from agents.agent_graph import create_agent_graph
+    from agents.context_assembler import ContextAssembler
+    from agents.earnings_call_store import EarningsCallStore
+    from agents.expenditure_store import ExpenditureStore
+    from agents.llm_cache import create_llm_caches
+    from agents.model_routing import load_model_configs
+    from agents.node_cache import NodeCache, SqliteCheckpointer
+    from agents.vector_store import VectorStore
+    from src.agents.openai_scheduler import Priority, request_priority
 
     # Initialize dependencies
-    vector_store = VectorStore()
-    doc_processor = DocumentProcessor(vector_store)
-    simple_store = SimpleStore()
+    vector_store = VectorStore(
+        backend=args.vector_backend,
+        local_index_path=args.local_index_path,
+        ivf_lists=args.ivf_lists,
+        embedding_cache_path=args.embedding_cache_path or None,
+        embedding_cache_size=args.embedding_cache_size,
+        tracer=tracer,
+        search_mode=args.search_mode,
+        keyword_index_path=args.keyword_index_path,
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+        vector_index=None if args.vector_index == "none" else args.vector_index,
+        ef_search=args.ef_search,
+        ivf_probes=args.ivf_probes,
+        scheduler=scheduler,
+        coalesce=not args.no_coalesce,
+        vector_precision=args.vector_precision,
+        rerank_factor=args.rerank_factor,
+    )
+    earnings_call_store = EarningsCallStore(args.earnings_call_store_path)
+    if args.earnings_calls_dir:
+        earnings_call_store.load_directory(args.earnings_calls_dir)
+    elif not len(earnings_call_store):
+        from agents.earnings_call_data import earnings_call_01, earnings_call_02, earnings_call_03
+
+        # Start from the illustrative calls when no archive is provided
+        earnings_call_store.add_records([earnings_call_01, earnings_call_02, earnings_call_03])
 
     # Load documents, if needed
     # Note that provided documents have extension XLS but are actually HTML
     source_files = [f for f in os.listdir(args.docs_dir) if f.endswith(".xls")]
     logger.info(f"Found {len(source_files)} source files at {args.docs_dir}")
-    for source_file in source_files:
-        source_file_path = os.path.join(args.docs_dir, source_file)
-        doc_processor.process(source_file_path)
+    source_file_paths = [
+        os.path.join(args.docs_dir, source_file) for source_file in source_files
+    ]
+    if args.skip_ingestion:
+        logger.info("Skipping document ingestion")
+    else:
+        from agents.document_processor import DocumentProcessor
+
+        doc_processor = DocumentProcessor(
+            vector_store, manifest_path=args.manifest_path, loader=args.loader
+        )
+        # Ingestion yields to queries for the OpenAI rate limits
+        with request_priority(Priority.INGESTION):
+            doc_processor.process_many(
+                source_file_paths, workers=args.workers, batch_size=args.batch_size
+            )
+        vector_store.create_vector_index()
+    expenditure_store = ExpenditureStore.load_or_build(
+        args.expenditure_store_path, source_file_paths
+    )
 
     # Create the agent graph
-    graph = create_agent_graph(vector_store, simple_store)
-    graph.get_graph().draw_mermaid_png(output_file_path="graph_chart.png")
+    summarizer = None
+    if args.summary_model:
+        from langchain_openai import ChatOpenAI
 
-    # Initialize the state
-    initial_state = AgentState(
-        query=args.query, market_analysis="", earnings_call_report="", history=[]
+        from src.agents.openai_scheduler import get_scheduler
+
+        summarizer = ChatOpenAI(
+            model=args.summary_model, temperature=0, **(scheduler or get_scheduler()).client_kwargs()
+        )
+    context_assembler = ContextAssembler(
+        budgets={
+            "market_analysis": args.market_analysis_token_budget,
+            "risk_assessment": args.risk_assessment_token_budget,
+        },
+        summarizer=summarizer,
+    )
+    # Concurrent runs of the same query would share a checkpoint thread, so only single-query runs are checkpointed
+    checkpointer = None
+    if args.checkpoint_path and not (args.serve or args.batch_file):
+        checkpointer = SqliteCheckpointer(args.checkpoint_path)
+    node_cache = NodeCache(args.node_cache_path, args.node_cache_ttl) if args.node_cache_path else None
+    llm_caches = {}
+    if args.llm_cache_path:
+        llm_caches = create_llm_caches(
+            args.llm_cache_path, args.llm_cache_agents, args.llm_cache_ttl, args.llm_cache_size
+        )
+    model_configs = load_model_configs(args.model_config) if args.model_config else {}
+    unknown_agents = set(model_configs) - {"insurance_agent", "risk_assessment_agent", "earnings_call_agent"}
+    if unknown_agents:
+        raise ValueError(f"Unknown agents in {args.model_config}: {', '.join(sorted(unknown_agents))}")
+    graph = create_agent_graph(
+        vector_store,
+        earnings_call_store,
+        expenditure_store,
+        tracer,
+        context_assembler=context_assembler,
+        checkpointer=checkpointer,
+        node_cache=node_cache,
+        llm_caches=llm_caches,
+        max_agent_iterations=args.max_agent_iterations,
+        max_agent_time=args.max_agent_time,
+        model_configs=model_configs,
+        scheduler=scheduler,
+        coalesce=not args.no_coalesce,
     )
+    return graph, vector_store, llm_caches
 
-    # Run the graph
-    for idx, state in enumerate(graph.stream(initial_state)):
-        logger.info(f"STEP {idx}: {state}")
 
-    logger.info("Analysis complete!")
+async def stream_answer(graph: "Graph", query: str) -> dict:
+    """
+    Runs the graph for a query, printing the final report to stdout as its tokens are generated.
+
+    Args:
+        graph (Graph): The compiled graph of agents.
+        query (str): The analysis query.
+
+    Returns:
+        dict: The final state of the graph.
+    """
+    from agents.agent_graph import astream_query
+
+    streamed = False
+    async for event in astream_query(graph, query):
+        if event["event"] == "node":
+            logger.info(f"Node {event['node']} completed after {event['elapsed']:.2f}s")
+        elif event["event"] == "token":
+            print(event["text"], end="", flush=True)
+            streamed = True
+        else:
+            state = event["state"]
+    if not streamed:
+        print(state["earnings_call_report"], end="")
+    print()
+    return state
+
+
+def report_trace(tracer: "Tracer", output_path: str | None):
+    """
+    Logs the summary table of a run's trace, and exports the trace if requested.
+
+    Args:
+        tracer (Tracer): The tracer of the run.
+        output_path (str | None): The path to export the trace to, or None.
+    """
+    logger.info(f"Run summary:\n{tracer.summary_table()}")
+    if output_path:
+        tracer.export(output_path)
+
+
+def main():
+    """
+    The main entry point of the insurance data analysis pipeline.
+
+    This function initializes the dependencies, loads the source documents, creates the agent graph,
+    and runs the graph to produce the analysis results.
+    In server mode, the setup is done once and the graph then serves queries over HTTP.
+    """
+    args = parse_args()
+
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    from agents.instrumentation import Tracer
+
+    # Imported as the agents import it: the priority of the requests is a context variable of this module, which
+    # would not be the one read by the models' transports if it was imported again as `agents.openai_scheduler`
+    from src.agents.openai_scheduler import OpenAIScheduler
+
+    tracer = Tracer()
+    # Every OpenAI model and embeddings request of the process goes through this scheduler
+    scheduler = OpenAIScheduler(
+        requests_per_minute=args.openai_rpm,
+        tokens_per_minute=args.openai_tpm,
+        max_concurrency=args.openai_max_concurrency,
+    )
+
+    if args.serve:
+        from agents.server import AgentServer
+
+        server = AgentServer(
+            lambda: setup(args, tracer, scheduler)[0],
+            max_concurrency=args.concurrency,
+            tracer=tracer,
+            coalesce=not args.no_coalesce,
+        )
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+        return
+
+    graph, vector_store, llm_caches = setup(args, tracer, scheduler)
+    if args.render_graph:
+        from agents.agent_graph import render_graph
+
+        render_graph(graph, args.render_graph)
+
+    if args.batch_file:
+        from agents.batch_runner import read_queries, run_batch
+        from src.agents.openai_scheduler import Priority, request_priority
+
+        with request_priority(Priority.BATCH):
+            asyncio.run(
+                run_batch(
+                    graph,
+                    read_queries(args.batch_file),
+                    concurrency=args.concurrency,
+                    output_path=args.batch_output,
+                    tracer=tracer,
+                    coalesce=not args.no_coalesce,
+                )
+            )
+        logger.info(f"OpenAI scheduler stats: {scheduler.stats()}")
+        report_trace(tracer, args.trace_output)
+        return
 
     print(f"\n\nQuery: {args.query}")
-    print(f"\n\nAnswer: {state['earnings_call_agent']['earnings_call_report']}")
+    if args.sync:
+        from agents.agent_graph import prepare_run, run_graph
+
+        state = run_graph(graph, *prepare_run(graph, args.query))
+        print(f"\n\nAnswer: {state['earnings_call_agent']['earnings_call_report']}")
+    else:
+        # The report is printed as it is generated
+        print("\n\nAnswer: ", end="", flush=True)
+        asyncio.run(stream_answer(graph, args.query))
+
+    logger.info("Analysis complete!")
+    if vector_store.embedding_cache_stats():
+        logger.info(f"Embedding cache stats: {vector_store.embedding_cache_stats()}")
+    logger.info(f"OpenAI scheduler stats: {scheduler.stats()}")
+    for agent, llm_cache in llm_caches.items():
+        logger.info(f"LLM response cache stats of {agent}: {llm_cache.stats()}")
+    report_trace(tracer, args.trace_output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+import unittest
+from typing import TypedDict
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, StateGraph
+
+from src.agents.instrumentation import Tracer, TracingCallbackHandler
+from src.agents.model_routing import DeadlineChatModel, HedgedChatModel
+
+
+class _State(TypedDict):
+    output: str
+
+
+def _fake_model() -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([AIMessage("alpha beta gamma")] * 4))
+
+
+class WrappedModelCallbacksTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The wrapping models report each call once, to the callbacks of the graph run.
+    """
+
+    async def _run(self, model) -> tuple[list[str], int]:
+        async def node(state: _State) -> dict:
+            return {"output": (await model.ainvoke("hi")).content}
+
+        builder = StateGraph(_State)
+        builder.add_node("node", node)
+        builder.add_edge(START, "node")
+        builder.add_edge("node", END)
+        tracer = Tracer()
+        tokens = [
+            message.content
+            async for message, _ in builder.compile().astream(
+                {"output": ""}, {"callbacks": [TracingCallbackHandler(tracer)]}, stream_mode="messages"
+            )
+        ]
+        return tokens, sum(span.kind == "llm" for span in tracer.spans)
+
+    async def test_deadline_model(self):
+        tokens, llm_spans = await self._run(DeadlineChatModel(model=_fake_model(), timeout=5))
+        self.assertEqual(tokens, ["alpha", " ", "beta", " ", "gamma"])
+        self.assertEqual(llm_spans, 1)
+
+    async def test_hedged_model(self):
+        tokens, llm_spans = await self._run(HedgedChatModel(primary=_fake_model(), hedge=_fake_model()))
+        self.assertEqual(tokens, ["alpha beta gamma"])
+        self.assertEqual(llm_spans, 1)
+
+    async def test_deadline_of_hedged_model(self):
+        model = DeadlineChatModel(model=HedgedChatModel(primary=_fake_model(), hedge=_fake_model()), timeout=5)
+        tokens, llm_spans = await self._run(model)
+        self.assertEqual(tokens, ["alpha beta gamma"])
+        self.assertEqual(llm_spans, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()